@@ -0,0 +1,218 @@
+"""
+Pre-aggregated metric sums: station -> region -> state -> national, by day and by month
+
+weather_cube holds, per level, unit and period, the sum and count of every metric's
+values in four buckets: those flagged W, those flagged S, those flagged I, and the
+rest. Sums and counts add up, so each level is rolled up from the one below, and an
+average leaving out any set of flags adds up the other buckets only. Levels and grains:
+
+    station   month
+    region    month
+    state     day, month
+    national  day, month
+
+A station's days are weather_data itself. Regions have no daily rows: nothing reads
+them, and there would be nearly as many as in weather_data.
+
+The table is built by `schema_migrations.py migrate` and rebuilt by `maintain`.
+Triggers mark it stale when weather_data rows are inserted, deleted or changed, and a
+stale cube is ignored (has_cube() is False) until `maintain` rebuilds it. A date range is read
+as its whole months from the monthly rows plus the days at either end from the daily
+rows, so a state average over decades reads a few hundred rows.
+"""
+from datetime import date, timedelta
+
+import quality_flags
+
+CUBE_TABLE = "weather_cube"
+# One row: whether weather_data has changed since the cube was built
+BUILD_TABLE = "weather_cube_build"
+
+# Flags whose values are kept in buckets of their own so they can be left out
+SPLIT_FLAGS = quality_flags.EXCLUDABLE_FLAGS
+
+
+def _columns(metric):
+    # {metric}_sum and _n are the bucket of values not flagged W, S or I
+    columns = [f"{metric}_sum", f"{metric}_n"]
+    for flag in SPLIT_FLAGS:
+        columns += [f"{metric}_{flag.lower()}_sum", f"{metric}_{flag.lower()}_n"]
+    return columns
+
+
+def _measure_columns():
+    return [column for metric in quality_flags.METRICS for column in _columns(metric)]
+
+
+def _base_measures_sql(table):
+    """Sum and count expressions over weather_data rows, in _measure_columns() order"""
+    flags = ", ".join(f"'{flag}'" for flag in SPLIT_FLAGS)
+    expressions = []
+    for metric in quality_flags.METRICS:
+        value = f"{table}.{metric}"
+        has_value = quality_flags.has_value_sql(metric, table)
+        kept = f"CASE WHEN {has_value} AND COALESCE({table}.{metric}Qual, '') NOT IN ({flags}) THEN {value} END"
+        expressions += [f"TOTAL({kept})", f"COUNT({kept})"]
+        for flag in SPLIT_FLAGS:
+            flagged = f"CASE WHEN {has_value} AND {table}.{metric}Qual = '{flag}' THEN {value} END"
+            expressions += [f"TOTAL({flagged})", f"COUNT({flagged})"]
+    return ", ".join(expressions)
+
+
+def _rollup_sql():
+    return ", ".join(f"SUM({column})" for column in _measure_columns())
+
+
+def build_cube(conn):
+    """(Re)create and fill weather_cube, each level rolled up from the one below"""
+    measures = _measure_columns()
+    conn.execute(f"DROP TABLE IF EXISTS {CUBE_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {CUBE_TABLE} (
+            grain TEXT,
+            level TEXT,
+            state TEXT,
+            region TEXT,
+            location INTEGER,
+            period TEXT,
+            {", ".join(f"{column} REAL" for column in measures)}
+        )
+    """)
+    insert = f"INSERT INTO {CUBE_TABLE} (grain, level, state, region, location, period, {', '.join(measures)})"
+
+    # Months: stations from weather_data, then each level from the one below
+    conn.execute(f"""
+        {insert}
+        SELECT 'month', 'station', ws.state, ws.region, wd.location, substr(wd.DMY, 1, 7), {_base_measures_sql("wd")}
+        FROM weather_data wd
+        JOIN weather_station ws ON wd.location = ws.site_id
+        WHERE wd.DMY IS NOT NULL AND wd.DMY != ''
+        GROUP BY wd.location, substr(wd.DMY, 1, 7)
+    """)
+    # (level, level below, its state and region columns, grouping)
+    for level, below, keys, group in (("region", "station", "state, region", "state, region, "),
+                                      ("state", "region", "state, NULL", "state, "),
+                                      ("national", "state", "NULL, NULL", "")):
+        conn.execute(f"""
+            {insert}
+            SELECT 'month', '{level}', {keys}, NULL, period, {_rollup_sql()}
+            FROM {CUBE_TABLE} WHERE grain = 'month' AND level = '{below}'
+            GROUP BY {group}period
+        """)
+
+    # Days: states from weather_data, the nation from the states
+    conn.execute(f"""
+        {insert}
+        SELECT 'day', 'state', ws.state, NULL, NULL, wd.DMY, {_base_measures_sql("wd")}
+        FROM weather_data wd
+        JOIN weather_station ws ON wd.location = ws.site_id
+        WHERE wd.DMY IS NOT NULL AND wd.DMY != ''
+        GROUP BY ws.state, wd.DMY
+    """)
+    conn.execute(f"""
+        {insert}
+        SELECT 'day', 'national', NULL, NULL, NULL, period, {_rollup_sql()}
+        FROM {CUBE_TABLE} WHERE grain = 'day' AND level = 'state'
+        GROUP BY period
+    """)
+    # Date ranges across every unit of a level, and one unit's date range
+    conn.execute(f"CREATE INDEX idx_{CUBE_TABLE}_period ON {CUBE_TABLE} (level, grain, period)")
+    conn.execute(f"CREATE INDEX idx_{CUBE_TABLE}_unit ON {CUBE_TABLE} (level, grain, state, period)")
+
+    conn.execute(f"DROP TABLE IF EXISTS {BUILD_TABLE}")
+    conn.execute(f"CREATE TABLE {BUILD_TABLE} (stale INTEGER)")
+    conn.execute(f"INSERT INTO {BUILD_TABLE} VALUES (0)")
+    _create_stale_triggers(conn)
+
+
+def _create_stale_triggers(conn):
+    """Triggers flagging the cube stale on any change to the weather_data columns it sums"""
+    # Only the first change writes; later ones find stale already set
+    mark = f"UPDATE {BUILD_TABLE} SET stale = 1 WHERE stale = 0;"
+    raw_columns = ", ".join(["location", "DMY"] + [f"{metric}, {metric}Qual" for metric in quality_flags.METRICS])
+    for name, event in (("insert", "INSERT"), ("delete", "DELETE"), ("update", f"UPDATE OF {raw_columns}")):
+        conn.execute(f"DROP TRIGGER IF EXISTS weather_data_cube_{name}")
+        conn.execute(f"CREATE TRIGGER weather_data_cube_{name} AFTER {event} ON weather_data BEGIN {mark} END")
+
+
+def has_cube(conn):
+    """True when the database has weather_cube and weather_data hasn't changed since it was built"""
+    tables = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN (?, ?)", (CUBE_TABLE, BUILD_TABLE))}
+    if tables != {CUBE_TABLE, BUILD_TABLE}:
+        return False
+    row = conn.execute(f"SELECT stale FROM {BUILD_TABLE}").fetchone()
+    return row is not None and not row[0]
+
+
+def measure_sql(metric, exclude=()):
+    """(sum, count) SQL over cube rows for a metric, adding up the buckets of the flags not excluded"""
+    metric = metric.lower()
+    totals, counts = [f"{metric}_sum"], [f"{metric}_n"]
+    for flag in SPLIT_FLAGS:
+        if flag not in exclude:
+            totals.append(f"{metric}_{flag.lower()}_sum")
+            counts.append(f"{metric}_{flag.lower()}_n")
+    return f"SUM({' + '.join(totals)})", f"SUM({' + '.join(counts)})"
+
+
+def split_range(start_date, end_date):
+    """
+    A date range (inclusive ISO dates) as (first month, last month) of the whole months
+    in it, or None, and the [(start, end)] day ranges left over at either end
+    """
+    start = date.fromisoformat(start_date)
+    end = date.fromisoformat(end_date)
+    first_month = start if start.day == 1 else (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    after_end = end + timedelta(days=1)
+    end_month = after_end.replace(day=1)  # the first day after the last whole month
+    if first_month >= end_month:
+        return None, [(start_date, end_date)]
+    last_month = end_month - timedelta(days=1)
+    edges = []
+    if start < first_month:
+        edges.append((start_date, (first_month - timedelta(days=1)).isoformat()))
+    if end_month < after_end:
+        edges.append((end_month.isoformat(), end_date))
+    return (first_month.isoformat()[:7], last_month.isoformat()[:7]), edges
+
+
+def range_filter_sql(level, start_date, end_date):
+    """
+    WHERE clause (and its parameters) selecting a level's cube rows that exactly cover
+    the range; each alternative is a seek on the (level, grain, period) index
+    """
+    months, edges = split_range(start_date, end_date)
+    parts = ([("month", months)] if months else []) + [("day", edge) for edge in edges]
+    clauses, params = [], []
+    for grain, (first, last) in parts:
+        clauses.append("(level = ? AND grain = ? AND period BETWEEN ? AND ?)")
+        params.extend([level, grain, first, last])
+    return "(" + " OR ".join(clauses) + ")", params
+
+
+def get_state_averages(conn, metric, start_date, end_date, exclude=()):
+    """[(state, average)] of a metric over a date range, for states with any value in it"""
+    total, count = measure_sql(metric, exclude)
+    where, params = range_filter_sql("state", start_date, end_date)
+    return conn.execute(f"""
+        SELECT state, {total} / {count}
+        FROM {CUBE_TABLE}
+        WHERE {where}
+        GROUP BY state
+        HAVING {count} > 0
+    """, params).fetchall()
+
+
+def get_state_daily_averages(conn, state, metric, start_date, end_date, exclude=()):
+    """[(day, average over the state's stations)] of a metric, for days with any value"""
+    total, count = measure_sql(metric, exclude)
+    return conn.execute(f"""
+        SELECT period, {total} / {count}
+        FROM {CUBE_TABLE}
+        WHERE level = 'state' AND grain = 'day' AND state = ?
+          AND period BETWEEN ? AND ?
+        GROUP BY period
+        HAVING {count} > 0
+        ORDER BY period
+    """, (state, start_date, end_date)).fetchall()
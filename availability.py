@@ -0,0 +1,199 @@
+"""
+Data-availability bitmaps: which days each station reported each metric
+
+weather_availability holds bitsets per (station, metric, flag): bit i is set when the
+station has a value for the metric on first_day + i days, flagged `flag` (W, S or I)
+or, for flag '', anything else. Leaving out a request's excluded flags is leaving out
+their bitsets. It is built by `schema_migrations.py migrate` and rebuilt by
+`maintain`. Bitsets are loaded per metric on first use and kept in memory as Python
+ints, so the share of a date range a station covered is a shift, a mask and
+int.bit_count().
+
+Similarity analyses use it to drop stations below a minimum coverage before any
+station is scored.
+"""
+import threading
+from collections import defaultdict
+from datetime import date
+
+import db_utils
+import quality_flags
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+AVAILABILITY_TABLE = "weather_availability"
+
+
+def build_availability_table(conn):
+    """(Re)create and fill weather_availability in one ordered pass over weather_data"""
+    metrics = quality_flags.METRICS
+    conn.execute(f"DROP TABLE IF EXISTS {AVAILABILITY_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {AVAILABILITY_TABLE} (
+            metric TEXT,
+            location INTEGER,
+            flag TEXT,
+            first_day TEXT,
+            days INTEGER,
+            bits BLOB,
+            PRIMARY KEY (metric, location, flag)
+        ) WITHOUT ROWID
+    """)
+
+    # Per metric: NULL without a value, else the flag's bitset
+    flags = ", ".join(f"'{flag}'" for flag in quality_flags.EXCLUDABLE_FLAGS)
+    buckets = ", ".join(
+        f"CASE WHEN NOT ({quality_flags.has_value_sql(metric)}) THEN NULL "
+        f"WHEN {metric}Qual IN ({flags}) THEN {metric}Qual ELSE '' END"
+        for metric in metrics
+    )
+    rows = conn.execute(f"""
+        SELECT location, DMY, {buckets}
+        FROM weather_data
+        WHERE DMY IS NOT NULL AND DMY != ''
+        ORDER BY location, DMY
+    """)
+
+    def flush(location, first, offsets):
+        span = max((max(days) for by_flag in offsets for days in by_flag.values()), default=-1) + 1
+        for metric, by_flag in zip(metrics, offsets):
+            for flag, days in by_flag.items():
+                bitmap = bytearray((span + 7) // 8)
+                for day in days:
+                    bitmap[day >> 3] |= 1 << (day & 7)
+                conn.execute(f"INSERT INTO {AVAILABILITY_TABLE} VALUES (?, ?, ?, ?, ?, ?)",
+                             (metric, location, flag, date.fromordinal(first).isoformat(), span, bytes(bitmap)))
+
+    location = first = offsets = None
+    unparsed = 0
+    for row in rows:
+        try:
+            ordinal = date.fromisoformat(row[1]).toordinal()
+        except ValueError:
+            unparsed += 1
+            continue
+        if row[0] != location:
+            if location is not None:
+                flush(location, first, offsets)
+            location = row[0]
+            first = ordinal
+            offsets = [defaultdict(list) for _ in metrics]
+        for by_flag, flag in zip(offsets, row[2:]):
+            if flag is not None:
+                by_flag[flag].append(ordinal - first)
+    if location is not None:
+        flush(location, first, offsets)
+    if unparsed:
+        logger.warning("Left %d weather_data rows with a non-ISO DMY out of %s", unparsed, AVAILABILITY_TABLE)
+
+
+class AvailabilityIndex:
+    """The bitsets of one database, loaded a metric at a time"""
+    def __init__(self, database=None):
+        self.database = database
+        self.generation = db_utils.database_generation(database)
+        self._metrics = {}  # metric -> {location: (first day ordinal, {flag: bits as int})}
+        self._lock = threading.Lock()
+        conn = db_utils.connect(database)
+        try:
+            # A table from before the per-flag bitsets is ignored until maintain rebuilds it
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({AVAILABILITY_TABLE})")}
+            self.available = "flag" in columns
+        finally:
+            conn.close()
+
+    def bitmaps(self, metric):
+        with self._lock:
+            if metric not in self._metrics:
+                conn = db_utils.connect(self.database)
+                try:
+                    rows = conn.execute(f"""
+                        SELECT location, flag, first_day, bits FROM {AVAILABILITY_TABLE} WHERE metric = ?
+                    """, (metric,)).fetchall()
+                finally:
+                    conn.close()
+                bitmaps = {}
+                for location, flag, first_day, bits in rows:
+                    first, by_flag = bitmaps.setdefault(location, (date.fromisoformat(first_day).toordinal(), {}))
+                    by_flag[flag] = int.from_bytes(bits, "little")
+                self._metrics[metric] = bitmaps
+            return self._metrics[metric]
+
+    def valid_days(self, location, metric, start_date, end_date, exclude=()):
+        """Days from start_date to end_date (inclusive, ISO strings) with a value whose flag isn't excluded"""
+        bitmap = self.bitmaps(metric).get(location)
+        if bitmap is None:
+            return 0
+        first, by_flag = bitmap
+        bits = 0
+        for flag, flag_bits in by_flag.items():
+            if flag not in exclude:
+                bits |= flag_bits
+        start = max(date.fromisoformat(start_date).toordinal() - first, 0)
+        end = date.fromisoformat(end_date).toordinal() - first
+        if end < start:
+            return 0
+        return ((bits >> start) & ((1 << (end - start + 1)) - 1)).bit_count()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    """The AvailabilityIndex of the current database, rebuilt when the file changes"""
+    global _index
+    with _index_lock:
+        if _index is None or _index.generation != db_utils.database_generation():
+            _index = AvailabilityIndex()
+        return _index
+
+
+def period_days(start_date, end_date):
+    return date.fromisoformat(end_date).toordinal() - date.fromisoformat(start_date).toordinal() + 1
+
+
+def stations_with_coverage(station_ids, metrics, periods, min_coverage, quality=None):
+    """
+    The station_ids with at least min_coverage (a fraction) of days present for every
+    metric in every (start, end) period, not counting values whose flags the
+    QualityFilter `quality` excludes
+    Answered from the bitmaps; a database without them is asked for the counts directly
+    """
+    metrics = [metric.lower() for metric in metrics]
+    quality = quality or quality_flags.QualityFilter()
+    index = get_index()
+    if not index.available:
+        return stations_with_coverage_sql(station_ids, metrics, periods, min_coverage, quality)
+    keep = []
+    for station_id in station_ids:
+        if all(index.valid_days(station_id, metric, start, end, quality.exclude) >= min_coverage * period_days(start, end)
+               for start, end in periods for metric in metrics):
+            keep.append(station_id)
+    return keep
+
+
+def stations_with_coverage_sql(station_ids, metrics, periods, min_coverage, quality):
+    """stations_with_coverage() from weather_data, one grouped query per period"""
+    wanted = set(station_ids)
+    counts = ", ".join(
+        f"COUNT(CASE WHEN {quality_flags.has_value_sql(metric)} AND {quality.value_test(metric)} THEN 1 END)"
+        for metric in metrics
+    )
+    conn = db_utils.connect()
+    try:
+        for start, end in periods:
+            needed = min_coverage * period_days(start, end)
+            covered = set()
+            for location, *valid in conn.execute(f"""
+                SELECT location, {counts}
+                FROM weather_data
+                WHERE DMY BETWEEN ? AND ?
+                GROUP BY location
+            """, (start, end)):
+                if all(count >= needed for count in valid):
+                    covered.add(location)
+            wanted &= covered
+    finally:
+        conn.close()
+    return [station_id for station_id in station_ids if station_id in wanted]
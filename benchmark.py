@@ -0,0 +1,385 @@
+"""
+Benchmark suite for the climate webapp
+
+Generate a deterministic synthetic dataset, time each utils entry point and page
+route against it, and compare JSON results between runs:
+
+    python benchmark.py generate --db bench.db --stations 100 --years 50
+    python benchmark.py run --db bench.db --output before.json
+    python benchmark.py compare before.json after.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+import config
+
+METRICS = [
+    "precipitation", "evaporation", "maxtemp", "mintemp", "sunshine",
+    "humid00", "humid03", "humid06", "humid09", "humid12", "humid15", "humid18", "humid21",
+    "okta00", "okta03", "okta06", "okta09", "okta12", "okta15", "okta18", "okta21",
+    "raindaysnum"
+]
+
+# Rough share of each quality flag in BoM daily observations
+QUALITY_FLAGS = ["Y"] * 80 + ["N"] * 14 + ["S"] * 3 + ["W"] * 2 + ["I"]
+
+STATES = [
+    # state, latitude range, longitude range, regions
+    ("W.A.", (-35.0, -14.0), (114.0, 128.0), ["Kimberley", "Pilbara", "Goldfields", "South West"]),
+    ("N.T.", (-26.0, -11.0), (129.0, 138.0), ["Top End", "Central Australia"]),
+    ("QLD", (-29.0, -10.0), (138.0, 153.5), ["Far North", "Central West", "South East"]),
+    ("N.S.W.", (-37.5, -28.2), (141.0, 153.6), ["Riverina", "Hunter", "Central Tablelands"]),
+    ("VIC", (-39.0, -34.0), (141.0, 149.9), ["Mallee", "Gippsland", "Port Phillip"]),
+    ("S.A.", (-38.0, -26.0), (129.0, 141.0), ["Eyre Peninsula", "Riverland", "Mount Lofty"]),
+    ("TAS", (-43.6, -40.6), (144.6, 148.4), ["North West", "Midlands", "South East"]),
+]
+
+START_YEAR = 1970
+
+
+def create_schema(conn):
+    """Create the weather_station and weather_data tables used by the webapp"""
+    metric_columns = ",\n            ".join(f"{m} REAL, {m}Qual TEXT" for m in METRICS)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS weather_station (
+            site_id INTEGER PRIMARY KEY,
+            name TEXT,
+            latitude REAL,
+            longitude REAL,
+            state TEXT,
+            region TEXT
+        )
+    """)
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS weather_data (
+            location INTEGER,
+            DMY TEXT,
+            {metric_columns}
+        )
+    """)
+
+
+def generate_metric_value(rng, metric, day_of_year, lat, trend):
+    """A plausible reading for one metric on one day"""
+    season = math.cos(2 * math.pi * (day_of_year - 15) / 365.25)
+    warmth = (45 + lat) / 35  # 0 in the far south, ~1 in the tropics
+    if metric == "maxtemp":
+        return round(22 + 8 * warmth + 6 * season + trend + rng.gauss(0, 3), 1)
+    if metric == "mintemp":
+        return round(10 + 10 * warmth + 5 * season + trend + rng.gauss(0, 2.5), 1)
+    if metric == "precipitation":
+        return round(rng.expovariate(0.25), 1) if rng.random() < 0.3 else 0.0
+    if metric == "evaporation":
+        return round(max(0.0, 4 + 3 * season + 2 * warmth + rng.gauss(0, 1.5)), 1)
+    if metric == "sunshine":
+        return round(min(14.0, max(0.0, 8 + 2 * season + rng.gauss(0, 2.5))), 1)
+    if metric.startswith("humid"):
+        return float(min(100, max(5, int(60 - 10 * season + rng.gauss(0, 15)))))
+    if metric.startswith("okta"):
+        return float(rng.randint(0, 8))
+    return float(rng.randint(0, 1))
+
+
+def generate_dataset(database, num_stations=100, years=50, seed=42, missing_rate=0.08):
+    """
+    Write a deterministic synthetic BoM-scale dataset to database
+    The same arguments always produce the same rows
+    """
+    if os.path.exists(database):
+        os.remove(database)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    create_schema(conn)
+
+    stations = []
+    for i in range(num_stations):
+        state, (lat_lo, lat_hi), (lon_lo, lon_hi), regions = STATES[i % len(STATES)]
+        site_id = 1000 + i * 7
+        stations.append((
+            site_id,
+            f"Synthetic Station {i:04d}",
+            round(rng.uniform(lat_lo, lat_hi), 4),
+            round(rng.uniform(lon_lo, lon_hi), 4),
+            state,
+            rng.choice(regions)
+        ))
+    conn.executemany("INSERT INTO weather_station VALUES (?, ?, ?, ?, ?, ?)", stations)
+
+    placeholders = ", ".join(["?"] * (2 + 2 * len(METRICS)))
+    insert_sql = f"INSERT INTO weather_data VALUES ({placeholders})"
+    first_day = date(START_YEAR, 1, 1)
+    num_days = (date(START_YEAR + years, 1, 1) - first_day).days
+    days = [(first_day + timedelta(days=d)) for d in range(num_days)]
+
+    for site_id, _, lat, _, _, _ in stations:
+        # Each station opens at a different time, so coverage varies between stations
+        opened = rng.randint(0, num_days // 4)
+        warming = rng.uniform(0.01, 0.04)
+        rows = []
+        for d in range(opened, num_days):
+            day = days[d]
+            trend = warming * d / 365.25
+            row = [site_id, day.isoformat()]
+            day_of_year = day.timetuple().tm_yday
+            for metric in METRICS:
+                if rng.random() < missing_rate:
+                    row.extend((None, None))
+                else:
+                    row.append(generate_metric_value(rng, metric, day_of_year, lat, trend))
+                    row.append(rng.choice(QUALITY_FLAGS))
+            rows.append(row)
+        conn.executemany(insert_sql, rows)
+        conn.commit()
+
+    conn.close()
+    return {"stations": num_stations, "years": years, "seed": seed, "days": num_days}
+
+
+def get_dataset_profile(database):
+    """Pick representative parameters (stations, states, dates) from the dataset"""
+    conn = sqlite3.connect(database)
+    cur = conn.cursor()
+    cur.execute("SELECT site_id, state FROM weather_station ORDER BY site_id")
+    stations = cur.fetchall()
+    cur.execute("SELECT MIN(DMY), MAX(DMY), COUNT(*) FROM weather_data")
+    first_date, last_date, rows = cur.fetchone()
+    cur.execute("SELECT MIN(latitude), MAX(latitude) FROM weather_station WHERE state = ?",
+                (stations[0][1],))
+    min_lat, max_lat = cur.fetchone()
+    conn.close()
+
+    first_year = int(first_date[:4])
+    last_year = int(last_date[:4])
+    middle_year = (first_year + last_year) // 2
+    return {
+        "stations": len(stations),
+        "rows": rows,
+        "reference_station": stations[len(stations) // 2][0],
+        "first_station": stations[0][0],
+        "last_station": stations[-1][0],
+        "state": stations[0][1],
+        "min_lat": min_lat,
+        "max_lat": max_lat,
+        "first_year": first_year,
+        "last_year": last_year,
+        "middle_year": middle_year,
+    }
+
+
+def build_forms(profile):
+    """Representative form submissions for each analysis, keyed by form name"""
+    mid = profile["middle_year"]
+    last = min(profile["last_year"], 2020)
+    range_form = {
+        "start_date": f"{mid}-01-01",
+        "end_date": f"{last}-12-31",
+        "climate_type": "maxtemp",
+        "start_station": str(profile["first_station"]),
+        "end_station": str(profile["last_station"]),
+    }
+    focused_form = {
+        "start_date": f"{mid}-01-01",
+        "end_date": f"{last}-12-31",
+        "climate_type": "maxtemp",
+        "selected_state": profile["state"],
+    }
+    metrics_form = {
+        "start_date": f"{mid}-01-01",
+        "end_date": f"{last}-12-31",
+        "reference_metric": "maxtemp",
+        "other_metrics": ["mintemp", "precipitation"],
+    }
+    similarity_form = {
+        "reference_station": str(profile["reference_station"]),
+        "primary_metric": "maxtemp",
+        "secondary_metric": "precipitation",
+        "period1_start": f"{mid - 10}-01-01",
+        "period1_end": f"{mid - 1}-12-31",
+        "period2_start": f"{mid}-01-01",
+        "period2_end": f"{mid + 9}-12-31",
+        "num_stations": "10",
+    }
+    station_form = {
+        "state": profile["state"],
+        "start_latitude": str(profile["min_lat"]),
+        "end_latitude": str(profile["max_lat"]),
+        "metric": "maxtemp",
+    }
+    return {
+        "range": range_form,
+        "focused": focused_form,
+        "metrics": metrics_form,
+        "similarity": similarity_form,
+        "station": station_form,
+        "deep_dive": dict(metrics_form, **{"reference_metric": "maxTemp", "other_metrics[]": ["minTemp"]}),
+        "deep_dive_station": dict(similarity_form, num_similar="5"),
+    }
+
+
+def build_cases(profile):
+    """(name, callable) pairs for every utils entry point and page route"""
+    import filtered_climate_utils
+    import level2_focused_utils
+    import similar_climate_utils
+    import level3_similarity_utils
+    import landing_page
+    import mission_statement
+    import focused_view_page_via_climate_metric
+    import focused_view_page_via_weather_stations
+    import deep_dive_page
+    import deep_dive_page_weather_station
+    import similarity_chanage_in_metric_percentages_page
+
+    forms = build_forms(profile)
+    range_form = forms["range"]
+    focused_form = forms["focused"]
+    metrics_form = forms["metrics"]
+    similarity_form = forms["similarity"]
+    station_form = forms["station"]
+    deep_dive_form = forms["deep_dive"]
+    deep_dive_station_form = forms["deep_dive_station"]
+
+    return [
+        ("utils.get_filtered_climate_data",
+         lambda: filtered_climate_utils.get_filtered_climate_data(range_form)),
+        ("utils.get_focused_climate_data",
+         lambda: level2_focused_utils.get_focused_climate_data(focused_form)),
+        ("utils.get_similar_climate_metrics",
+         lambda: similar_climate_utils.get_similar_climate_metrics(metrics_form)),
+        ("utils.get_station_similarity_data",
+         lambda: level3_similarity_utils.get_station_similarity_data(similarity_form)),
+        ("page./", lambda: landing_page.get_page_html({})),
+        ("page./m-statement", lambda: mission_statement.get_page_html({})),
+        ("page./focused-metric",
+         lambda: focused_view_page_via_climate_metric.get_page_html(range_form)),
+        ("page./focused",
+         lambda: focused_view_page_via_weather_stations.get_page_html(station_form)),
+        ("page./deep-dive", lambda: deep_dive_page.get_page_html(deep_dive_form)),
+        ("page./deep-dive-weather-station",
+         lambda: deep_dive_page_weather_station.get_page_html(deep_dive_station_form)),
+        ("page./similarity",
+         lambda: similarity_chanage_in_metric_percentages_page.get_page_html(
+             dict(similarity_form, action="find_similar"))),
+    ]
+
+
+def time_case(func, repeat):
+    """Run func repeat times and summarise the wall-clock timings"""
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+        if isinstance(result, (str, bytes)):
+            size = len(result)
+    return {
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "max": max(timings),
+        "repeat": repeat,
+        "output_bytes": size,
+    }
+
+
+def run_benchmarks(database, repeat=3, only=None):
+    """Time every case against database and return a JSON-serialisable result"""
+    config.DATABASE_PATH = database
+    profile = get_dataset_profile(database)
+    results = {}
+    for name, func in build_cases(profile):
+        if only and not any(pattern in name for pattern in only):
+            continue
+        try:
+            results[name] = time_case(func, repeat)
+        except Exception as e:
+            results[name] = {"error": str(e)}
+        print(f"{name:45s} {format_result(results[name])}", file=sys.stderr)
+    return {
+        "meta": {
+            "database": os.path.abspath(database),
+            "dataset": profile,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+def format_result(result):
+    if "error" in result:
+        return f"ERROR {result['error']}"
+    return f"median {result['median'] * 1000:9.1f} ms   min {result['min'] * 1000:9.1f} ms"
+
+
+def compare_results(before, after):
+    """Rows of (name, before median, after median, speedup) for cases in both runs"""
+    rows = []
+    for name, new in after["results"].items():
+        old = before["results"].get(name)
+        if not old or "error" in old or "error" in new:
+            continue
+        speedup = old["median"] / new["median"] if new["median"] else float("inf")
+        rows.append((name, old["median"], new["median"], speedup))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic dataset")
+    generate.add_argument("--db", default="bench.db")
+    generate.add_argument("--stations", type=int, default=100)
+    generate.add_argument("--years", type=int, default=50)
+    generate.add_argument("--seed", type=int, default=42)
+
+    run = commands.add_parser("run", help="time every utils entry point and page route")
+    run.add_argument("--db", default=config.DATABASE_PATH)
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--only", action="append", help="only run cases whose name contains this")
+    run.add_argument("--output", help="write JSON results to this file (default: stdout)")
+
+    compare = commands.add_parser("compare", help="compare two JSON result files")
+    compare.add_argument("before")
+    compare.add_argument("after")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        start = time.perf_counter()
+        info = generate_dataset(args.db, args.stations, args.years, args.seed)
+        print(f"Generated {info} in {time.perf_counter() - start:.1f}s -> {args.db}")
+    elif args.command == "run":
+        results = run_benchmarks(args.db, args.repeat, args.only)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text)
+        else:
+            print(text)
+    else:
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        print(f"{'case':45s} {'before':>10s} {'after':>10s} {'speedup':>8s}")
+        for name, old, new, speedup in compare_results(before, after):
+            print(f"{name:45s} {old * 1000:8.1f}ms {new * 1000:8.1f}ms {speedup:7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
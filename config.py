@@ -0,0 +1,94 @@
+"""
+Runtime configuration for the climate webapp
+
+Settings come from, in increasing order of precedence:
+- the defaults below
+- an INI file named by CLIMATE_CONFIG (keys in a [climate] section)
+- environment variables CLIMATE_<KEY>, e.g. CLIMATE_PORT=8080 CLIMATE_DATABASE=bench.db
+"""
+import configparser
+import os
+
+CONFIG_FILE_ENV = "CLIMATE_CONFIG"
+CONFIG_SECTION = "climate"
+ENV_PREFIX = "CLIMATE_"
+
+DEFAULTS = {
+    # Server
+    "host": "",
+    "port": "80",
+    "workers": "1",
+    # Processes used to score stations in similarity analyses (0 = one per CPU, 1 = inline)
+    "similarity_processes": "0",
+    # Background jobs (/jobs/*): worker threads, max jobs held, seconds finished jobs are kept
+    "job_workers": "2",
+    "job_max": "100",
+    "job_ttl": "3600",
+    # Rows per page of the focused-station climate data endpoint (default, and the most a client may ask for)
+    "climate_page_size": "100",
+    "climate_page_size_max": "1000",
+    # Quality flags left out of aggregations unless a request says otherwise (comma-separated W, S, I;
+    # empty keeps every reading, so results only change when a deployment or request opts in)
+    "quality_exclude": "",
+    # Database
+    "database": "climate.db",
+    "sqlite_cache_kb": "65536",
+    "sqlite_mmap_mb": "256",
+    # Page size applied by `schema_migrations.py maintain` (larger pages suit long range scans)
+    "sqlite_page_size": "16384",
+    # Logging and request recording
+    "log_level": "WARNING",
+    "log_sample": "1.0",
+    "request_log": "",
+}
+
+def load_settings(path=None, environ=None):
+    """Merge defaults, the optional config file and environment variables into a dict of strings"""
+    environ = os.environ if environ is None else environ
+    settings = dict(DEFAULTS)
+
+    path = path or environ.get(CONFIG_FILE_ENV)
+    if path:
+        parser = configparser.ConfigParser()
+        if not parser.read(path):
+            raise FileNotFoundError(f"Config file not found: {path}")
+        if parser.has_section(CONFIG_SECTION):
+            for key, value in parser.items(CONFIG_SECTION):
+                settings[key] = value
+
+    for key in DEFAULTS:
+        env_value = environ.get(ENV_PREFIX + key.upper())
+        if env_value is not None:
+            settings[key] = env_value
+
+    return settings
+
+def apply(settings):
+    """Set the module-level settings read by the rest of the app"""
+    global HOST, PORT, WORKERS, SIMILARITY_PROCESSES, DATABASE_PATH, SQLITE_CACHE_KB, SQLITE_MMAP_MB
+    global SQLITE_PAGE_SIZE
+    global JOB_WORKERS, JOB_MAX, JOB_TTL, LOG_LEVEL, LOG_SAMPLE, REQUEST_LOG
+    global CLIMATE_PAGE_SIZE, CLIMATE_PAGE_SIZE_MAX, QUALITY_EXCLUDE
+    HOST = settings["host"]
+    PORT = int(settings["port"])
+    WORKERS = max(1, int(settings["workers"]))
+    SIMILARITY_PROCESSES = int(settings["similarity_processes"]) or os.cpu_count() or 1
+    JOB_WORKERS = max(1, int(settings["job_workers"]))
+    JOB_MAX = int(settings["job_max"])
+    JOB_TTL = float(settings["job_ttl"])
+    CLIMATE_PAGE_SIZE = int(settings["climate_page_size"])
+    CLIMATE_PAGE_SIZE_MAX = int(settings["climate_page_size_max"])
+    QUALITY_EXCLUDE = settings["quality_exclude"]
+    DATABASE_PATH = settings["database"]
+    SQLITE_CACHE_KB = int(settings["sqlite_cache_kb"])
+    SQLITE_MMAP_MB = int(settings["sqlite_mmap_mb"])
+    SQLITE_PAGE_SIZE = int(settings["sqlite_page_size"])
+    LOG_LEVEL = settings["log_level"]
+    LOG_SAMPLE = float(settings["log_sample"])
+    REQUEST_LOG = settings["request_log"] or None
+
+def reload(path=None):
+    """Re-read the configuration (e.g. after changing the environment in a benchmark)"""
+    apply(load_settings(path))
+
+reload()
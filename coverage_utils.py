@@ -0,0 +1,101 @@
+"""
+Data coverage: how many days of each metric a station actually reported
+
+weather_coverage_monthly holds one row per station and month, with the number of
+days present (total_days) and, per metric, the number of days with a value. It is
+built by `schema_migrations.py migrate` and rebuilt by `maintain`, so the coverage
+heatmap reads a few thousand rows instead of every reading in the range.
+"""
+import db_utils
+import pyhtml
+import quality_flags
+import serializer
+
+COVERAGE_TABLE = "weather_coverage_monthly"
+
+# How rows of the heatmap are grouped: form value -> (label SQL, grouping SQL)
+HEATMAP_GROUPS = {
+    "state": ("ws.state", "ws.state"),
+    "region": ("ws.state || ' / ' || ws.region", "ws.state, ws.region"),
+    "station": ("ws.name", "ws.site_id"),
+}
+
+
+def coverage_select_sql():
+    """One pass over weather_data counting every metric's valid days per station and month"""
+    counts = ", ".join(f"{quality_flags.count_values_sql(metric)} AS {metric}" for metric in quality_flags.METRICS)
+    return f"""
+        SELECT location, substr(DMY, 1, 7) AS month, COUNT(*) AS total_days, {counts}
+        FROM weather_data
+        WHERE DMY IS NOT NULL AND DMY != ''
+        GROUP BY location, month
+    """
+
+
+def build_coverage_table(conn):
+    """(Re)create and fill weather_coverage_monthly"""
+    metric_columns = ", ".join(f"{metric} INTEGER" for metric in quality_flags.METRICS)
+    conn.execute(f"DROP TABLE IF EXISTS {COVERAGE_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {COVERAGE_TABLE} (
+            location INTEGER,
+            month TEXT,
+            total_days INTEGER,
+            {metric_columns},
+            PRIMARY KEY (month, location)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"INSERT INTO {COVERAGE_TABLE} {coverage_select_sql()}")
+
+
+def has_coverage_table(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (COVERAGE_TABLE,)).fetchone() is not None
+
+
+def get_coverage_heatmap(form_data):
+    """
+    JSON endpoint: coverage of one metric by month, for every state (or region or station)
+    Fields: metric, start and end (YYYY-MM or dates), group (state, region or station)
+    Coverage is valid days / days reported, as a percentage; null where nothing was reported
+    """
+    metric = pyhtml.form_value(form_data, "metric")
+    start = pyhtml.form_value(form_data, "start", "0000-00")[:7]
+    end = pyhtml.form_value(form_data, "end", "9999-99")[:7]
+    group = pyhtml.form_value(form_data, "group", "state")
+    if metric not in quality_flags.METRICS:
+        raise pyhtml.EndpointError(400, "A valid metric is required")
+    if group not in HEATMAP_GROUPS:
+        raise pyhtml.EndpointError(400, f"group must be one of {', '.join(HEATMAP_GROUPS)}")
+    label_sql, group_sql = HEATMAP_GROUPS[group]
+
+    conn = db_utils.connect()
+    try:
+        # Without the table (a database not migrated yet) the same counts come straight from weather_data
+        source = COVERAGE_TABLE if has_coverage_table(conn) else f"({coverage_select_sql()})"
+        rows = conn.execute(f"""
+            SELECT {label_sql} AS label, c.month, SUM(c.{metric}), SUM(c.total_days)
+            FROM {source} c
+            JOIN weather_station ws ON ws.site_id = c.location
+            WHERE c.month BETWEEN ? AND ?
+            GROUP BY {group_sql}, c.month
+            ORDER BY label, c.month
+        """, (start, end)).fetchall()
+    finally:
+        conn.close()
+
+    labels = sorted({label for label, month, valid, total in rows}, key=str)
+    months = sorted({month for label, month, valid, total in rows})
+    label_index = {label: i for i, label in enumerate(labels)}
+    month_index = {month: i for i, month in enumerate(months)}
+    coverage = [[None] * len(months) for _ in labels]
+    for label, month, valid, total in rows:
+        coverage[label_index[label]][month_index[month]] = round(valid / total * 100, 1) if total else None
+
+    return "application/json", serializer.dumps({
+        "metric": metric,
+        "group": group,
+        "rows": labels,
+        "months": months,
+        "coverage": coverage,
+    })
@@ -0,0 +1,51 @@
+import os
+import pathlib
+import sqlite3
+
+import config
+import instrumentation
+
+def database_uri(database, read_only=True):
+    """file: URI for a database path; mode=ro stops the web tier writing (or creating) the file"""
+    uri = pathlib.Path(database).absolute().as_uri()
+    return uri + "?mode=ro" if read_only else uri
+
+def connect(database=None, writable=False):
+    """
+    Open a connection to the climate database (config.DATABASE_PATH unless given)
+    All page and utils modules go through here so SQL is timed per request and every
+    connection gets the same tuning profile. Connections are read-only unless writable
+    is set (migrations and maintenance)
+    """
+    database = database or config.DATABASE_PATH
+    if database == ":memory:":
+        conn = sqlite3.connect(database, factory=instrumentation.InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(database_uri(database, read_only=not writable), uri=True,
+                               factory=instrumentation.InstrumentedConnection)
+    # Negative cache_size is in KiB rather than pages
+    conn.execute(f"PRAGMA cache_size = -{config.SQLITE_CACHE_KB}")
+    # Per-connection, unlike page_size and WAL which `schema_migrations.py maintain` stores in the file;
+    # large scans then read memory-mapped pages instead of issuing a read() per page
+    conn.execute(f"PRAGMA mmap_size = {config.SQLITE_MMAP_MB * 1024 * 1024}")
+    # Sorts and GROUP BYs that spill go to memory rather than temp files
+    conn.execute("PRAGMA temp_store = MEMORY")
+    if not writable:
+        conn.execute("PRAGMA query_only = ON")
+    return instrumentation.attach(conn)
+
+def database_generation(database=None):
+    """
+    Changes whenever the database (or its WAL) is written: a cheap key for caches
+    of query results that only change when the data is reloaded
+    """
+    database = database or config.DATABASE_PATH
+    generation = [database]
+    for path in (database, database + "-wal"):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            generation.append(None)
+        else:
+            generation.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(generation)
@@ -1,5 +1,6 @@
 import similar_climate_utils
-import json
+import serializer
+import instrumentation
 from datetime import datetime
 
 def get_page_html(form_data, export_flag=None):
@@ -58,8 +59,9 @@ def get_page_html(form_data, export_flag=None):
                     if not error_message:
                         form_copy = form_data.copy()
                         form_copy["other_metrics"] = other_metrics_val
-                        json_result = get_similar_climate_metrics(form_copy)
-                        parsed = json.loads(json_result)
+                        with instrumentation.phase("analysis"):
+                            json_result = get_similar_climate_metrics(form_copy)
+                        parsed = serializer.loads(json_result)
                         if "error" not in parsed:
                             result_data = parsed
                         else:
@@ -214,8 +216,8 @@ def get_page_html(form_data, export_flag=None):
                 "tension": 0.1
             })
 
-        labels_json = json.dumps(labels)
-        datasets_json = json.dumps(datasets)
+        labels_json = serializer.dumps(labels)
+        datasets_json = serializer.dumps(datasets)
 
         html += f"""
         <script>
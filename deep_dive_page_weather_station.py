@@ -5,6 +5,18 @@ import io
 from datetime import datetime
 import math
 
+import db_utils
+from level3_similarity_utils import get_station_period_stats, rank_similar_stations
+from template_engine import Template
+from singleflight import normalize_form
+import pyhtml
+import quality_flags
+import static_assets
+
+# Page CSS and JS live in static/ and are linked by fingerprinted URL (see static_assets)
+STYLESHEET_LINK = f'<link rel="stylesheet" href="{static_assets.url("css/deep_dive_station.css")}">'
+SCRIPT_TAG = f'<script src="{static_assets.url("js/deep_dive_station.js")}"></script>'
+
 def get_page_html(form_data, export_csv=False):
     """
     Level 3 Sub-Task A: Deep-dive analysis for weather station similarity
@@ -21,7 +33,11 @@ def get_page_html(form_data, export_csv=False):
     # Handle CSV export
     if export_csv and form_data:
         return handle_csv_export(form_data)
-    
+    return "".join(iter_page_html(form_data))
+
+
+def iter_page_html(form_data):
+    """Yield the page head and form first, then the results once the analysis has run"""
     # Get available data for dropdowns
     reference_stations, available_metrics, database_error = get_demo_data()
     
@@ -36,6 +52,15 @@ def get_page_html(form_data, export_csv=False):
     num_similar = form_data.get("num_similar", "5") if form_data else "5"
     sort_by = form_data.get("sort_by", "similarity") if form_data else "similarity"
     
+    # Page head and form, streamed before the analysis runs
+    yield from FORM_TEMPLATE.stream(
+        stylesheet_link=STYLESHEET_LINK, database_error=database_error,
+        reference_stations=reference_stations, available_metrics=available_metrics,
+        reference_station=reference_station, primary_metric=primary_metric, secondary_metric=secondary_metric,
+        period1_start=period1_start, period1_end=period1_end, period2_start=period2_start, period2_end=period2_end,
+        num_similar=num_similar, sort_by=sort_by,
+    )
+
     # Process analysis request
     analysis_results = None
     error_message = None
@@ -43,10 +68,13 @@ def get_page_html(form_data, export_csv=False):
     if (form_data and reference_station and primary_metric and secondary_metric and 
         period1_start and period1_end and period2_start and period2_end):
         try:
-            analysis_results = perform_similarity_analysis(
+            # Identical submissions already running share their result
+            analysis_results = pyhtml.coalesced_call(
+                ("deep-dive-weather-station", normalize_form(form_data)),
+                perform_similarity_analysis,
                 reference_station, primary_metric, secondary_metric,
                 period1_start, period1_end, period2_start, period2_end,
-                int(num_similar), sort_by
+                int(num_similar), sort_by, quality_flags.get_exclude(form_data)
             )
             
             if analysis_results and "error" in analysis_results:
@@ -56,359 +84,59 @@ def get_page_html(form_data, export_csv=False):
         except Exception as e:
             error_message = f"Analysis failed: {str(e)}"
 
-    # Generate HTML
-    page_html = f"""<!DOCTYPE html>
+    page_html = ""
+
+    # Display results
+    if error_message:
+        page_html += f"""
+        <div class="results-container">
+            <div class="error">
+                ❌ {error_message}
+            </div>
+        </div>"""
+    
+    elif analysis_results:
+        page_html += generate_results_html(analysis_results, primary_metric, secondary_metric)
+    
+    # Navigation and JavaScript
+    page_html += """
+        <div class="nav-links">
+            <a href="/">🏠 Home</a>
+            <a href="/focused">📊 Focused Analysis</a>
+            <a href="/similarity">🔍 Similarity Analysis</a>
+            <a href="/m-statement">ℹ️ About</a>
+        </div>
+    </div>
+    
+    """ + SCRIPT_TAG + """
+</body>
+</html>"""
+    
+    yield page_html
+
+
+# Page head and search form, compiled once at import; the head is flushed on its own
+# so the browser can fetch the stylesheet while the form is rendered
+FORM_TEMPLATE = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <title>Deep-Dive Climate Analysis - Level 3</title>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }}
-        
-        .container {{
-            max-width: 1600px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 15px 35px rgba(0,0,0,0.2);
-            overflow: hidden;
-        }}
-        
-        .header {{
-            background: linear-gradient(45deg, #2c3e50, #34495e);
-            color: white;
-            padding: 40px;
-            text-align: center;
-        }}
-        
-        .header h1 {{
-            font-size: 3rem;
-            margin-bottom: 15px;
-        }}
-        
-        .header p {{
-            font-size: 1.2rem;
-            opacity: 0.9;
-            max-width: 800px;
-            margin: 0 auto;
-        }}
-        
-        .form-container {{
-            padding: 40px;
-            background: linear-gradient(135deg, #f8f9fa 0%, #e9ecef 100%);
-        }}
-        
-        .form-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(350px, 1fr));
-            gap: 30px;
-        }}
-        
-        .form-section {{
-            background: white;
-            padding: 30px;
-            border-radius: 15px;
-            box-shadow: 0 8px 25px rgba(0,0,0,0.1);
-            border: 1px solid #e9ecef;
-        }}
-        
-        .form-section h3 {{
-            color: #2c3e50;
-            margin-bottom: 25px;
-            font-size: 1.3rem;
-            border-bottom: 3px solid #3498db;
-            padding-bottom: 10px;
-        }}
-        
-        .form-row {{
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 20px;
-            margin-bottom: 20px;
-        }}
-        
-        .form-group {{
-            display: flex;
-            flex-direction: column;
-        }}
-        
-        .form-group.full-width {{
-            grid-column: 1 / -1;
-        }}
-        
-        label {{
-            font-weight: 600;
-            color: #2c3e50;
-            margin-bottom: 8px;
-            font-size: 0.95rem;
-        }}
-        
-        select, input[type="date"], input[type="number"] {{
-            padding: 12px 15px;
-            border: 2px solid #e9ecef;
-            border-radius: 10px;
-            font-size: 1rem;
-            transition: all 0.3s ease;
-            background: white;
-        }}
-        
-        select:focus, input:focus {{
-            outline: none;
-            border-color: #3498db;
-            box-shadow: 0 0 15px rgba(52, 152, 219, 0.2);
-            transform: translateY(-2px);
-        }}
-        
-        .btn {{
-            background: linear-gradient(45deg, #3498db, #2980b9);
-            color: white;
-            border: none;
-            padding: 15px 30px;
-            border-radius: 10px;
-            cursor: pointer;
-            font-size: 1.1rem;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-            margin: 10px 5px;
-        }}
-        
-        .btn:hover {{
-            transform: translateY(-3px);
-            box-shadow: 0 8px 20px rgba(52, 152, 219, 0.4);
-        }}
-        
-        .btn-export {{
-            background: linear-gradient(45deg, #27ae60, #2ecc71);
-        }}
-        
-        .results-container {{
-            padding: 40px;
-        }}
-        
-        .analysis-summary {{
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 30px;
-            border-radius: 15px;
-            margin-bottom: 30px;
-            text-align: center;
-        }}
-        
-        .summary-grid {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 20px;
-            margin-top: 20px;
-        }}
-        
-        .summary-card {{
-            background: rgba(255,255,255,0.1);
-            padding: 20px;
-            border-radius: 10px;
-            text-align: center;
-        }}
-        
-        .summary-card h4 {{
-            margin-bottom: 10px;
-            font-size: 0.9rem;
-            opacity: 0.8;
-        }}
-        
-        .summary-card .value {{
-            font-size: 1.8rem;
-            font-weight: bold;
-        }}
-        
-        .error {{
-            background: linear-gradient(45deg, #e74c3c, #c0392b);
-            color: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin: 20px 0;
-            text-align: center;
-        }}
-        
-        .warning {{
-            background: linear-gradient(45deg, #f39c12, #e67e22);
-            color: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin: 20px 0;
-        }}
-        
-        .reference-info {{
-            background: linear-gradient(135deg, #74b9ff 0%, #0984e3 100%);
-            color: white;
-            padding: 25px;
-            border-radius: 12px;
-            margin-bottom: 25px;
-        }}
-        
-        .metrics-comparison {{
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 20px;
-            margin: 20px 0;
-        }}
-        
-        .metric-card {{
-            background: #f8f9fa;
-            padding: 20px;
-            border-radius: 10px;
-            border-left: 5px solid #3498db;
-        }}
-        
-        .metric-card h4 {{
-            color: #2c3e50;
-            margin-bottom: 15px;
-        }}
-        
-        .change-indicator {{
-            display: inline-block;
-            padding: 5px 12px;
-            border-radius: 20px;
-            font-size: 0.9rem;
-            font-weight: bold;
-            margin: 5px 0;
-        }}
-        
-        .increase {{
-            background: #ffebee;
-            color: #c62828;
-        }}
-        
-        .decrease {{
-            background: #e8f5e8;
-            color: #2e7d32;
-        }}
-        
-        .stations-table {{
-            overflow-x: auto;
-            margin-top: 25px;
-        }}
-        
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-            background: white;
-            border-radius: 10px;
-            overflow: hidden;
-            box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-        }}
-        
-        th, td {{
-            padding: 15px;
-            text-align: left;
-            border-bottom: 1px solid #e9ecef;
-        }}
-        
-        th {{
-            background: linear-gradient(45deg, #34495e, #2c3e50);
-            color: white;
-            font-weight: 600;
-            position: sticky;
-            top: 0;
-            z-index: 10;
-        }}
-        
-        tbody tr:hover {{
-            background: #f8f9fa;
-            transform: scale(1.01);
-            transition: all 0.2s ease;
-        }}
-        
-        .similarity-score {{
-            font-weight: bold;
-            padding: 8px 15px;
-            border-radius: 25px;
-            color: white;
-            text-align: center;
-            display: inline-block;
-            min-width: 80px;
-        }}
-        
-        .very-similar {{ background: linear-gradient(45deg, #27ae60, #2ecc71); }}
-        .similar {{ background: linear-gradient(45deg, #3498db, #2980b9); }}
-        .somewhat-similar {{ background: linear-gradient(45deg, #f39c12, #e67e22); }}
-        .not-similar {{ background: linear-gradient(45deg, #e74c3c, #c0392b); }}
-        
-        .chart-container {{
-            background: white;
-            padding: 30px;
-            border-radius: 15px;
-            margin: 20px 0;
-            box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-        }}
-        
-        .chart-container h3 {{
-            margin-bottom: 20px;
-            color: #2c3e50;
-            text-align: center;
-        }}
-        
-        .nav-links {{
-            background: linear-gradient(45deg, #2c3e50, #34495e);
-            color: white;
-            padding: 20px 40px;
-            text-align: center;
-        }}
-        
-        .nav-links a {{
-            color: #74b9ff;
-            text-decoration: none;
-            margin: 0 20px;
-            font-weight: 500;
-            transition: all 0.3s ease;
-        }}
-        
-        .nav-links a:hover {{
-            color: white;
-            text-shadow: 0 0 10px rgba(116, 185, 255, 0.5);
-        }}
-        
-        @media (max-width: 768px) {{
-            .header h1 {{ font-size: 2rem; }}
-            .form-grid {{ grid-template-columns: 1fr; }}
-            .form-row {{ grid-template-columns: 1fr; }}
-            .metrics-comparison {{ grid-template-columns: 1fr; }}
-            .summary-grid {{ grid-template-columns: repeat(2, 1fr); }}
-            th, td {{ padding: 10px 8px; font-size: 0.9rem; }}
-        }}
-    </style>
+    {{ stylesheet_link }}
 </head>
 <body>
     <div class="container">
         <div class="header">
             <h1>🌊 Deep-Dive Climate Analysis</h1>
             <p>Advanced weather station similarity analysis using rate of change comparisons across multiple time periods. Find stations with similar climate change patterns using sophisticated SQL analytics.</p>
-        </div>"""
-    
-    # Show database warning if needed
-    if database_error:
-        page_html += f"""
+        </div>{% flush %}{% if database_error %}
         <div class="warning">
             <h4>⚠️ Database Notice</h4>
-            <p>{database_error}</p>
+            <p>{{ database_error }}</p>
             <p><strong>Note:</strong> Using demonstration data. In production, this would connect to the full Australian Bureau of Meteorology climate database.</p>
-        </div>"""
-    
-    page_html += f"""
+        </div>{% endif %}
         <div class="form-container">
             <form method="post" id="analysisForm">
                 <div class="form-grid">
@@ -418,17 +146,7 @@ def get_page_html(form_data, export_csv=False):
                         <div class="form-group">
                             <label for="reference_station">Choose Reference Station:</label>
                             <select name="reference_station" id="reference_station" required>
-                                <option value="">Select a major weather station...</option>"""
-    
-    # Add reference station options
-    for station in reference_stations:
-        station_id = station[0]
-        station_name = station[1] if len(station) > 1 else f"Station {station_id}"
-        station_state = station[2] if len(station) > 2 else ""
-        selected = "selected" if str(station_id) == reference_station else ""
-        page_html += f'<option value="{station_id}" {selected}>{station_name} ({station_state})</option>'
-    
-    page_html += f"""
+                                <option value="">Select a major weather station...</option>{% for station in reference_stations %}<option value="{{ station[0] }}" {{ "selected" if str(station[0]) == reference_station else "" }}>{{ station[1] if len(station) > 1 else f"Station {station[0]}" }} ({{ station[2] if len(station) > 2 else "" }})</option>{% endfor %}
                             </select>
                         </div>
                     </div>
@@ -440,25 +158,13 @@ def get_page_html(form_data, export_csv=False):
                             <div class="form-group">
                                 <label for="primary_metric">Primary Metric:</label>
                                 <select name="primary_metric" id="primary_metric" required>
-                                    <option value="">Choose primary metric...</option>"""
-    
-    for metric_code, metric_name in available_metrics:
-        selected = "selected" if metric_code == primary_metric else ""
-        page_html += f'<option value="{metric_code}" {selected}>{metric_name}</option>'
-    
-    page_html += f"""
+                                    <option value="">Choose primary metric...</option>{% for metric_code, metric_name in available_metrics %}<option value="{{ metric_code }}" {{ "selected" if metric_code == primary_metric else "" }}>{{ metric_name }}</option>{% endfor %}
                                 </select>
                             </div>
                             <div class="form-group">
                                 <label for="secondary_metric">Secondary Metric:</label>
                                 <select name="secondary_metric" id="secondary_metric" required>
-                                    <option value="">Choose secondary metric...</option>"""
-    
-    for metric_code, metric_name in available_metrics:
-        selected = "selected" if metric_code == secondary_metric else ""
-        page_html += f'<option value="{metric_code}" {selected}>{metric_name}</option>'
-    
-    page_html += f"""
+                                    <option value="">Choose secondary metric...</option>{% for metric_code, metric_name in available_metrics %}<option value="{{ metric_code }}" {{ "selected" if metric_code == secondary_metric else "" }}>{{ metric_name }}</option>{% endfor %}
                                 </select>
                             </div>
                         </div>
@@ -471,24 +177,24 @@ def get_page_html(form_data, export_csv=False):
                             <div class="form-group">
                                 <label for="period1_start">Period 1 Start:</label>
                                 <input type="date" name="period1_start" id="period1_start" 
-                                       value="{period1_start}" min="1970-01-01" max="2020-12-31" required>
+                                       value="{{ period1_start }}" min="1970-01-01" max="2020-12-31" required>
                             </div>
                             <div class="form-group">
                                 <label for="period1_end">Period 1 End:</label>
                                 <input type="date" name="period1_end" id="period1_end" 
-                                       value="{period1_end}" min="1970-01-01" max="2020-12-31" required>
+                                       value="{{ period1_end }}" min="1970-01-01" max="2020-12-31" required>
                             </div>
                         </div>
                         <div class="form-row">
                             <div class="form-group">
                                 <label for="period2_start">Period 2 Start:</label>
                                 <input type="date" name="period2_start" id="period2_start" 
-                                       value="{period2_start}" min="1970-01-01" max="2020-12-31" required>
+                                       value="{{ period2_start }}" min="1970-01-01" max="2020-12-31" required>
                             </div>
                             <div class="form-group">
                                 <label for="period2_end">Period 2 End:</label>
                                 <input type="date" name="period2_end" id="period2_end" 
-                                       value="{period2_end}" min="1970-01-01" max="2020-12-31" required>
+                                       value="{{ period2_end }}" min="1970-01-01" max="2020-12-31" required>
                             </div>
                         </div>
                     </div>
@@ -500,18 +206,18 @@ def get_page_html(form_data, export_csv=False):
                             <div class="form-group">
                                 <label for="num_similar">Number of Similar Stations:</label>
                                 <select name="num_similar" id="num_similar">
-                                    <option value="5" {"selected" if num_similar == "5" else ""}>5 stations</option>
-                                    <option value="10" {"selected" if num_similar == "10" else ""}>10 stations</option>
-                                    <option value="15" {"selected" if num_similar == "15" else ""}>15 stations</option>
-                                    <option value="20" {"selected" if num_similar == "20" else ""}>20 stations</option>
+                                    <option value="5" {{ "selected" if num_similar == "5" else "" }}>5 stations</option>
+                                    <option value="10" {{ "selected" if num_similar == "10" else "" }}>10 stations</option>
+                                    <option value="15" {{ "selected" if num_similar == "15" else "" }}>15 stations</option>
+                                    <option value="20" {{ "selected" if num_similar == "20" else "" }}>20 stations</option>
                                 </select>
                             </div>
                             <div class="form-group">
                                 <label for="sort_by">Sort Results By:</label>
                                 <select name="sort_by" id="sort_by">
-                                    <option value="similarity" {"selected" if sort_by == "similarity" else ""}>Similarity Score</option>
-                                    <option value="distance" {"selected" if sort_by == "distance" else ""}>Geographic Distance</option>
-                                    <option value="state" {"selected" if sort_by == "state" else ""}>State/Territory</option>
+                                    <option value="similarity" {{ "selected" if sort_by == "similarity" else "" }}>Similarity Score</option>
+                                    <option value="distance" {{ "selected" if sort_by == "distance" else "" }}>Geographic Distance</option>
+                                    <option value="state" {{ "selected" if sort_by == "state" else "" }}>State/Territory</option>
                                 </select>
                             </div>
                         </div>
@@ -527,101 +233,7 @@ def get_page_html(form_data, export_csv=False):
                     </div>
                 </div>
             </form>
-        </div>"""
-    
-    # Display results
-    if error_message:
-        page_html += f"""
-        <div class="results-container">
-            <div class="error">
-                ❌ {error_message}
-            </div>
-        </div>"""
-    
-    elif analysis_results:
-        page_html += generate_results_html(analysis_results, primary_metric, secondary_metric)
-    
-    # Navigation and JavaScript
-    page_html += """
-        <div class="nav-links">
-            <a href="/">🏠 Home</a>
-            <a href="/focused">📊 Focused Analysis</a>
-            <a href="/similarity">🔍 Similarity Analysis</a>
-            <a href="/m-statement">ℹ️ About</a>
-        </div>
-    </div>
-    
-    <script>
-        // Form validation and interactivity
-        document.addEventListener('DOMContentLoaded', function() {
-            const form = document.getElementById('analysisForm');
-            const primarySelect = document.getElementById('primary_metric');
-            const secondarySelect = document.getElementById('secondary_metric');
-            
-            // Prevent selecting same metric for both primary and secondary
-            function updateMetricOptions() {
-                const primaryValue = primarySelect.value;
-                const secondaryValue = secondarySelect.value;
-                
-                Array.from(primarySelect.options).forEach(option => {
-                    option.disabled = option.value === secondaryValue && option.value !== '';
-                });
-                
-                Array.from(secondarySelect.options).forEach(option => {
-                    option.disabled = option.value === primaryValue && option.value !== '';
-                });
-            }
-            
-            primarySelect.addEventListener('change', updateMetricOptions);
-            secondarySelect.addEventListener('change', updateMetricOptions);
-            updateMetricOptions();
-            
-            // Date validation
-            form.addEventListener('submit', function(e) {
-                const period1Start = new Date(document.getElementById('period1_start').value);
-                const period1End = new Date(document.getElementById('period1_end').value);
-                const period2Start = new Date(document.getElementById('period2_start').value);
-                const period2End = new Date(document.getElementById('period2_end').value);
-                
-                if (period1Start >= period1End) {
-                    alert('Period 1 end date must be after start date');
-                    e.preventDefault();
-                    return;
-                }
-                
-                if (period2Start >= period2End) {
-                    alert('Period 2 end date must be after start date');
-                    e.preventDefault();
-                    return;
-                }
-                
-                if (primarySelect.value === secondarySelect.value) {
-                    alert('Primary and secondary metrics must be different');
-                    e.preventDefault();
-                    return;
-                }
-            });
-        });
-        
-        // Auto-populate example dates based on reference station
-        document.getElementById('reference_station').addEventListener('change', function() {
-            const period1Start = document.getElementById('period1_start');
-            const period1End = document.getElementById('period1_end');
-            const period2Start = document.getElementById('period2_start');
-            const period2End = document.getElementById('period2_end');
-            
-            if (this.value && !period1Start.value) {
-                period1Start.value = '2000-01-01';
-                period1End.value = '2009-12-31';
-                period2Start.value = '2010-01-01';
-                period2End.value = '2019-12-31';
-            }
-        });
-    </script>
-</body>
-</html>"""
-    
-    return page_html
+        </div>""", "deep dive form")
 
 
 def get_demo_data():
@@ -653,13 +265,121 @@ def get_demo_data():
 
 def perform_similarity_analysis(ref_station, primary_metric, secondary_metric, 
                                period1_start, period1_end, period2_start, period2_end,
-                               num_similar, sort_by):
+                               num_similar, sort_by, exclude=()):
+    """
+    Perform the core similarity analysis on the weather database,
+    using demo data when the database or the reference station is not available
+    exclude lists the quality flags whose readings are left out
+    """
+    try:
+        analysis_results = get_database_analysis_results(
+            ref_station, primary_metric, secondary_metric,
+            period1_start, period1_end, period2_start, period2_end,
+            num_similar, sort_by, exclude
+        )
+    except sqlite3.DatabaseError:
+        analysis_results = None
+
+    if analysis_results is None:
+        return generate_demo_analysis_results(ref_station, primary_metric, secondary_metric,
+                                            period1_start, period1_end, period2_start, period2_end,
+                                            num_similar, sort_by)
+    return analysis_results
+
+
+def get_database_analysis_results(ref_station, primary_metric, secondary_metric,
+                                  period1_start, period1_end, period2_start, period2_end,
+                                  num_similar, sort_by, exclude=()):
     """
-    Perform the core similarity analysis using demo data
+    Rank stations by similarity of rate of change using the weather database
+    Station scoring is split into chunks on the level 3 process pool
+    Returns None if the reference station is not in the database
     """
-    return generate_demo_analysis_results(ref_station, primary_metric, secondary_metric,
-                                        period1_start, period1_end, period2_start, period2_end,
-                                        num_similar, sort_by)
+    conn = db_utils.connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT site_id, name, latitude, longitude, state, region
+            FROM weather_station
+            WHERE site_id = ?
+        """, (ref_station,))
+        ref_row = cur.fetchone()
+        if not ref_row:
+            return None
+
+        quality = quality_flags.QualityFilter.for_connection(conn, exclude)
+        ref_stats = get_station_period_stats(
+            ref_row[0], primary_metric, secondary_metric,
+            period1_start, period1_end, period2_start, period2_end, conn, quality
+        )
+        if ref_stats["primary_change"] is None or ref_stats["secondary_change"] is None:
+            return {"error": "Insufficient data for reference station in specified periods"}
+
+        cur.execute("""
+            SELECT site_id, name, latitude, longitude, state, region
+            FROM weather_station
+            WHERE site_id != ?
+            ORDER BY site_id
+        """, (ref_row[0],))
+        other_stations = cur.fetchall()
+    finally:
+        conn.close()
+
+    ranked = rank_similar_stations(
+        other_stations, ref_stats["primary_change"], ref_stats["secondary_change"],
+        primary_metric, secondary_metric,
+        period1_start, period1_end, period2_start, period2_end, num_similar, quality
+    )
+
+    similar_stations = []
+    for station in ranked:
+        similar_stations.append({
+            "id": station["station_id"],
+            "name": station["name"],
+            "state": station["state"],
+            "latitude": station["latitude"],
+            "longitude": station["longitude"],
+            "primary_period1_avg": station["primary_period1_avg"],
+            "primary_period2_avg": station["primary_period2_avg"],
+            "primary_change_percent": station["primary_change"],
+            "secondary_period1_avg": station["secondary_period1_avg"],
+            "secondary_period2_avg": station["secondary_period2_avg"],
+            "secondary_change_percent": station["secondary_change"],
+            "similarity_score": station["similarity_score"],
+            "distance_km": estimate_distance_km(ref_row[2], ref_row[3], station["latitude"], station["longitude"]),
+            "period1_records": station["period1_records"],
+            "period2_records": station["period2_records"]
+        })
+
+    # Sort based on user preference
+    if sort_by == "distance":
+        similar_stations.sort(key=lambda x: x["distance_km"])
+    elif sort_by == "state":
+        similar_stations.sort(key=lambda x: x["state"])
+
+    return {
+        "reference_station": {
+            "id": ref_row[0],
+            "name": ref_row[1],
+            "state": ref_row[4],
+            "latitude": ref_row[2],
+            "longitude": ref_row[3],
+            "primary_period1_avg": ref_stats["primary_period1_avg"],
+            "primary_period2_avg": ref_stats["primary_period2_avg"],
+            "primary_change_percent": ref_stats["primary_change"],
+            "secondary_period1_avg": ref_stats["secondary_period1_avg"],
+            "secondary_period2_avg": ref_stats["secondary_period2_avg"],
+            "secondary_change_percent": ref_stats["secondary_change"]
+        },
+        "similar_stations": similar_stations
+    }
+
+
+def estimate_distance_km(lat1, lon1, lat2, lon2):
+    """Rough distance between two stations (0 if either location is unknown)"""
+    if None in (lat1, lon1, lat2, lon2):
+        return 0.0
+    return 111.111 * math.sqrt((lat2 - lat1)**2 + (lon2 - lon1)**2)
 
 
 def generate_demo_analysis_results(ref_station, primary_metric, secondary_metric,
@@ -785,53 +505,76 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
     # Calculate best match score safely
     best_score = min((s['similarity_score'] for s in similar_stations), default=0)
     
-    html = f"""
+    return RESULTS_TEMPLATE.render(
+        ref_station=ref_station,
+        similar_stations=similar_stations,
+        primary_name=primary_name,
+        secondary_name=secondary_name,
+        best_score=best_score,
+        get_similarity_class=get_similarity_class,
+    )
+
+
+def get_similarity_class(score):
+    """Classify similarity score for styling"""
+    if score < 2:
+        return "very-similar"
+    elif score < 5:
+        return "similar"
+    elif score < 10:
+        return "somewhat-similar"
+    else:
+        return "not-similar"
+
+
+# Results section, compiled once at import
+RESULTS_TEMPLATE = Template("""
     <div class="results-container">
         <div class="analysis-summary">
             <h2>📊 Deep-Dive Analysis Results</h2>
-            <p><strong>Reference Station:</strong> {ref_station['name']} ({ref_station['state']})</p>
-            <p><strong>Analysis Metrics:</strong> {primary_name} vs {secondary_name}</p>
+            <p><strong>Reference Station:</strong> {{ ref_station['name'] }} ({{ ref_station['state'] }})</p>
+            <p><strong>Analysis Metrics:</strong> {{ primary_name }} vs {{ secondary_name }}</p>
             
             <div class="summary-grid">
                 <div class="summary-card">
                     <h4>Similar Stations Found</h4>
-                    <div class="value">{len(similar_stations)}</div>
+                    <div class="value">{{ len(similar_stations) }}</div>
                 </div>
                 <div class="summary-card">
-                    <h4>{primary_name} Change</h4>
-                    <div class="value">{ref_station['primary_change_percent']:+.2f}%</div>
+                    <h4>{{ primary_name }} Change</h4>
+                    <div class="value">{{ format(ref_station['primary_change_percent'], "+.2f") }}%</div>
                 </div>
                 <div class="summary-card">
-                    <h4>{secondary_name} Change</h4>
-                    <div class="value">{ref_station['secondary_change_percent']:+.2f}%</div>
+                    <h4>{{ secondary_name }} Change</h4>
+                    <div class="value">{{ format(ref_station['secondary_change_percent'], "+.2f") }}%</div>
                 </div>
                 <div class="summary-card">
                     <h4>Best Match Score</h4>
-                    <div class="value">{best_score:.2f}</div>
+                    <div class="value">{{ format(best_score, ".2f") }}</div>
                 </div>
             </div>
         </div>
         
         <div class="reference-info">
             <h3>🎯 Reference Station Analysis</h3>
-            <h4>{ref_station['name']} - {ref_station['state']}</h4>
-            <p><strong>Location:</strong> {ref_station['latitude']:.3f}°, {ref_station['longitude']:.3f}°</p>
+            <h4>{{ ref_station['name'] }} - {{ ref_station['state'] }}</h4>
+            <p><strong>Location:</strong> {{ format(ref_station['latitude'], ".3f") }}°, {{ format(ref_station['longitude'], ".3f") }}°</p>
             
             <div class="metrics-comparison">
                 <div class="metric-card">
-                    <h4>{primary_name}</h4>
-                    <p><strong>Period 1 Average:</strong> {ref_station['primary_period1_avg']:.2f}</p>
-                    <p><strong>Period 2 Average:</strong> {ref_station['primary_period2_avg']:.2f}</p>
-                    <div class="change-indicator {'increase' if ref_station['primary_change_percent'] > 0 else 'decrease'}">
-                        {ref_station['primary_change_percent']:+.2f}% change
+                    <h4>{{ primary_name }}</h4>
+                    <p><strong>Period 1 Average:</strong> {{ format(ref_station['primary_period1_avg'], ".2f") }}</p>
+                    <p><strong>Period 2 Average:</strong> {{ format(ref_station['primary_period2_avg'], ".2f") }}</p>
+                    <div class="change-indicator {{ 'increase' if ref_station['primary_change_percent'] > 0 else 'decrease' }}">
+                        {{ format(ref_station['primary_change_percent'], "+.2f") }}% change
                     </div>
                 </div>
                 <div class="metric-card">
-                    <h4>{secondary_name}</h4>
-                    <p><strong>Period 1 Average:</strong> {ref_station['secondary_period1_avg']:.2f}</p>
-                    <p><strong>Period 2 Average:</strong> {ref_station['secondary_period2_avg']:.2f}</p>
-                    <div class="change-indicator {'increase' if ref_station['secondary_change_percent'] > 0 else 'decrease'}">
-                        {ref_station['secondary_change_percent']:+.2f}% change
+                    <h4>{{ secondary_name }}</h4>
+                    <p><strong>Period 1 Average:</strong> {{ format(ref_station['secondary_period1_avg'], ".2f") }}</p>
+                    <p><strong>Period 2 Average:</strong> {{ format(ref_station['secondary_period2_avg'], ".2f") }}</p>
+                    <div class="change-indicator {{ 'increase' if ref_station['secondary_change_percent'] > 0 else 'decrease' }}">
+                        {{ format(ref_station['secondary_change_percent'], "+.2f") }}% change
                     </div>
                 </div>
             </div>
@@ -849,39 +592,32 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
                         <th>State</th>
                         <th>Location</th>
                         <th>Similarity Score</th>
-                        <th>{primary_name} Change</th>
-                        <th>{secondary_name} Change</th>
+                        <th>{{ primary_name }} Change</th>
+                        <th>{{ secondary_name }} Change</th>
                         <th>Distance (km)</th>
                         <th>Data Quality</th>
                     </tr>
                 </thead>
-                <tbody>"""
-    
-    for i, station in enumerate(similar_stations, 1):
-        similarity_class = get_similarity_class(station['similarity_score'])
-        
-        html += f"""
+                <tbody>{% for i, station in enumerate(similar_stations, 1) %}
                     <tr>
-                        <td><strong>#{i}</strong></td>
-                        <td>{station['name']}</td>
-                        <td>{station['state']}</td>
-                        <td>{station['latitude']:.3f}°, {station['longitude']:.3f}°</td>
-                        <td><span class="similarity-score {similarity_class}">{station['similarity_score']:.2f}</span></td>
+                        <td><strong>#{{ i }}</strong></td>
+                        <td>{{ station['name'] }}</td>
+                        <td>{{ station['state'] }}</td>
+                        <td>{{ format(station['latitude'], ".3f") }}°, {{ format(station['longitude'], ".3f") }}°</td>
+                        <td><span class="similarity-score {{ get_similarity_class(station['similarity_score']) }}">{{ format(station['similarity_score'], ".2f") }}</span></td>
                         <td>
-                            <div class="change-indicator {'increase' if station['primary_change_percent'] > 0 else 'decrease'}">
-                                {station['primary_change_percent']:+.2f}%
+                            <div class="change-indicator {{ 'increase' if station['primary_change_percent'] > 0 else 'decrease' }}">
+                                {{ format(station['primary_change_percent'], "+.2f") }}%
                             </div>
                         </td>
                         <td>
-                            <div class="change-indicator {'increase' if station['secondary_change_percent'] > 0 else 'decrease'}">
-                                {station['secondary_change_percent']:+.2f}%
+                            <div class="change-indicator {{ 'increase' if station['secondary_change_percent'] > 0 else 'decrease' }}">
+                                {{ format(station['secondary_change_percent'], "+.2f") }}%
                             </div>
                         </td>
-                        <td>{station['distance_km']:.1f} km</td>
-                        <td>{station['period1_records'] + station['period2_records']} records</td>
-                    </tr>"""
-    
-    html += """
+                        <td>{{ format(station['distance_km'], ".1f") }} km</td>
+                        <td>{{ station['period1_records'] + station['period2_records'] }} records</td>
+                    </tr>{% endfor %}
                 </tbody>
             </table>
         </div>
@@ -904,15 +640,12 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
             const changeCtx = document.getElementById('changeComparisonChart').getContext('2d');
             
             const referenceData = [{
-                x: """ + str(ref_station['primary_change_percent']) + """,
-                y: """ + str(ref_station['secondary_change_percent']) + """,
-                label: '""" + ref_station['name'] + """ (Reference)'
+                x: {{ ref_station['primary_change_percent'] }},
+                y: {{ ref_station['secondary_change_percent'] }},
+                label: '{{ ref_station['name'] }} (Reference)'
             }];
             
-            const similarStationsData = [""" + ",".join([
-                f'{{x: {s["primary_change_percent"]}, y: {s["secondary_change_percent"]}, label: "{s["name"]}", similarity: {s["similarity_score"]}}}'
-                for s in similar_stations
-            ]) + """];
+            const similarStationsData = [{% for i, s in enumerate(similar_stations) %}{{ "," if i else "" }}{x: {{ s["primary_change_percent"] }}, y: {{ s["secondary_change_percent"] }}, label: "{{ s["name"] }}", similarity: {{ s["similarity_score"] }}}{% endfor %}];
 
             new Chart(changeCtx, {
                 type: 'scatter',
@@ -938,7 +671,7 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
                     plugins: {
                         title: {
                             display: true,
-                            text: '""" + primary_name + """ vs """ + secondary_name + """ Change Patterns'
+                            text: '{{ primary_name }} vs {{ secondary_name }} Change Patterns'
                         },
                         tooltip: {
                             callbacks: {
@@ -958,13 +691,13 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
                         x: {
                             title: {
                                 display: true,
-                                text: '""" + primary_name + """ Change (%)'
+                                text: '{{ primary_name }} Change (%)'
                             }
                         },
                         y: {
                             title: {
                                 display: true,
-                                text: '""" + secondary_name + """ Change (%)'
+                                text: '{{ secondary_name }} Change (%)'
                             }
                         }
                     }
@@ -974,9 +707,9 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
             // Geographic Distribution Chart
             const geoCtx = document.getElementById('geographicChart').getContext('2d');
             
-            const stationNames = [""" + ",".join([f'"{s["name"]}"' for s in similar_stations]) + """];
-            const distances = [""" + ",".join([str(s["distance_km"]) for s in similar_stations]) + """];
-            const similarities = [""" + ",".join([str(s["similarity_score"]) for s in similar_stations]) + """];
+            const stationNames = [{% for i, s in enumerate(similar_stations) %}{{ "," if i else "" }}"{{ s["name"] }}"{% endfor %}];
+            const distances = [{% for i, s in enumerate(similar_stations) %}{{ "," if i else "" }}{{ s["distance_km"] }}{% endfor %}];
+            const similarities = [{% for i, s in enumerate(similar_stations) %}{{ "," if i else "" }}{{ s["similarity_score"] }}{% endfor %}];
             
             const barColors = similarities.map(score => {
                 if (score < 2) return '#27ae60';
@@ -1028,21 +761,7 @@ def generate_results_html(analysis_results, primary_metric, secondary_metric):
         document.addEventListener('DOMContentLoaded', function() {
             setTimeout(initializeCharts, 500);
         });
-    </script>"""
-    
-    return html
-
-
-def get_similarity_class(score):
-    """Classify similarity score for styling"""
-    if score < 2:
-        return "very-similar"
-    elif score < 5:
-        return "similar"
-    elif score < 10:
-        return "somewhat-similar"
-    else:
-        return "not-similar"
+    </script>""", "deep-dive station results")
 
 
 def handle_csv_export(form_data):
@@ -1057,7 +776,8 @@ def handle_csv_export(form_data):
         form_data.get("period2_start"),
         form_data.get("period2_end"),
         int(form_data.get("num_similar", 10)),
-        form_data.get("sort_by", "similarity")
+        form_data.get("sort_by", "similarity"),
+        quality_flags.get_exclude(form_data)
     )
     
     if not analysis_results or "error" in analysis_results:
@@ -1,8 +1,11 @@
-import sqlite3
-import json
+import aggregate_cube
+import db_utils
+import quality_flags
+import serializer
 from datetime import datetime
 import io
 import csv
+from timeseries_utils import downsample_for_form, encode_timeseries_for_form
 
 def get_filtered_climate_data(form_data):
     start_date = form_data.get('start_date')
@@ -12,20 +15,21 @@ def get_filtered_climate_data(form_data):
     end_station = int(form_data.get('end_station'))
 
     if not (start_date and end_date and climate_type):
-        return json.dumps({"error": "Missing parameters"})
+        return serializer.dumps({"error": "Missing parameters"})
 
     try:
         start = datetime.strptime(start_date, "%Y-%m-%d")
         end = datetime.strptime(end_date, "%Y-%m-%d")
         if end <= start:
-            return json.dumps({"error": "End date must be later than start date."})
+            return serializer.dumps({"error": "End date must be later than start date."})
         if start.year < 1970 or end.year > 2020:
-            return json.dumps({"error": "Date out of range (1970–2020)."})
+            return serializer.dumps({"error": "Date out of range (1970–2020)."})
     except ValueError:
-        return json.dumps({"error": "Invalid date format."})
+        return serializer.dumps({"error": "Invalid date format."})
 
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
+    quality = quality_flags.QualityFilter.for_connection(conn, quality_flags.get_exclude(form_data))
 
     # Line graph: station-level data
     line_query = f"""
@@ -33,7 +37,7 @@ def get_filtered_climate_data(form_data):
         FROM weather_data
         WHERE location BETWEEN ? AND ?
           AND DMY BETWEEN ? AND ?
-          AND {climate_type} IS NOT NULL
+          AND {quality.value_test(climate_type)}
         ORDER BY DMY ASC;
     """
     cur.execute(line_query, (start_station, end_station, start_date, end_date))
@@ -43,24 +47,31 @@ def get_filtered_climate_data(form_data):
     for date, site, value in raw_results:
         timeseries_data.append({"date": date, "value": value})
 
-    # Summary chart: average per state
-    bar_query = f"""
-        SELECT ws.state, AVG(wd.{climate_type})
-        FROM weather_data wd
-        JOIN weather_station ws ON wd.location = ws.site_id
-        WHERE wd.DMY BETWEEN ? AND ?
-          AND wd.{climate_type} IS NOT NULL
-        GROUP BY ws.state;
-    """
-    cur.execute(bar_query, (start_date, end_date))
-    state_averages = cur.fetchall()
+    # Bound the number of points Chart.js has to draw, whatever the date range
+    timeseries_data = downsample_for_form(timeseries_data, form_data)
+
+    # Summary chart: average per state, from the pre-aggregated cube when the database has one
+    if aggregate_cube.has_cube(conn):
+        state_averages = aggregate_cube.get_state_averages(conn, climate_type, start_date, end_date, quality.exclude)
+    else:
+        bar_query = f"""
+            SELECT ws.state, AVG(wd.{climate_type})
+            FROM weather_data wd
+            JOIN weather_station ws ON wd.location = ws.site_id
+            WHERE wd.DMY BETWEEN ? AND ?
+              AND {quality.value_test(climate_type, 'wd')}
+              AND wd.{climate_type} != ''
+            GROUP BY ws.state;
+        """
+        cur.execute(bar_query, (start_date, end_date))
+        state_averages = cur.fetchall()
 
     bar_data = [{"state": state, "total": round(avg, 2)} for state, avg in state_averages]
 
     conn.close()
 
-    return json.dumps({
-        "timeseries": timeseries_data,
+    return serializer.dumps({
+        "timeseries": encode_timeseries_for_form(timeseries_data, form_data),
         "bar_totals": bar_data
     })
 
@@ -85,15 +96,16 @@ def get_filtered_climate_data_csv(form_data):
     except ValueError:
         return None, "Invalid date format."
 
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
+    quality = quality_flags.QualityFilter.for_connection(conn, quality_flags.get_exclude(form_data))
 
     query = f"""
         SELECT DMY, {climate_type}
         FROM weather_data
         WHERE location BETWEEN ? AND ?
           AND DMY BETWEEN ? AND ?
-          AND {climate_type} IS NOT NULL
+          AND {quality.value_test(climate_type)}
         ORDER BY DMY ASC;
     """
     cur.execute(query, (start_station, end_station, start_date, end_date))
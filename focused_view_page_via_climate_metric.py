@@ -1,8 +1,11 @@
 from filtered_climate_utils import get_filtered_climate_data
-import json
+import serializer
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 def get_page_html(form_data):
-    print("Generating Focused View Page...")
+    logger.info("Generating Focused View Page...")
 
     filtered_data = None
     selected_metric = None
@@ -10,15 +13,18 @@ def get_page_html(form_data):
     if form_data:
         try:
             selected_metric = form_data.get("climate_type")
-            result_json = get_filtered_climate_data(form_data)
-            result_dict = json.loads(result_json)
+            # Parallel date/value arrays avoid repeating the keys for every chart point
+            form_copy = form_data.copy()
+            form_copy["format"] = "columns"
+            result_json = get_filtered_climate_data(form_copy)
+            result_dict = serializer.loads(result_json)
             if "error" in result_dict:
-                print("Data error:", result_dict["error"])
+                logger.info("Data error: %s", result_dict["error"])
                 filtered_data = None
             else:
                 filtered_data = result_dict
         except Exception as e:
-            print("Failed to get filtered data:", e)
+            logger.warning("Failed to get filtered data: %s", e)
 
     valid_metrics = [
         "precipitation", "evaporation", "maxTemp", "minTemp", "sunshine",
@@ -126,8 +132,8 @@ def get_page_html(form_data):
     if filtered_data:
         page_html += f"""
     <script>
-        const lineData = {json.dumps(filtered_data.get("timeseries", []))};
-        const barData = {json.dumps(filtered_data.get("bar_totals", []))};
+        const lineData = {serializer.dumps(filtered_data.get("timeseries", {"dates": [], "values": []}))};
+        const barData = {serializer.dumps(filtered_data.get("bar_totals", []))};
 
         const ctxLine = document.getElementById('lineGraph').getContext('2d');
         const ctxBar = document.getElementById('summaryGraph').getContext('2d');
@@ -135,10 +141,10 @@ def get_page_html(form_data):
         new Chart(ctxLine, {{
             type: 'line',
             data: {{
-                labels: lineData.map(dp => dp.date),
+                labels: lineData.dates,
                 datasets: [{{
                     label: 'Climate Value',
-                    data: lineData.map(dp => dp.value),
+                    data: lineData.values,
                     borderColor: 'rgba(75, 192, 192, 1)',
                     borderWidth: 2,
                     fill: false
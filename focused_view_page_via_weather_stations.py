@@ -1,6 +1,35 @@
 import sqlite3
+import base64
+import heapq
+import itertools
+import config
+import db_utils
 import json
+import pyhtml
+import quality_flags
+import serializer
 from datetime import datetime
+from log_utils import get_logger
+from template_engine import Template
+import static_assets
+
+logger = get_logger(__name__)
+
+# Page CSS and JS live in static/ and are linked by fingerprinted URL (see static_assets)
+STYLESHEET_LINK = f'<link rel="stylesheet" href="{static_assets.url("css/focused_station.css")}">'
+SCRIPT_TAG = f'<script src="{static_assets.url("js/focused_station.js")}"></script>'
+
+# (display name, weather_data column) of the metrics this page offers
+CLIMATE_METRICS = [
+    ("Precipitation", "precipitation"),
+    ("Evaporation", "evaporation"), 
+    ("Maximum Temperature", "maxtemp"),
+    ("Minimum Temperature", "mintemp"),
+    ("Humidity 9AM", "humid09"),
+    ("Humidity 3PM", "humid15"),
+    ("Sunshine Hours", "sunshine"),
+    ("Rain Days", "raindaysnum")
+]
 
 def get_page_html(form_data):
     """
@@ -16,7 +45,7 @@ def get_page_html(form_data):
     
     # Get available data for dropdowns
     try:
-        conn = sqlite3.connect("climate.db")
+        conn = db_utils.connect()
         cur = conn.cursor()
         
         # Test if database is accessible
@@ -51,16 +80,7 @@ def get_page_html(form_data):
         database_error = f"Cannot access database: {str(e)}. Using sample data for demonstration."
     
     # Get all available climate metrics (from weather_data table schema)
-    climate_metrics = [
-        ("Precipitation", "precipitation"),
-        ("Evaporation", "evaporation"), 
-        ("Maximum Temperature", "maxtemp"),
-        ("Minimum Temperature", "mintemp"),
-        ("Humidity 9AM", "humid09"),
-        ("Humidity 3PM", "humid15"),
-        ("Sunshine Hours", "sunshine"),
-        ("Rain Days", "raindaysnum")
-    ]
+    climate_metrics = CLIMATE_METRICS
     
     # Form values for preservation
     selected_state = form_data.get("state", "") if form_data else ""
@@ -73,6 +93,7 @@ def get_page_html(form_data):
     # Process form submission
     station_data = None
     climate_data = None
+    next_cursor = None
     error_message = None
     
     if form_data and selected_state and start_latitude and end_latitude and selected_metric:
@@ -84,8 +105,8 @@ def get_page_html(form_data):
             if start_lat >= end_lat:
                 error_message = "Start latitude must be less than end latitude"
             else:
-                station_data, climate_data = get_filtered_data(
-                    selected_state, start_lat, end_lat, selected_metric, sort_column, sort_order
+                station_data, climate_data, next_cursor = get_filtered_data(
+                    selected_state, start_lat, end_lat, selected_metric, sort_column, sort_order, form_data
                 )
                 
                 if station_data is None and climate_data is None:
@@ -105,279 +126,7 @@ def get_page_html(form_data):
     <title>Climate Data by Weather Station - Level 2 Analysis</title>
     <meta charset="UTF-8">
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        * {{
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }}
-        
-        body {{
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            line-height: 1.6;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }}
-        
-        .container {{
-            max-width: 1400px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 15px;
-            box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-            overflow: hidden;
-        }}
-        
-        .header {{
-            background: linear-gradient(45deg, #2c3e50, #34495e);
-            color: white;
-            padding: 30px;
-            text-align: center;
-        }}
-        
-        .header h1 {{
-            font-size: 2.5rem;
-            margin-bottom: 10px;
-        }}
-        
-        .header p {{
-            font-size: 1.1rem;
-            opacity: 0.9;
-        }}
-        
-        .form-container {{
-            padding: 30px;
-            background: #f8f9fa;
-            border-bottom: 1px solid #e9ecef;
-        }}
-        
-        .form-section {{
-            background: white;
-            padding: 25px;
-            border-radius: 10px;
-            margin-bottom: 20px;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1);
-        }}
-        
-        .form-section h3 {{
-            color: #2c3e50;
-            margin-bottom: 20px;
-            border-bottom: 2px solid #3498db;
-            padding-bottom: 10px;
-        }}
-        
-        .form-row {{
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-            gap: 20px;
-            margin-bottom: 20px;
-        }}
-        
-        .form-group {{
-            display: flex;
-            flex-direction: column;
-        }}
-        
-        label {{
-            font-weight: 600;
-            color: #2c3e50;
-            margin-bottom: 8px;
-            font-size: 0.95rem;
-        }}
-        
-        select, input[type="number"] {{
-            padding: 12px;
-            border: 2px solid #e9ecef;
-            border-radius: 8px;
-            font-size: 1rem;
-            transition: all 0.3s ease;
-        }}
-        
-        select:focus, input:focus {{
-            outline: none;
-            border-color: #3498db;
-            box-shadow: 0 0 10px rgba(52, 152, 219, 0.2);
-        }}
-        
-        .btn {{
-            background: linear-gradient(45deg, #3498db, #2980b9);
-            color: white;
-            border: none;
-            padding: 15px 30px;
-            border-radius: 8px;
-            cursor: pointer;
-            font-size: 1.1rem;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-        }}
-        
-        .btn:hover {{
-            transform: translateY(-2px);
-            box-shadow: 0 5px 15px rgba(52, 152, 219, 0.4);
-        }}
-        
-        .results-container {{
-            padding: 30px;
-        }}
-        
-        .results-summary {{
-            background: linear-gradient(45deg, #27ae60, #2ecc71);
-            color: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 25px;
-            text-align: center;
-        }}
-        
-        .error {{
-            background: #e74c3c;
-            color: white;
-            padding: 15px;
-            border-radius: 8px;
-            margin: 20px 0;
-            text-align: center;
-        }}
-        
-        .data-tables {{
-            display: grid;
-            gap: 30px;
-        }}
-        
-        .table-section {{
-            background: white;
-            border-radius: 10px;
-            box-shadow: 0 5px 15px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }}
-        
-        .table-header {{
-            background: #34495e;
-            color: white;
-            padding: 20px;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        
-        .table-header h3 {{
-            margin: 0;
-            font-size: 1.3rem;
-        }}
-        
-        .sort-info {{
-            font-size: 0.9rem;
-            opacity: 0.9;
-        }}
-        
-        .table-container {{
-            overflow-x: auto;
-            max-height: 600px;
-            overflow-y: auto;
-        }}
-        
-        table {{
-            width: 100%;
-            border-collapse: collapse;
-            font-size: 0.95rem;
-        }}
-        
-        th, td {{
-            padding: 12px 15px;
-            text-align: left;
-            border-bottom: 1px solid #e9ecef;
-        }}
-        
-        th {{
-            background: #f8f9fa;
-            font-weight: 600;
-            color: #2c3e50;
-            position: sticky;
-            top: 0;
-            z-index: 10;
-        }}
-        
-        th a {{
-            color: #2c3e50;
-            text-decoration: none;
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-        }}
-        
-        th a:hover {{
-            color: #3498db;
-        }}
-        
-        .sort-arrow {{
-            margin-left: 5px;
-            font-size: 0.8rem;
-        }}
-        
-        tbody tr:hover {{
-            background: #f8f9fa;
-        }}
-        
-        .station-id {{
-            font-weight: 600;
-            color: #3498db;
-        }}
-        
-        .coordinates {{
-            font-family: 'Courier New', monospace;
-            font-size: 0.9rem;
-        }}
-        
-        .climate-value {{
-            font-weight: 600;
-        }}
-        
-        .climate-positive {{
-            color: #27ae60;
-        }}
-        
-        .climate-negative {{
-            color: #e74c3c;
-        }}
-        
-        .nav-links {{
-            background: #2c3e50;
-            color: white;
-            padding: 15px 30px;
-            text-align: center;
-        }}
-        
-        .nav-links a {{
-            color: #3498db;
-            text-decoration: none;
-            margin: 0 15px;
-            font-weight: 500;
-        }}
-        
-        .nav-links a:hover {{
-            color: white;
-        }}
-        
-        @media (max-width: 768px) {{
-            .header h1 {{
-                font-size: 1.8rem;
-            }}
-            
-            .form-row {{
-                grid-template-columns: 1fr;
-            }}
-            
-            .table-container {{
-                font-size: 0.85rem;
-            }}
-            
-            th, td {{
-                padding: 8px 10px;
-            }}
-        }}
-    </style>
+    {STYLESHEET_LINK}
 </head>
 <body>
     <div class="container">
@@ -476,7 +225,7 @@ def get_page_html(form_data):
             <div class="results-summary">
                 <h2>📊 Analysis Results</h2>
                 <p><strong>State:</strong> {selected_state} | <strong>Latitude Range:</strong> {start_latitude}° to {end_latitude}° | <strong>Metric:</strong> {metric_display}</p>
-                <p><strong>Weather Stations Found:</strong> {len(station_data)} | <strong>Climate Records:</strong> {len(climate_data)}</p>
+                <p><strong>Weather Stations Found:</strong> {len(station_data)} | <strong>Climate Records Loaded:</strong> <span id="climate-record-count">{len(climate_data)}</span></p>
             </div>
             
             <div class="data-tables">
@@ -495,22 +244,14 @@ def get_page_html(form_data):
                                     <th><a href="javascript:void(0)" onclick="sortTable('site_id')">Station ID {get_sort_arrow('site_id', sort_column, sort_order)}</a></th>
                                     <th><a href="javascript:void(0)" onclick="sortTable('name')">Station Name {get_sort_arrow('name', sort_column, sort_order)}</a></th>
                                     <th><a href="javascript:void(0)" onclick="sortTable('latitude')">Latitude {get_sort_arrow('latitude', sort_column, sort_order)}</a></th>
-                                    <th><a href="javascript:void(0)" onclick="sortTable('longitude')">Longitude {get_sort_arrow('longitude', sort_order)}</a></th>
+                                    <th><a href="javascript:void(0)" onclick="sortTable('longitude')">Longitude {get_sort_arrow('longitude', sort_column, sort_order)}</a></th>
                                     <th><a href="javascript:void(0)" onclick="sortTable('region')">Region {get_sort_arrow('region', sort_column, sort_order)}</a></th>
                                 </tr>
                             </thead>
                             <tbody>"""
         
         # Add station data rows
-        for station in station_data:
-            page_html += f"""
-                                <tr>
-                                    <td class="station-id">{station[0]}</td>
-                                    <td>{station[1]}</td>
-                                    <td class="coordinates">{station[2]:.4f}°</td>
-                                    <td class="coordinates">{station[3]:.4f}°</td>
-                                    <td>{station[5]}</td>
-                                </tr>"""
+        page_html += STATION_ROWS_TEMPLATE.render(stations=station_data)
         
         page_html += f"""
                             </tbody>
@@ -522,7 +263,7 @@ def get_page_html(form_data):
                 <div class="table-section">
                     <div class="table-header">
                         <h3>🌡️ Climate Data for {metric_display}</h3>
-                        <div class="sort-info">Recent data sample (latest 100 records)</div>
+                        <div class="sort-info">Newest records first</div>
                     </div>
                     <div class="table-container">
                         <table>
@@ -535,32 +276,27 @@ def get_page_html(form_data):
                                     <th>Data Quality</th>
                                 </tr>
                             </thead>
-                            <tbody>"""
+                            <tbody id="climate-rows">"""
         
-        # Add climate data rows (limit to recent 100 records for performance)
-        for record in climate_data[:100]:
-            climate_value = record[3] if record[3] is not None else "N/A"
-            quality = record[4] if record[4] is not None else "Unknown"
-            
-            # Style climate values
-            value_class = ""
-            if isinstance(climate_value, (int, float)):
-                value_class = "climate-positive" if climate_value > 0 else "climate-negative"
-                climate_value = f"{climate_value:.2f}"
-            
-            page_html += f"""
-                                <tr>
-                                    <td class="station-id">{record[0]}</td>
-                                    <td>{record[1]}</td>
-                                    <td>{record[2]}</td>
-                                    <td class="climate-value {value_class}">{climate_value}</td>
-                                    <td>{quality}</td>
-                                </tr>"""
+        # The first page of climate rows; "Load more" fetches the next ones from /focused-station/climate-data
+        page_html += CLIMATE_ROWS_TEMPLATE.render(records=[format_climate_record(record) for record in climate_data[:config.CLIMATE_PAGE_SIZE]])
         
         page_html += """
                             </tbody>
                         </table>
-                    </div>
+                    </div>"""
+        if next_cursor:
+            exclude_attribute = ""
+            if quality_flags.FORM_FIELD in form_data:
+                exclude_attribute = f' data-exclude-quality="{",".join(quality_flags.get_exclude(form_data))}"'
+            page_html += f"""
+                    <div style="text-align: center; margin-top: 15px;">
+                        <button type="button" id="load-more-climate" class="btn"
+                                data-state="{selected_state}" data-metric="{selected_metric}"
+                                data-start-lat="{start_latitude}" data-end-lat="{end_latitude}"
+                                data-cursor="{next_cursor}"{exclude_attribute}>Load more records</button>
+                    </div>"""
+        page_html += """
                 </div>
             </div>
         </div>"""
@@ -575,70 +311,44 @@ def get_page_html(form_data):
         </div>
     </div>
     
-    <script>
-        function sortTable(column) {
-            const form = document.querySelector('form');
-            const sortInput = document.querySelector('input[name="sort"]');
-            const orderInput = document.querySelector('input[name="order"]');
-            
-            // Toggle order if same column, otherwise default to ascending
-            if (sortInput.value === column) {
-                orderInput.value = orderInput.value === 'asc' ? 'desc' : 'asc';
-            } else {
-                orderInput.value = 'asc';
-            }
-            
-            sortInput.value = column;
-            form.submit();
-        }
-        
-        // Form validation
-        document.querySelector('form').addEventListener('submit', function(e) {
-            const startLat = parseFloat(document.getElementById('start_latitude').value);
-            const endLat = parseFloat(document.getElementById('end_latitude').value);
-            
-            if (startLat >= endLat) {
-                alert('Start latitude must be less than end latitude');
-                e.preventDefault();
-                return false;
-            }
-            
-            if (startLat < -50 || startLat > 0 || endLat < -50 || endLat > 0) {
-                alert('Latitude values must be between -50 and 0 (Australian coordinates)');
-                e.preventDefault();
-                return false;
-            }
-        });
-        
-        // Auto-populate example values based on state selection
-        document.getElementById('state').addEventListener('change', function() {
-            const state = this.value;
-            const startLat = document.getElementById('start_latitude');
-            const endLat = document.getElementById('end_latitude');
-            
-            // Provide example latitude ranges for different states
-            const stateLatRanges = {
-                'W.A.': {start: -35.0, end: -13.0},
-                'N.T.': {start: -26.0, end: -11.0},
-                'QLD': {start: -29.0, end: -9.0},
-                'N.S.W.': {start: -37.5, end: -28.0},
-                'VIC': {start: -39.2, end: -34.0},
-                'S.A.': {start: -38.0, end: -26.0},
-                'TAS': {start: -43.7, end: -40.0}
-            };
-            
-            if (state && stateLatRanges[state] && !startLat.value && !endLat.value) {
-                startLat.value = stateLatRanges[state].start;
-                endLat.value = stateLatRanges[state].end;
-            }
-        });
-    </script>
+    """ + SCRIPT_TAG + """
 </body>
 </html>"""
     
     return page_html
 
 
+def format_climate_record(record):
+    """(station id, name, date, value CSS class, display value, quality) for one climate table row"""
+    climate_value = record[3] if record[3] is not None else "N/A"
+    quality = record[4] if record[4] is not None else "Unknown"
+
+    # Style climate values
+    value_class = ""
+    if isinstance(climate_value, (int, float)):
+        value_class = "climate-positive" if climate_value > 0 else "climate-negative"
+        climate_value = f"{climate_value:.2f}"
+    return record[0], record[1], record[2], value_class, climate_value, quality
+
+# Result table rows, compiled once at import
+STATION_ROWS_TEMPLATE = Template("""{% for station in stations %}
+                                <tr>
+                                    <td class="station-id">{{ station[0] }}</td>
+                                    <td>{{ station[1] }}</td>
+                                    <td class="coordinates">{{ format(station[2], ".4f") }}°</td>
+                                    <td class="coordinates">{{ format(station[3], ".4f") }}°</td>
+                                    <td>{{ station[5] }}</td>
+                                </tr>{% endfor %}""", "focused station rows")
+
+CLIMATE_ROWS_TEMPLATE = Template("""{% for station_id, name, date, value_class, value, quality in records %}
+                                <tr>
+                                    <td class="station-id">{{ station_id }}</td>
+                                    <td>{{ name }}</td>
+                                    <td>{{ date }}</td>
+                                    <td class="climate-value {{ value_class }}">{{ value }}</td>
+                                    <td>{{ quality }}</td>
+                                </tr>{% endfor %}""", "focused climate rows")
+
 def get_sort_arrow(column, current_sort, current_order):
     """Generate sort arrow for table headers"""
     if column == current_sort:
@@ -646,13 +356,15 @@ def get_sort_arrow(column, current_sort, current_order):
     return "↕"
 
 
-def get_filtered_data(state, start_lat, end_lat, metric, sort_column, sort_order):
+def get_filtered_data(state, start_lat, end_lat, metric, sort_column, sort_order, form_data=None):
     """
     Retrieve filtered weather station and climate data based on user selections
     Demonstrates SQL SELECT, FILTER, SORT, JOIN operations with data anomaly handling
+    form_data may carry the shared exclude_quality option
+    Returns the stations, the first page of climate rows and the cursor of the next page
     """
     try:
-        conn = sqlite3.connect("climate.db")
+        conn = db_utils.connect()
         cur = conn.cursor()
         
         # Test database connection
@@ -660,7 +372,7 @@ def get_filtered_data(state, start_lat, end_lat, metric, sort_column, sort_order
         if not cur.fetchone():
             conn.close()
             # Return sample data for demonstration
-            return get_sample_data(state, start_lat, end_lat, metric)
+            return (*get_sample_data(state, start_lat, end_lat, metric), None)
         
         # Table 1: Get weather stations in the selected state and latitude range
         station_query = """
@@ -683,60 +395,165 @@ def get_filtered_data(state, start_lat, end_lat, metric, sort_column, sort_order
         
         if not station_data:
             conn.close()
-            return None, None
-        
-        # Get station IDs for climate data query
-        station_ids = [str(station[0]) for station in station_data]
-        placeholders = ','.join(['?' for _ in station_ids])
+            return None, None, None
         
+
         # Check if weather_data table exists
         cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='weather_data'")
         if not cur.fetchone():
             conn.close()
             # Return station data with sample climate data
             sample_climate = get_sample_climate_data(station_data, metric)
-            return station_data, sample_climate
+            return station_data, sample_climate, None
         
-        # Table 2: Get climate data with basic anomaly handling
-        climate_query = f"""
-            SELECT 
-                wd.location,
-                ws.name,
-                wd.DMY,
-                CASE 
-                    WHEN wd.{metric} IS NULL THEN NULL
-                    WHEN wd.{metric}Qual = 'W' THEN NULL  -- Remove wrong data
-                    ELSE wd.{metric}
-                END as cleaned_metric,
-                CASE 
-                    WHEN wd.{metric} IS NULL THEN 'Missing Data'
-                    WHEN wd.{metric}Qual = 'W' THEN 'Wrong Data (Removed)'
-                    WHEN wd.{metric}Qual = 'Y' THEN 'Quality Controlled'
-                    WHEN wd.{metric}Qual = 'S' THEN 'Suspect Data'
-                    WHEN wd.{metric}Qual = 'N' THEN 'Not Quality Controlled'
-                    ELSE COALESCE(wd.{metric}Qual, 'Unknown')
-                END as quality_status
-            FROM weather_data wd
-            JOIN weather_station ws ON wd.location = ws.site_id
-            WHERE wd.location IN ({placeholders})
-              AND wd.DMY != ''
-              AND wd.DMY IS NOT NULL
-            ORDER BY wd.DMY DESC, wd.location
-            LIMIT 1000
-        """
-        
-        cur.execute(climate_query, station_ids)
-        climate_data = cur.fetchall()
+        # Table 2: First page of climate data with basic anomaly handling, as the
+        # climate-data endpoint serves the pages after it
+        quality = page_quality_filter(conn, form_data)
+        stations = {station[0]: station[1] for station in station_data}
+        climate_data, next_cursor = read_climate_page(conn, stations, metric, quality)
         
         conn.close()
-        return station_data, climate_data
+        return station_data, climate_data, next_cursor
         
     except sqlite3.DatabaseError:
         # Database file is corrupted or not accessible
-        return get_sample_data(state, start_lat, end_lat, metric)
+        return (*get_sample_data(state, start_lat, end_lat, metric), None)
     except Exception as e:
-        print(f"Database error: {e}")
-        return None, None
+        logger.warning("Database error: %s", e)
+        return None, None, None
+
+
+def page_quality_filter(conn, form_data):
+    """The request's quality exclusions; this page always removes wrong (W) data"""
+    exclude = quality_flags.parse_exclude(["W", *quality_flags.get_exclude(form_data or {})])
+    return quality_flags.QualityFilter.for_connection(conn, exclude)
+
+
+def cleaned_metric_sql(metric, quality, table="wd"):
+    """SQL for a metric value with readings whose flags are excluded removed"""
+    return quality.value_sql(metric, table)
+
+
+def quality_status_sql(metric, quality, table="wd"):
+    """SQL for a readable label of a metric's quality flag"""
+    if quality.materialized:
+        code = f"{table}.{quality_flags.code_column(metric)}"
+        codes = quality_flags.QUALITY_CODES
+        return f"""CASE {code}
+                    WHEN {quality_flags.MISSING_CODE} THEN 'Missing Data'
+                    WHEN {codes["W"]} THEN 'Wrong Data (Removed)'
+                    WHEN {codes["Y"]} THEN 'Quality Controlled'
+                    WHEN {codes["S"]} THEN 'Suspect Data'
+                    WHEN {codes["N"]} THEN 'Not Quality Controlled'
+                    ELSE COALESCE({table}.{metric}Qual, 'Unknown')
+                END"""
+    return f"""CASE 
+                    WHEN {table}.{metric} IS NULL THEN 'Missing Data'
+                    WHEN {table}.{metric}Qual = 'W' THEN 'Wrong Data (Removed)'
+                    WHEN {table}.{metric}Qual = 'Y' THEN 'Quality Controlled'
+                    WHEN {table}.{metric}Qual = 'S' THEN 'Suspect Data'
+                    WHEN {table}.{metric}Qual = 'N' THEN 'Not Quality Controlled'
+                    ELSE COALESCE({table}.{metric}Qual, 'Unknown')
+                END"""
+
+
+def encode_cursor(date, location):
+    """Opaque keyset cursor for the row (date, location) a page ended on"""
+    return base64.urlsafe_b64encode(f"{date}|{location}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    padded = cursor + "=" * (-len(cursor) % 4)
+    date, location = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+    return date, int(location)
+
+
+def iter_station_climate_rows(cur, station_id, metric, quality, after):
+    """
+    One station's climate rows, newest first, after the keyset cursor `after`
+    Each query is a range seek on the (location, DMY) index
+    """
+    date_test = ""
+    params = [station_id]
+    if after is not None:
+        after_date, after_location = after
+        # Rows are ordered (DMY DESC, location ASC): this station's row on the cursor's
+        # date comes after the cursor only if the station sorts after the cursor's station
+        date_test = "AND wd.DMY <= ?" if station_id > after_location else "AND wd.DMY < ?"
+        params.append(after_date)
+    cur.execute(f"""
+        SELECT wd.DMY, wd.location, {cleaned_metric_sql(metric, quality)}, {quality_status_sql(metric, quality)}
+        FROM weather_data wd
+        WHERE wd.location = ?
+          AND wd.DMY IS NOT NULL AND wd.DMY != ''
+          {date_test}
+        ORDER BY wd.DMY DESC
+    """, params)
+    return cur
+
+
+def read_climate_page(conn, stations, metric, quality, after=None, page_size=None):
+    """
+    One page of climate rows (location, name, date, value, quality) of the stations
+    ({site_id: name}), newest first, after the keyset cursor `after`, and the cursor of
+    the next page (None on the last). Stations are read lazily and merged, so memory and
+    time per page depend on the page size, not on how far into the data the cursor is.
+    """
+    page_size = page_size or config.CLIMATE_PAGE_SIZE
+    # k-way merge of the per-station streams, in (DMY DESC, location ASC) order
+    streams = [iter_station_climate_rows(conn.cursor(), station_id, metric, quality, after)
+               for station_id in stations]
+    merged = heapq.merge(*streams, key=lambda row: (row[0], -row[1]), reverse=True)
+    rows = list(itertools.islice(merged, page_size + 1))
+
+    next_cursor = encode_cursor(rows[page_size - 1][0], rows[page_size - 1][1]) if len(rows) > page_size else None
+    return [(location, stations[location], date, value, status)
+            for date, location, value, status in rows[:page_size]], next_cursor
+
+
+def get_climate_data_page(form_data):
+    """
+    JSON endpoint: one page of the climate data table for the selected state, latitude
+    band and metric, newest first. Pass the returned next_cursor back as `cursor` to
+    get the following page; the focused page renders the first one and its "Load more"
+    button asks for the rest.
+    """
+    state = pyhtml.form_value(form_data, "state")
+    metric = pyhtml.form_value(form_data, "metric")
+    cursor = pyhtml.form_value(form_data, "cursor")
+    if not state or metric not in dict((value, name) for name, value in CLIMATE_METRICS):
+        raise pyhtml.EndpointError(400, "state and a valid metric are required")
+    try:
+        start_lat = float(pyhtml.form_value(form_data, "start_lat", "-90"))
+        end_lat = float(pyhtml.form_value(form_data, "end_lat", "90"))
+        page_size = int(pyhtml.form_value(form_data, "page_size", config.CLIMATE_PAGE_SIZE))
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise pyhtml.EndpointError(400, "Invalid latitude, page_size or cursor")
+    page_size = max(1, min(page_size, config.CLIMATE_PAGE_SIZE_MAX))
+    if start_lat > end_lat:
+        start_lat, end_lat = end_lat, start_lat
+
+    conn = db_utils.connect()
+    try:
+        stations = dict(conn.execute("""
+            SELECT site_id, name FROM weather_station
+            WHERE state = ? AND latitude BETWEEN ? AND ?
+        """, (state, start_lat, end_lat)).fetchall())
+
+        quality = page_quality_filter(conn, form_data)
+        rows, next_cursor = read_climate_page(conn, stations, metric, quality, after, page_size)
+    finally:
+        conn.close()
+
+    return "application/json", serializer.dumps({
+        "rows": [
+            {"location": location, "name": name, "date": date, "value": value, "quality": status}
+            for location, name, date, value, status in rows
+        ],
+        "page_size": page_size,
+        "next_cursor": next_cursor,
+    })
 
 
 def get_sample_data(state, start_lat, end_lat, metric):
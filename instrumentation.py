@@ -0,0 +1,266 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the per-route latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The sqlite3 progress handler fires every N virtual machine instructions
+PROGRESS_HANDLER_STEPS = 1000
+
+enabled = True
+
+_local = threading.local()
+_metrics_lock = threading.Lock()
+_route_metrics = {}
+
+
+class Cancelled(Exception):
+    """Raised inside work whose request (e.g. a background job) has been cancelled"""
+
+
+class RequestProfile:
+    """Timings and counters collected while one request is handled"""
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.sql_time = 0.0
+        self.sql_statements = 0
+        self.sql_rows = 0
+        self.sql_vm_steps = 0
+        self.bytes_written = 0
+        self.coalesced = False
+        # Set by background jobs: progress is polled by the client, cancel aborts running SQL
+        self.progress = None
+        self.progress_message = ""
+        self.cancel_event = None
+        # When a list, every SQL statement run for the request is appended (used by schema_migrations)
+        self.sql_log = None
+
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing_header(self):
+        """Render the phases collected so far as a Server-Timing header value"""
+        entries = [
+            f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.phases.items()
+        ]
+        if self.sql_statements:
+            entries.append(
+                f'sql;dur={self.sql_time * 1000:.1f};'
+                f'desc="{self.sql_statements} statements, {self.sql_rows} rows"'
+            )
+        if self.coalesced:
+            entries.append('coalesced;desc="shared an in-flight computation"')
+        entries.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ", ".join(entries)
+
+
+def current_profile():
+    """Profile of the request being handled on this thread, or None"""
+    return getattr(_local, "profile", None)
+
+def start_request(route):
+    profile = RequestProfile(route)
+    _local.profile = profile
+    return profile
+
+def finish_request():
+    """Close the current request's profile and fold it into the per-route metrics"""
+    profile = current_profile()
+    if profile is None:
+        return None
+    _local.profile = None
+    record_request(profile.route, profile.elapsed(), profile)
+    return profile
+
+@contextmanager
+def phase(name):
+    """Time a block of work as a named phase of the current request"""
+    profile = current_profile()
+    if profile is None or not enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_phase(name, time.perf_counter() - start)
+
+def mark_coalesced():
+    """Note that the current request reused another request's in-flight result"""
+    profile = current_profile()
+    if profile is not None:
+        profile.coalesced = True
+
+def report_progress(fraction, message=""):
+    """Record how far the current request's work has got (shown by the job status endpoint)"""
+    profile = current_profile()
+    if profile is not None:
+        profile.progress = max(0.0, min(1.0, fraction))
+        profile.progress_message = message
+
+def check_cancelled():
+    """Raise Cancelled if the current request has been cancelled"""
+    profile = current_profile()
+    if profile is not None and profile.cancelled():
+        raise Cancelled()
+
+def add_bytes_written(count):
+    profile = current_profile()
+    if profile is not None:
+        profile.bytes_written += count
+
+
+# ---------------------------------------------------------------------------
+# SQLite instrumentation
+# ---------------------------------------------------------------------------
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that charges execute/fetch time and fetched rows to the current request"""
+    def _charge(self, start, rows=0):
+        profile = current_profile()
+        if profile is not None:
+            profile.sql_time += time.perf_counter() - start
+            profile.sql_rows += rows
+
+    def execute(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args, **kwargs)
+        finally:
+            self._charge(start)
+
+    def executemany(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args, **kwargs)
+        finally:
+            self._charge(start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._charge(start, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._charge(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._charge(start, len(rows))
+        return rows
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors are instrumented (pass as factory= to sqlite3.connect)"""
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+
+def _trace_statement(statement):
+    profile = current_profile()
+    if profile is not None:
+        profile.sql_statements += 1
+        if profile.sql_log is not None:
+            profile.sql_log.append(statement)
+
+def _progress_step():
+    profile = current_profile()
+    if profile is None:
+        return 0
+    profile.sql_vm_steps += PROGRESS_HANDLER_STEPS
+    # A non-zero return aborts the running query with OperationalError("interrupted")
+    return 1 if profile.cancelled() else 0
+
+def attach(conn):
+    """Hook the sqlite3 trace and progress callbacks of a connection into the request profile"""
+    if enabled:
+        conn.set_trace_callback(_trace_statement)
+        conn.set_progress_handler(_progress_step, PROGRESS_HANDLER_STEPS)
+    return conn
+
+
+# ---------------------------------------------------------------------------
+# Per-route metrics
+# ---------------------------------------------------------------------------
+
+def _new_route_metrics():
+    return {
+        "buckets": [0] * len(LATENCY_BUCKETS),
+        "count": 0,
+        "sum": 0.0,
+        "sql_seconds": 0.0,
+        "sql_statements": 0,
+        "sql_rows": 0,
+        "sql_vm_steps": 0,
+        "bytes_written": 0,
+        "coalesced": 0,
+    }
+
+def record_request(route, seconds, profile=None):
+    with _metrics_lock:
+        metrics = _route_metrics.setdefault(route, _new_route_metrics())
+        metrics["count"] += 1
+        metrics["sum"] += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                metrics["buckets"][i] += 1
+        if profile is not None:
+            metrics["sql_seconds"] += profile.sql_time
+            metrics["sql_statements"] += profile.sql_statements
+            metrics["sql_rows"] += profile.sql_rows
+            metrics["sql_vm_steps"] += profile.sql_vm_steps
+            metrics["bytes_written"] += profile.bytes_written
+            metrics["coalesced"] += int(profile.coalesced)
+
+def reset_metrics():
+    with _metrics_lock:
+        _route_metrics.clear()
+
+def render_metrics():
+    """Per-route metrics in the Prometheus text exposition format"""
+    with _metrics_lock:
+        snapshot = {route: dict(m, buckets=list(m["buckets"])) for route, m in _route_metrics.items()}
+
+    lines = [
+        "# HELP climate_request_duration_seconds Time to handle a request, by route.",
+        "# TYPE climate_request_duration_seconds histogram",
+    ]
+    for route, m in sorted(snapshot.items()):
+        for bound, count in zip(LATENCY_BUCKETS, m["buckets"]):
+            lines.append(f'climate_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}')
+        lines.append(f'climate_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {m["count"]}')
+        lines.append(f'climate_request_duration_seconds_sum{{route="{route}"}} {m["sum"]:.6f}')
+        lines.append(f'climate_request_duration_seconds_count{{route="{route}"}} {m["count"]}')
+
+    counters = [
+        ("climate_sql_seconds_total", "sql_seconds", "Time spent executing and fetching SQL."),
+        ("climate_sql_statements_total", "sql_statements", "SQL statements executed."),
+        ("climate_sql_rows_total", "sql_rows", "Rows fetched from SQLite."),
+        ("climate_sql_vm_steps_total", "sql_vm_steps", "Approximate SQLite virtual machine steps."),
+        ("climate_response_bytes_total", "bytes_written", "Response body bytes written to the socket."),
+        ("climate_coalesced_requests_total", "coalesced", "Requests answered by an identical in-flight request."),
+    ]
+    for name, key, help_text in counters:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for route, m in sorted(snapshot.items()):
+            value = m[key]
+            value = f"{value:.6f}" if isinstance(value, float) else str(value)
+            lines.append(f'{name}{{route="{route}"}} {value}')
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,200 @@
+"""
+In-process background jobs for long analyses and exports
+
+A page form is submitted to /jobs/submit (with a "route" field naming the page,
+e.g. route=/similarity) and answered immediately with a job ID. The page then runs
+on a bounded pool of worker threads while the browser polls:
+
+    /jobs/status?id=...   state, progress and SQL work done so far (JSON)
+    /jobs/cancel?id=...   stop a queued job, or abort a running one's SQL
+    /jobs/result?id=...   the finished page or CSV, exactly as the page would return it
+
+Jobs live in the memory of the process that accepted them, so with CLIMATE_WORKERS > 1
+the job endpoints are only reliable when a client keeps talking to the same worker.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import instrumentation
+import pyhtml
+import serializer
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class Job:
+    def __init__(self, route, form_data):
+        self.id = uuid.uuid4().hex
+        self.route = route
+        self.form_data = form_data
+        self.state = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.response = None
+        self.cancel_event = threading.Event()
+        self.profile = None
+        self.future = None
+
+    def status(self):
+        status = {
+            "id": self.id,
+            "route": self.route,
+            "state": self.state,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        profile = self.profile
+        if profile is not None:
+            status["progress"] = 1.0 if self.state == DONE else profile.progress
+            status["message"] = profile.progress_message
+            status["elapsed"] = round((self.finished or time.time()) - self.started, 3)
+            status["sql_statements"] = profile.sql_statements
+            status["sql_rows"] = profile.sql_rows
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class JobQueue:
+    """Bounded pool of worker threads running page renders, plus the jobs they produced"""
+    def __init__(self, workers, max_jobs, ttl):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="climate-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, route, form_data):
+        self.expire()
+        with self._lock:
+            if len(self._jobs) >= self.max_jobs:
+                raise pyhtml.EndpointError(503, "Too many background jobs; try again later")
+            job = Job(route, form_data)
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(self._run, job)
+        logger.info("Queued job %s for %s", job.id, route)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise pyhtml.EndpointError(404, "Unknown or expired job")
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        job.cancel_event.set()
+        # A job that has not started yet is dropped from the pool straight away
+        if job.future.cancel():
+            self._finish(job, CANCELLED)
+        return job
+
+    def expire(self):
+        """Forget finished jobs older than the TTL"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.state in FINISHED_STATES and job.finished < cutoff:
+                    del self._jobs[job_id]
+
+    def _finish(self, job, state, error=None):
+        job.state = state
+        job.error = error
+        job.finished = time.time()
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+        job.state = RUNNING
+        job.started = time.time()
+
+        # The job gets its own request profile: SQL is charged to it, and the
+        # progress handler aborts its queries once cancel_event is set
+        profile = instrumentation.start_request("job:" + job.route)
+        profile.cancel_event = job.cancel_event
+        job.profile = profile
+        try:
+            page_module = pyhtml.MyRequestHandler.pages[job.route]
+            response = page_module.get_page_html(job.form_data, *pyhtml.page_args(job.route, job.form_data))
+            # Pages catch their own errors, so an aborted query may still have produced a page
+            if job.cancel_event.is_set():
+                self._finish(job, CANCELLED)
+            else:
+                job.response = pyhtml.page_response(response)
+                self._finish(job, DONE)
+        except Exception as e:
+            if job.cancel_event.is_set():
+                self._finish(job, CANCELLED)
+            else:
+                logger.exception("Job %s for %s failed", job.id, job.route)
+                self._finish(job, FAILED, str(e) or type(e).__name__)
+        finally:
+            instrumentation.finish_request()
+        logger.info("Job %s finished: %s", job.id, job.state)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(config.JOB_WORKERS, config.JOB_MAX, config.JOB_TTL)
+        return _queue
+
+
+def _json(data):
+    return "application/json", serializer.dumps(data)
+
+def submit_endpoint(form_data):
+    form_data = dict(form_data)
+    route = pyhtml.form_value(form_data, "route")
+    form_data.pop("route", None)
+    if route not in pyhtml.MyRequestHandler.pages:
+        raise pyhtml.EndpointError(400, "route must name a page, e.g. route=/similarity")
+    job = get_queue().submit(route, form_data)
+    return _json({
+        "id": job.id,
+        "state": job.state,
+        "status_url": f"/jobs/status?id={job.id}",
+        "result_url": f"/jobs/result?id={job.id}",
+        "cancel_url": f"/jobs/cancel?id={job.id}",
+    })
+
+def status_endpoint(form_data):
+    return _json(get_queue().get(pyhtml.form_value(form_data, "id")).status())
+
+def cancel_endpoint(form_data):
+    return _json(get_queue().cancel(pyhtml.form_value(form_data, "id")).status())
+
+def result_endpoint(form_data):
+    job = get_queue().get(pyhtml.form_value(form_data, "id"))
+    if job.state == FAILED:
+        raise pyhtml.EndpointError(500, f"Job failed: {job.error}")
+    if job.state != DONE:
+        raise pyhtml.EndpointError(409, f"Job is {job.state}")
+    return job.response
+
+ENDPOINTS = {
+    "/jobs/submit": submit_endpoint,
+    "/jobs/status": status_endpoint,
+    "/jobs/cancel": cancel_endpoint,
+    "/jobs/result": result_endpoint,
+}
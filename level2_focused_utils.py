@@ -1,7 +1,10 @@
-import sqlite3
-import json
+import aggregate_cube
+import db_utils
+import quality_flags
+import serializer
 from datetime import datetime
 from collections import defaultdict
+from timeseries_utils import downsample_for_form, encode_timeseries_for_form
 
 def is_number(val):
     try:
@@ -10,6 +13,14 @@ def is_number(val):
     except (TypeError, ValueError):
         return False
 
+def band_covers_state(cur, state, start_lat, end_lat):
+    """True when every station of the state lies in the latitude band"""
+    cur.execute("""
+        SELECT COUNT(*) FROM weather_station
+        WHERE state = ? AND COALESCE(latitude BETWEEN ? AND ?, 0) = 0
+    """, (state, start_lat, end_lat))
+    return cur.fetchone()[0] == 0
+
 def get_focused_climate_data(form_data):
     """Enhanced focused view with state selection, latitude filtering, and sorting"""
     try:
@@ -23,18 +34,20 @@ def get_focused_climate_data(form_data):
         sort_order = form_data.get("sort_order", "ASC")
 
         if not (start_date and end_date and climate_type and selected_state):
-            return json.dumps({"error": "Missing required form fields."})
+            return serializer.dumps({"error": "Missing required form fields."})
 
         start_dt = datetime.strptime(start_date, "%Y-%m-%d")
         end_dt = datetime.strptime(end_date, "%Y-%m-%d")
         if end_dt <= start_dt:
-            return json.dumps({"error": "End date must be later than start date."})
+            return serializer.dumps({"error": "End date must be later than start date."})
 
-        conn = sqlite3.connect("climate.db")
+        conn = db_utils.connect()
         c = conn.cursor()
+        quality = quality_flags.QualityFilter.for_connection(conn, quality_flags.get_exclude(form_data))
 
         # Build the WHERE clause for latitude filtering
         lat_filter = ""
+        whole_state = True
         params = [selected_state, start_date, end_date]
         
         if start_lat and end_lat:
@@ -45,8 +58,9 @@ def get_focused_climate_data(form_data):
                     start_lat_val, end_lat_val = end_lat_val, start_lat_val
                 lat_filter = "AND ws.latitude BETWEEN ? AND ?"
                 params.extend([start_lat_val, end_lat_val])
+                whole_state = band_covers_state(c, selected_state, start_lat_val, end_lat_val)
             except ValueError:
-                return json.dumps({"error": "Invalid latitude values."})
+                return serializer.dumps({"error": "Invalid latitude values."})
 
         # Get detailed station data for table
         detail_query = f"""
@@ -59,7 +73,7 @@ def get_focused_climate_data(form_data):
             JOIN weather_data wd ON ws.site_id = wd.location
             WHERE ws.state = ? 
               AND wd.dmy BETWEEN ? AND ?
-              AND wd.{climate_type} IS NOT NULL
+              AND {quality.value_test(climate_type, 'wd')}
               AND wd.{climate_type} != ''
               {lat_filter}
             GROUP BY ws.name, ws.site_id, ws.latitude, ws.longitude
@@ -84,28 +98,34 @@ def get_focused_climate_data(form_data):
         c.execute(detail_query, params)
         station_details = c.fetchall()
 
-        # Get timeseries data (averaged across all matching stations)
-        timeseries_query = f"""
-            SELECT wd.dmy, AVG(CAST(wd.{climate_type} AS REAL)) as avg_value
-            FROM weather_station ws
-            JOIN weather_data wd ON ws.site_id = wd.location
-            WHERE ws.state = ? 
-              AND wd.dmy BETWEEN ? AND ?
-              AND wd.{climate_type} IS NOT NULL
-              AND wd.{climate_type} != ''
-              {lat_filter}
-            GROUP BY wd.dmy
-            HAVING COUNT(wd.{climate_type}) > 0
-            ORDER BY wd.dmy
-        """
-        
-        c.execute(timeseries_query, params)
-        timeseries_rows = c.fetchall()
+        # Get timeseries data (averaged across all matching stations); the state's daily
+        # averages are pre-aggregated in the cube when the band takes in the whole state
+        if whole_state and aggregate_cube.has_cube(conn):
+            timeseries_rows = aggregate_cube.get_state_daily_averages(
+                conn, selected_state, climate_type, start_date, end_date, quality.exclude)
+        else:
+            timeseries_query = f"""
+                SELECT wd.dmy, AVG(CAST(wd.{climate_type} AS REAL)) as avg_value
+                FROM weather_station ws
+                JOIN weather_data wd ON ws.site_id = wd.location
+                WHERE ws.state = ? 
+                  AND wd.dmy BETWEEN ? AND ?
+                  AND {quality.value_test(climate_type, 'wd')}
+                  AND wd.{climate_type} != ''
+                  {lat_filter}
+                GROUP BY wd.dmy
+                HAVING COUNT(wd.{climate_type}) > 0
+                ORDER BY wd.dmy
+            """
+            
+            c.execute(timeseries_query, params)
+            timeseries_rows = c.fetchall()
 
         timeseries = [
             {"date": date, "value": round(float(value), 2)}
             for date, value in timeseries_rows
         ]
+        timeseries = downsample_for_form(timeseries, form_data)
 
         # Format station details for the table
         stations = []
@@ -132,7 +152,7 @@ def get_focused_climate_data(form_data):
             JOIN weather_data wd ON ws.site_id = wd.location
             WHERE ws.state = ? 
               AND wd.dmy BETWEEN ? AND ?
-              AND wd.{climate_type} IS NOT NULL
+              AND {quality.value_test(climate_type, 'wd')}
               AND wd.{climate_type} != ''
               {lat_filter}
         """
@@ -152,8 +172,8 @@ def get_focused_climate_data(form_data):
 
         conn.close()
 
-        return json.dumps({
-            "timeseries": timeseries,
+        return serializer.dumps({
+            "timeseries": encode_timeseries_for_form(timeseries, form_data),
             "stations": stations,
             "summary": summary,
             "filters": {
@@ -166,11 +186,11 @@ def get_focused_climate_data(form_data):
         })
 
     except Exception as e:
-        return json.dumps({"error": str(e)})
+        return serializer.dumps({"error": str(e)})
 
 def get_available_states():
     """Get list of available states from database"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     c = conn.cursor()
     
     c.execute("SELECT DISTINCT state FROM weather_station WHERE state IS NOT NULL ORDER BY state")
@@ -181,7 +201,7 @@ def get_available_states():
 
 def get_state_lat_range(state):
     """Get latitude range for a specific state"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     c = conn.cursor()
     
     c.execute("""
@@ -1,16 +1,37 @@
-import sqlite3
-import json
+import availability
+import config
+import db_utils
+import instrumentation
+import quality_flags
+import serializer
+import station_catalog
 from datetime import datetime
+import heapq
+import itertools
 import math
+import multiprocessing
+import threading
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from log_utils import get_logger
 
-def debug(msg):
-    """Debug helper function"""
-    print(f"DEBUG: {msg}")
+logger = get_logger(__name__)
+
+# Below this many stations the process pool costs more than it saves
+MIN_STATIONS_FOR_POOL = 50
+CHUNKS_PER_PROCESS = 4
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+def debug(msg, *args):
+    """Debug helper function (lazy: msg is only %-formatted with args when DEBUG is enabled)"""
+    logger.debug(msg, *args)
 
 def get_available_stations():
     """Get list of all available weather stations"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
     
     cur.execute("""
@@ -23,23 +44,30 @@ def get_available_stations():
     conn.close()
     return stations
 
-def get_station_metrics_data(station_id, metric, start_date, end_date):
-    """Get metric data for a specific station and time period"""
-    conn = sqlite3.connect("climate.db")
+def get_station_metrics_data(station_id, metric, start_date, end_date, conn=None, quality=None):
+    """
+    Get metric data for a specific station and time period (optionally on an open connection)
+    quality is a quality_flags.QualityFilter; by default every non-NULL value is used
+    """
+    quality = quality or quality_flags.QualityFilter()
+    own_connection = conn is None
+    if own_connection:
+        conn = db_utils.connect()
     cur = conn.cursor()
     
     query = f"""
         SELECT DMY, {metric}
         FROM weather_data
         WHERE location = ?
-          AND {metric} IS NOT NULL
+          AND {quality.value_test(metric)}
           AND DMY BETWEEN ? AND ?
         ORDER BY DMY
     """
     
     cur.execute(query, (station_id, start_date, end_date))
     data = cur.fetchall()
-    conn.close()
+    if own_connection:
+        conn.close()
     
     # Convert to numeric values
     result = []
@@ -85,12 +113,163 @@ def calculate_similarity_score(ref_primary_change, ref_secondary_change,
     
     return distance
 
+def get_station_period_stats(station_id, primary_metric, secondary_metric,
+                             period1_start, period1_end, period2_start, period2_end, conn=None, quality=None):
+    """Period averages, record counts and rates of change of both metrics for one station"""
+    primary_period1 = get_station_metrics_data(station_id, primary_metric, period1_start, period1_end, conn, quality)
+    primary_period2 = get_station_metrics_data(station_id, primary_metric, period2_start, period2_end, conn, quality)
+    secondary_period1 = get_station_metrics_data(station_id, secondary_metric, period1_start, period1_end, conn, quality)
+    secondary_period2 = get_station_metrics_data(station_id, secondary_metric, period2_start, period2_end, conn, quality)
+
+    primary_period1_avg = calculate_average(primary_period1)
+    primary_period2_avg = calculate_average(primary_period2)
+    secondary_period1_avg = calculate_average(secondary_period1)
+    secondary_period2_avg = calculate_average(secondary_period2)
+
+    return {
+        "primary_change": calculate_rate_of_change(primary_period1_avg, primary_period2_avg),
+        "secondary_change": calculate_rate_of_change(secondary_period1_avg, secondary_period2_avg),
+        "primary_period1_avg": primary_period1_avg,
+        "primary_period2_avg": primary_period2_avg,
+        "secondary_period1_avg": secondary_period1_avg,
+        "secondary_period2_avg": secondary_period2_avg,
+        "period1_records": len(primary_period1) + len(secondary_period1),
+        "period2_records": len(primary_period2) + len(secondary_period2)
+    }
+
+def score_station_chunk(stations, ref_primary_change, ref_secondary_change,
+                        primary_metric, secondary_metric,
+                        period1_start, period1_end, period2_start, period2_end,
+                        top_k, database=None, quality=None):
+    """
+    Score a chunk of stations against the reference and return the chunk's top_k
+    Runs in a worker process, so it opens its own connection
+    """
+    conn = db_utils.connect(database)
+    station_similarities = []
+    try:
+        for station_row in stations:
+            station_id, name, lat, lon, state, region = station_row
+
+            try:
+                stats = get_station_period_stats(
+                    station_id, primary_metric, secondary_metric,
+                    period1_start, period1_end, period2_start, period2_end, conn, quality
+                )
+
+                # Skip if insufficient data
+                if stats["primary_change"] is None or stats["secondary_change"] is None:
+                    continue
+
+                # Calculate similarity score
+                similarity_score = calculate_similarity_score(
+                    ref_primary_change, ref_secondary_change,
+                    stats["primary_change"], stats["secondary_change"]
+                )
+
+                station_similarities.append({
+                    "station_id": station_id,
+                    "name": name,
+                    "latitude": lat,
+                    "longitude": lon,
+                    "state": state,
+                    "region": region,
+                    "primary_change": stats["primary_change"],
+                    "secondary_change": stats["secondary_change"],
+                    "primary_period1_avg": stats["primary_period1_avg"],
+                    "primary_period2_avg": stats["primary_period2_avg"],
+                    "secondary_period1_avg": stats["secondary_period1_avg"],
+                    "secondary_period2_avg": stats["secondary_period2_avg"],
+                    "period1_records": stats["period1_records"],
+                    "period2_records": stats["period2_records"],
+                    "similarity_score": similarity_score
+                })
+
+            except Exception as e:
+                debug("Error processing station %s: %s", station_id, e)
+                continue
+    finally:
+        conn.close()
+
+    # nsmallest is stable, so ties keep site_id order as a full sort would
+    return heapq.nsmallest(top_k, station_similarities, key=lambda x: x["similarity_score"])
+
+def get_process_pool():
+    """Shared process pool for similarity scoring, or None when it is disabled"""
+    global _process_pool
+    if config.SIMILARITY_PROCESSES <= 1:
+        return None
+    # Request threads may get here together; only one of them creates the pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            # Forked workers would inherit the server's threads and locks (the request threads,
+            # job runner and log handlers) in whatever state they were in; forkserver (or
+            # spawn where there is none, e.g. Windows) starts them from a clean process instead
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _process_pool = ProcessPoolExecutor(max_workers=config.SIMILARITY_PROCESSES,
+                                                mp_context=multiprocessing.get_context(start_method))
+        return _process_pool
+
+def split_into_chunks(items, num_chunks):
+    """Split items into at most num_chunks contiguous, roughly equal chunks"""
+    num_chunks = max(1, min(num_chunks, len(items)))
+    size, extra = divmod(len(items), num_chunks)
+    chunks = []
+    start = 0
+    for i in range(num_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(items[start:end])
+        start = end
+    return chunks
+
+def rank_similar_stations(stations, ref_primary_change, ref_secondary_change,
+                          primary_metric, secondary_metric,
+                          period1_start, period1_end, period2_start, period2_end, top_k, quality=None):
+    """
+    Score every station against the reference and return the top_k most similar
+    Chunks of stations are scored in parallel on the process pool and the partial
+    top-K lists merged; small station sets are scored inline
+    """
+    args = (ref_primary_change, ref_secondary_change, primary_metric, secondary_metric,
+            period1_start, period1_end, period2_start, period2_end, top_k, config.DATABASE_PATH, quality)
+
+    global _process_pool
+    pool = get_process_pool()
+    if pool is None or len(stations) < MIN_STATIONS_FOR_POOL:
+        return score_station_chunk(stations, *args)
+
+    # Several chunks per process keeps the workers busy when chunks take uneven time
+    chunks = split_into_chunks(stations, config.SIMILARITY_PROCESSES * CHUNKS_PER_PROCESS)
+    try:
+        futures = [pool.submit(score_station_chunk, chunk, *args) for chunk in chunks]
+        partial_results = []
+        for future in futures:
+            # Background jobs poll this for progress; cancelling drops the chunks not started yet
+            try:
+                instrumentation.check_cancelled()
+            except instrumentation.Cancelled:
+                for pending in futures:
+                    pending.cancel()
+                raise
+            partial_results.append(future.result())
+            instrumentation.report_progress(len(partial_results) / len(futures),
+                                            f"Scored {len(partial_results)} of {len(futures)} station chunks")
+    except BrokenProcessPool:
+        logger.warning("Similarity process pool broke; scoring inline")
+        with _process_pool_lock:
+            if _process_pool is pool:
+                _process_pool = None
+        return score_station_chunk(stations, *args)
+
+    return heapq.nsmallest(top_k, itertools.chain.from_iterable(partial_results),
+                           key=lambda x: x["similarity_score"])
+
 def get_station_similarity_data(form_data):
     """
     Find weather stations with similar climate change patterns
     Based on rate of change analysis between two time periods
     """
-    debug(f"Processing similarity analysis request")
+    debug("Processing similarity analysis request")
     
     try:
         # Extract form parameters
@@ -102,14 +281,16 @@ def get_station_similarity_data(form_data):
         period2_start = form_data.get("period2_start", "")
         period2_end = form_data.get("period2_end", "")
         num_stations = int(form_data.get("num_stations", 5))
+        # Percentage of days a compared station must have both metrics for, in both periods
+        min_coverage = float(form_data.get("min_coverage") or 0)
         
         # Validate inputs
         if not all([reference_station_id, primary_metric, secondary_metric, 
                    period1_start, period1_end, period2_start, period2_end]):
-            return json.dumps({"error": "Missing required parameters"})
+            return serializer.dumps({"error": "Missing required parameters"})
         
         if primary_metric == secondary_metric:
-            return json.dumps({"error": "Primary and secondary metrics must be different"})
+            return serializer.dumps({"error": "Primary and secondary metrics must be different"})
         
         # Validate dates
         try:
@@ -118,15 +299,15 @@ def get_station_similarity_data(form_data):
             datetime.strptime(period2_start, "%Y-%m-%d")
             datetime.strptime(period2_end, "%Y-%m-%d")
         except ValueError:
-            return json.dumps({"error": "Invalid date format"})
+            return serializer.dumps({"error": "Invalid date format"})
         
-        debug(f"Reference station: {reference_station_id}")
-        debug(f"Metrics: {primary_metric}, {secondary_metric}")
-        debug(f"Period 1: {period1_start} to {period1_end}")
-        debug(f"Period 2: {period2_start} to {period2_end}")
+        debug("Reference station: %s", reference_station_id)
+        debug("Metrics: %s, %s", primary_metric, secondary_metric)
+        debug("Period 1: %s to %s", period1_start, period1_end)
+        debug("Period 2: %s to %s", period2_start, period2_end)
         
         # Get reference station info
-        conn = sqlite3.connect("climate.db")
+        conn = db_utils.connect()
         cur = conn.cursor()
         
         cur.execute("""
@@ -138,38 +319,24 @@ def get_station_similarity_data(form_data):
         ref_station_row = cur.fetchone()
         if not ref_station_row:
             conn.close()
-            return json.dumps({"error": "Reference station not found"})
+            return serializer.dumps({"error": "Reference station not found"})
         
-        # Calculate reference station's rate of change
-        ref_primary_period1 = get_station_metrics_data(
-            reference_station_id, primary_metric, period1_start, period1_end
-        )
-        ref_primary_period2 = get_station_metrics_data(
-            reference_station_id, primary_metric, period2_start, period2_end
-        )
-        ref_secondary_period1 = get_station_metrics_data(
-            reference_station_id, secondary_metric, period1_start, period1_end
-        )
-        ref_secondary_period2 = get_station_metrics_data(
-            reference_station_id, secondary_metric, period2_start, period2_end
-        )
+        quality = quality_flags.QualityFilter.for_connection(conn, quality_flags.get_exclude(form_data))
         
-        # Calculate reference station averages
-        ref_primary_period1_avg = calculate_average(ref_primary_period1)
-        ref_primary_period2_avg = calculate_average(ref_primary_period2)
-        ref_secondary_period1_avg = calculate_average(ref_secondary_period1)
-        ref_secondary_period2_avg = calculate_average(ref_secondary_period2)
-        
-        # Calculate reference station rate of change
-        ref_primary_change = calculate_rate_of_change(ref_primary_period1_avg, ref_primary_period2_avg)
-        ref_secondary_change = calculate_rate_of_change(ref_secondary_period1_avg, ref_secondary_period2_avg)
+        # Calculate reference station's averages and rate of change
+        ref_stats = get_station_period_stats(
+            reference_station_id, primary_metric, secondary_metric,
+            period1_start, period1_end, period2_start, period2_end, conn, quality
+        )
+        ref_primary_change = ref_stats["primary_change"]
+        ref_secondary_change = ref_stats["secondary_change"]
         
         if ref_primary_change is None or ref_secondary_change is None:
             conn.close()
-            return json.dumps({"error": "Insufficient data for reference station in specified periods"})
+            return serializer.dumps({"error": "Insufficient data for reference station in specified periods"})
         
-        debug(f"Reference primary change: {ref_primary_change}%")
-        debug(f"Reference secondary change: {ref_secondary_change}%")
+        debug("Reference primary change: %s%%", ref_primary_change)
+        debug("Reference secondary change: %s%%", ref_secondary_change)
         
         # Get all other stations to compare
         cur.execute("""
@@ -182,78 +349,24 @@ def get_station_similarity_data(form_data):
         all_stations = cur.fetchall()
         conn.close()
         
-        debug(f"Comparing against {len(all_stations)} stations")
-        
-        # Calculate similarity for each station
-        station_similarities = []
+        # Drop sparse stations before any is scored (popcounts of the availability bitmaps)
+        if min_coverage > 0:
+            covered = set(availability.stations_with_coverage(
+                [row[0] for row in all_stations], [primary_metric, secondary_metric],
+                [(period1_start, period1_end), (period2_start, period2_end)], min_coverage / 100, quality
+            ))
+            all_stations = [row for row in all_stations if row[0] in covered]
         
-        for station_row in all_stations:
-            station_id, name, lat, lon, state, region = station_row
-            
-            try:
-                # Get station data for both periods and metrics
-                station_primary_period1 = get_station_metrics_data(
-                    station_id, primary_metric, period1_start, period1_end
-                )
-                station_primary_period2 = get_station_metrics_data(
-                    station_id, primary_metric, period2_start, period2_end
-                )
-                station_secondary_period1 = get_station_metrics_data(
-                    station_id, secondary_metric, period1_start, period1_end
-                )
-                station_secondary_period2 = get_station_metrics_data(
-                    station_id, secondary_metric, period2_start, period2_end
-                )
-                
-                # Calculate averages
-                station_primary_period1_avg = calculate_average(station_primary_period1)
-                station_primary_period2_avg = calculate_average(station_primary_period2)
-                station_secondary_period1_avg = calculate_average(station_secondary_period1)
-                station_secondary_period2_avg = calculate_average(station_secondary_period2)
-                
-                # Calculate rate of change
-                station_primary_change = calculate_rate_of_change(
-                    station_primary_period1_avg, station_primary_period2_avg
-                )
-                station_secondary_change = calculate_rate_of_change(
-                    station_secondary_period1_avg, station_secondary_period2_avg
-                )
-                
-                # Skip if insufficient data
-                if station_primary_change is None or station_secondary_change is None:
-                    continue
-                
-                # Calculate similarity score
-                similarity_score = calculate_similarity_score(
-                    ref_primary_change, ref_secondary_change,
-                    station_primary_change, station_secondary_change
-                )
-                
-                station_similarities.append({
-                    "station_id": station_id,
-                    "name": name,
-                    "latitude": lat,
-                    "longitude": lon,
-                    "state": state,
-                    "region": region,
-                    "primary_change": station_primary_change,
-                    "secondary_change": station_secondary_change,
-                    "primary_period1_avg": station_primary_period1_avg,
-                    "primary_period2_avg": station_primary_period2_avg,
-                    "secondary_period1_avg": station_secondary_period1_avg,
-                    "secondary_period2_avg": station_secondary_period2_avg,
-                    "similarity_score": similarity_score
-                })
-                
-            except Exception as e:
-                debug(f"Error processing station {station_id}: {e}")
-                continue
+        debug("Comparing against %d stations", len(all_stations))
         
-        # Sort by similarity score (lower = more similar) and take top N
-        station_similarities.sort(key=lambda x: x["similarity_score"])
-        top_similar = station_similarities[:num_stations]
+        # Score every station (lower = more similar) and take top N
+        top_similar = rank_similar_stations(
+            all_stations, ref_primary_change, ref_secondary_change,
+            primary_metric, secondary_metric,
+            period1_start, period1_end, period2_start, period2_end, num_stations, quality
+        )
         
-        debug(f"Found {len(top_similar)} similar stations")
+        debug("Found %d similar stations", len(top_similar))
         
         # Prepare result
         result = {
@@ -266,10 +379,10 @@ def get_station_similarity_data(form_data):
                 "region": ref_station_row[5],
                 "primary_change": ref_primary_change,
                 "secondary_change": ref_secondary_change,
-                "primary_period1_avg": ref_primary_period1_avg,
-                "primary_period2_avg": ref_primary_period2_avg,
-                "secondary_period1_avg": ref_secondary_period1_avg,
-                "secondary_period2_avg": ref_secondary_period2_avg
+                "primary_period1_avg": ref_stats["primary_period1_avg"],
+                "primary_period2_avg": ref_stats["primary_period2_avg"],
+                "secondary_period1_avg": ref_stats["secondary_period1_avg"],
+                "secondary_period2_avg": ref_stats["secondary_period2_avg"]
             },
             "similar_stations": top_similar,
             "parameters": {
@@ -277,29 +390,36 @@ def get_station_similarity_data(form_data):
                 "secondary_metric": secondary_metric,
                 "period1": f"{period1_start} to {period1_end}",
                 "period2": f"{period2_start} to {period2_end}",
-                "num_stations_requested": num_stations
+                "num_stations_requested": num_stations,
+                "min_coverage": min_coverage
             }
         }
         
-        return json.dumps(result)
+        return serializer.dumps(result)
         
     except Exception as e:
-        debug(f"Error in similarity analysis: {e}")
-        return json.dumps({"error": f"Analysis failed: {str(e)}"})
+        logger.warning("Error in similarity analysis: %s", e)
+        return serializer.dumps({"error": f"Analysis failed: {str(e)}"})
 
 
 def get_station_data_quality_summary(station_id, metric, start_date, end_date):
     """Get data quality summary for a station and metric"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
     
+    # A range covering all of the station's data is answered by the catalog
+    entry = station_catalog.get_entry(conn, station_id, metric)
+    if entry is not None and (not entry or (start_date <= entry["first_date"] and end_date >= entry["last_date"])):
+        conn.close()
+        return entry.get("quality_counts", [])
+    
     quality_field = f"{metric}Qual"
     
     query = f"""
         SELECT {quality_field}, COUNT(*) as count
         FROM weather_data
         WHERE location = ?
-          AND {metric} IS NOT NULL
+          AND {quality_flags.has_value_sql(metric)}
           AND DMY BETWEEN ? AND ?
         GROUP BY {quality_field}
         ORDER BY count DESC
@@ -314,7 +434,7 @@ def get_station_data_quality_summary(station_id, metric, start_date, end_date):
 
 def get_data_coverage_summary(station_id, start_date, end_date):
     """Get data coverage summary for a station across all metrics"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
     
     metrics = [
@@ -323,28 +443,28 @@ def get_data_coverage_summary(station_id, start_date, end_date):
         "humid12", "humid15", "humid18", "humid21"
     ]
     
-    coverage = {}
+    # Every metric's valid count in one pass over the station's rows
+    valid_counts = ", ".join(quality_flags.count_values_sql(metric) for metric in metrics)
+    query = f"""
+        SELECT COUNT(*) as total_records, {valid_counts}
+        FROM weather_data
+        WHERE location = ?
+          AND DMY BETWEEN ? AND ?
+    """
     
-    for metric in metrics:
-        query = f"""
-            SELECT COUNT(*) as total_records,
-                   COUNT({metric}) as valid_records
-            FROM weather_data
-            WHERE location = ?
-              AND DMY BETWEEN ? AND ?
-        """
-        
-        cur.execute(query, (station_id, start_date, end_date))
-        result = cur.fetchone()
-        
-        if result and result[0] > 0:
+    cur.execute(query, (station_id, start_date, end_date))
+    total_records, *valid_records = cur.fetchone()
+    conn.close()
+    
+    coverage = {}
+    if total_records > 0:
+        for metric, valid in zip(metrics, valid_records):
             coverage[metric] = {
-                "total_records": result[0],
-                "valid_records": result[1],
-                "coverage_percentage": (result[1] / result[0]) * 100 if result[0] > 0 else 0
+                "total_records": total_records,
+                "valid_records": valid,
+                "coverage_percentage": (valid / total_records) * 100
             }
     
-    conn.close()
     return coverage
 
 
@@ -361,7 +481,7 @@ def validate_metric_name(metric):
 
 def get_station_location_info(station_id):
     """Get detailed location information for a station"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
     
     cur.execute("""
@@ -388,16 +508,25 @@ def get_station_location_info(station_id):
 
 def get_temporal_data_range(station_id, metric):
     """Get the temporal range of available data for a station and metric"""
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
     
+    entry = station_catalog.get_entry(conn, station_id, metric)
+    if entry is not None:
+        conn.close()
+        return {
+            "earliest_date": entry.get("first_date"),
+            "latest_date": entry.get("last_date"),
+            "total_records": entry.get("valid_records", 0)
+        }
+    
     query = f"""
         SELECT MIN(DMY) as earliest_date,
                MAX(DMY) as latest_date,
                COUNT(*) as total_records
         FROM weather_data
         WHERE location = ?
-          AND {metric} IS NOT NULL
+          AND {quality_flags.has_value_sql(metric)}
           AND DMY != ''
     """
     
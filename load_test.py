@@ -0,0 +1,207 @@
+"""
+HTTP load test for the climate webapp
+
+Starts the site on a loopback port (or targets --url), replays form submissions
+against every route registered in main.py while ramping concurrency, and
+reports throughput, latency percentiles and error rates per stage:
+
+    python load_test.py --db bench.db --concurrency 1,2,4,8 --duration 20
+    CLIMATE_REQUEST_LOG=requests.log python main.py     # record real traffic
+    python load_test.py --db bench.db --log requests.log
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import socketserver
+import sys
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+import config
+
+
+def load_request_log(path):
+    """Read recorded requests (one {"method", "path", "form"} JSON object per line)"""
+    requests = []
+    with open(path, encoding="utf-8") as log_file:
+        for line in log_file:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                requests.append((entry["method"], entry["path"], entry.get("form") or {}))
+    return requests
+
+
+def build_default_requests(database, routes):
+    """A realistic request mix for every route, with form values picked from the dataset"""
+    import benchmark
+
+    forms = benchmark.build_forms(benchmark.get_dataset_profile(database))
+    submissions = {
+        "/focused-metric": dict(forms["range"], action="graph"),
+        "/focused": forms["station"],
+        "/focused-station": forms["station"],
+        "/deep-dive": forms["deep_dive"],
+        "/deep-dive-weather-station": forms["deep_dive_station"],
+        "/similarity": dict(forms["similarity"], action="find_similar"),
+    }
+    requests = []
+    for route in routes:
+        # Every route is visited (blank form) and analysis routes are also submitted
+        requests.append(("GET", route, {}))
+        if route in submissions:
+            requests.append(("POST", route, submissions[route]))
+    return requests
+
+
+def start_local_server(port=0):
+    """Serve the site on 127.0.0.1 in a background thread; returns (server, port)"""
+    import main  # registers the page routes
+    import pyhtml
+
+    pyhtml.MyRequestHandler.log_message = lambda *args: None
+
+    class LoadTestServer(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+        request_queue_size = 128
+
+    server = LoadTestServer(("127.0.0.1", port), pyhtml.MyRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_address[1]
+
+
+def send_request(host, port, method, path, form, timeout):
+    """Send one request; returns (status, response bytes)"""
+    conn = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        body = urlencode(form, doseq=True)
+        if method == "GET":
+            conn.request("GET", f"{path}?{body}" if body else path)
+        else:
+            conn.request("POST", path, body=body,
+                         headers={"Content-Type": "application/x-www-form-urlencoded"})
+        response = conn.getresponse()
+        data = response.read()
+        return response.status, len(data)
+    finally:
+        conn.close()
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarise(samples, elapsed):
+    """Throughput, latency percentiles and error rate for (route, latency, ok, bytes) samples"""
+    latencies = sorted(s[1] for s in samples)
+    errors = sum(1 for s in samples if not s[2])
+    return {
+        "requests": len(samples),
+        "throughput_rps": len(samples) / elapsed if elapsed else 0.0,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "bytes": sum(s[3] for s in samples),
+        "p50_ms": (percentile(latencies, 0.50) or 0) * 1000,
+        "p90_ms": (percentile(latencies, 0.90) or 0) * 1000,
+        "p99_ms": (percentile(latencies, 0.99) or 0) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0) * 1000,
+    }
+
+
+def run_stage(host, port, requests, concurrency, duration, timeout, seed):
+    """Replay requests from `concurrency` clients for `duration` seconds"""
+    samples = []
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(worker):
+        rng = random.Random(seed + worker)
+        position = rng.randrange(len(requests))
+        local = []
+        while time.perf_counter() < deadline:
+            method, path, form = requests[position % len(requests)]
+            position += 1
+            start = time.perf_counter()
+            try:
+                status, size = send_request(host, port, method, path, form, timeout)
+                ok = status < 400
+            except (OSError, http.client.HTTPException):
+                size, ok = 0, False
+            local.append((path, time.perf_counter() - start, ok, size))
+        with samples_lock:
+            samples.extend(local)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    by_route = {}
+    for sample in samples:
+        by_route.setdefault(sample[0], []).append(sample)
+    return {
+        "concurrency": concurrency,
+        "elapsed": elapsed,
+        "overall": summarise(samples, elapsed),
+        "routes": {route: summarise(route_samples, elapsed) for route, route_samples in sorted(by_route.items())},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=config.DATABASE_PATH, help="database for the local server and default form values")
+    parser.add_argument("--url", help="target an already running server instead of starting one")
+    parser.add_argument("--port", type=int, default=0, help="port for the local server (0 = any free port)")
+    parser.add_argument("--log", help="recorded request log to replay (default: built-in mix)")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="comma separated concurrency ramp")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per concurrency stage")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    config.DATABASE_PATH = args.db
+
+    if args.url:
+        target = urlparse(args.url)
+        host, port = target.hostname, target.port or 80
+        import main  # for the route list
+    else:
+        server, port = start_local_server(args.port)
+        host = "127.0.0.1"
+
+    import pyhtml
+    routes = sorted(pyhtml.MyRequestHandler.pages)
+    requests = load_request_log(args.log) if args.log else build_default_requests(args.db, routes)
+    print(f"Replaying {len(requests)} distinct requests against http://{host}:{port}", file=sys.stderr)
+
+    stages = []
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        stage = run_stage(host, port, requests, concurrency, args.duration, args.timeout, args.seed)
+        stages.append(stage)
+        overall = stage["overall"]
+        print(f"concurrency {concurrency:3d}: {overall['throughput_rps']:7.2f} req/s  "
+              f"p50 {overall['p50_ms']:8.1f} ms  p90 {overall['p90_ms']:8.1f} ms  "
+              f"p99 {overall['p99_ms']:8.1f} ms  errors {overall['error_rate'] * 100:5.1f}%",
+              file=sys.stderr)
+
+    if not args.url:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"target": f"{host}:{port}", "stages": stages}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
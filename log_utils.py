@@ -0,0 +1,52 @@
+import logging
+import random
+import sys
+
+ROOT_LOGGER_NAME = "climate"
+LOG_FORMAT = "%(levelname)s %(name)s: %(message)s"
+
+class SamplingFilter(logging.Filter):
+    """Let through only a fraction of DEBUG records; INFO and above always pass"""
+    def __init__(self, sample_rate=1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.sample_rate >= 1.0:
+            return True
+        return random.random() < self.sample_rate
+
+_handler = None
+_sampling_filter = SamplingFilter()
+
+def get_logger(name):
+    """Logger for a module, e.g. get_logger(__name__), under the shared "climate" logger"""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+def configure(level="WARNING", sample_rate=1.0, stream=None):
+    """
+    Configure the application's logging
+    level: a logging level name or number; records below it cost only a level check
+    sample_rate: fraction (0-1) of DEBUG records that are actually written
+    """
+    global _handler
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.WARNING
+    root.setLevel(level)
+    root.propagate = False
+
+    _sampling_filter.sample_rate = max(0.0, min(float(sample_rate), 1.0))
+
+    if _handler is not None:
+        root.removeHandler(_handler)
+    _handler = logging.StreamHandler(stream or sys.stdout)
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _handler.addFilter(_sampling_filter)
+    root.addHandler(_handler)
+    return root
+
+# Quiet by default: nothing below WARNING is formatted until configure() says so
+logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)
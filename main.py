@@ -1,4 +1,9 @@
 import pyhtml
+import config
+import log_utils
+import jobs
+import coverage_utils
+import station_catalog
 
 import mission_statement
 import focused_view_page_via_climate_metric
@@ -8,7 +13,11 @@ import focused_view_page_via_weather_stations
 import similarity_chanage_in_metric_percentages_page
 import deep_dive_page_weather_station
 
-pyhtml.need_debugging_help = True
+# Logging: CLIMATE_LOG_LEVEL=DEBUG shows per-request detail, CLIMATE_LOG_SAMPLE thins out DEBUG records
+log_utils.configure(level=config.LOG_LEVEL, sample_rate=config.LOG_SAMPLE)
+
+# Record page requests for replay by load_test.py
+pyhtml.request_log_path = config.REQUEST_LOG
 
 # Page routes
 pyhtml.MyRequestHandler.pages["/"] = landing_page
@@ -20,5 +29,24 @@ pyhtml.MyRequestHandler.pages["/deep-dive"] = deep_dive_page
 pyhtml.MyRequestHandler.pages["/deep-dive-weather-station"] = deep_dive_page_weather_station
 pyhtml.MyRequestHandler.pages["/similarity"] = similarity_chanage_in_metric_percentages_page
 
-# Host the site
-pyhtml.host_site()
\ No newline at end of file
+# Analytical pages: identical concurrent form submissions share one computation
+pyhtml.MyRequestHandler.coalesced_routes.update([
+    "/focused-metric", "/focused", "/focused-station",
+    "/deep-dive", "/deep-dive-weather-station", "/similarity"
+])
+
+# Long analyses and exports can run as background jobs: /jobs/submit, /jobs/status, /jobs/cancel, /jobs/result
+pyhtml.MyRequestHandler.endpoints.update(jobs.ENDPOINTS)
+
+# Keyset-paginated JSON for the focused-station climate table
+pyhtml.MyRequestHandler.endpoints["/focused-station/climate-data"] = focused_view_page_via_weather_stations.get_climate_data_page
+
+# Metric coverage by month for every state, region or station (JSON for a heatmap)
+pyhtml.MyRequestHandler.endpoints["/coverage/heatmap"] = coverage_utils.get_coverage_heatmap
+
+# Per metric first/last date and record count of a station (date-picker bounds)
+pyhtml.MyRequestHandler.endpoints["/station-catalog"] = station_catalog.get_station_catalog
+
+# Host the site (importing main only registers the routes, e.g. for load_test.py)
+if __name__ == "__main__":
+    pyhtml.host_site()
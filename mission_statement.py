@@ -1,4 +1,8 @@
 import pyhtml
+import config
+from log_utils import get_logger
+
+logger = get_logger(__name__)
 
 def fix_encoding(text):
     replacements = {
@@ -23,7 +27,7 @@ def fix_encoding(text):
     return text
 
 def get_page_html(form_data):
-    print("About to return Mission Statement page")
+    logger.info("About to return Mission Statement page")
     
     # Hard-coded mission statement and purpose
     mission_statement = """
@@ -44,8 +48,8 @@ def get_page_html(form_data):
     persona_query = "SELECT name, background FROM personas ORDER BY name;"
     team_query = "SELECT studentName, studentNum FROM studentInfo ORDER BY studentName;"
     
-    personas = pyhtml.get_results_from_query("climate.db", persona_query)
-    team_members = pyhtml.get_results_from_query("climate.db", team_query)
+    personas = pyhtml.get_results_from_query(config.DATABASE_PATH, persona_query)
+    team_members = pyhtml.get_results_from_query(config.DATABASE_PATH, team_query)
     
     # Build the HTML page
     page_html = """<!DOCTYPE html>
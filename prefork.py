@@ -0,0 +1,127 @@
+import os
+import signal
+import time
+from multiprocessing import RawArray
+
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# A worker whose serve loop has not checked in for this long is killed and replaced
+HEARTBEAT_TIMEOUT = 60.0
+# How often the supervisor checks on its workers
+SUPERVISE_INTERVAL = 1.0
+# Workers that die sooner than this after starting are restarted with a back-off
+MIN_WORKER_LIFETIME = 2.0
+MAX_RESTART_DELAY = 30.0
+
+
+class HeartbeatMixin:
+    """Server mixin that records a timestamp in shared memory on every serve_forever loop"""
+    heartbeats = None
+    heartbeat_slot = None
+
+    def service_actions(self):
+        super().service_actions()
+        if self.heartbeats is not None:
+            self.heartbeats[self.heartbeat_slot] = time.monotonic()
+
+
+def _run_worker(server, heartbeats, slot):
+    """Body of a forked worker: serve requests on the inherited listening socket"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server.heartbeats = heartbeats
+    server.heartbeat_slot = slot
+    heartbeats[slot] = time.monotonic()
+    status = 0
+    try:
+        server.serve_forever()
+    except BaseException:
+        logger.exception("Worker %d crashed", os.getpid())
+        status = 1
+    finally:
+        os._exit(status)
+
+
+def serve_prefork(server, workers):
+    """
+    Fork `workers` processes that all accept on server's listening socket
+    The parent supervises them: crashed or hung workers are replaced until SIGTERM/SIGINT
+    """
+    heartbeats = RawArray("d", workers)
+    children = {}  # pid -> (slot, started)
+    restart_delay = [0.0] * workers
+    restart_at = {}  # slot -> monotonic time its replacement may be started
+    stopping = False
+
+    def spawn(slot):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(server, heartbeats, slot)
+        children[pid] = (slot, time.monotonic())
+        heartbeats[slot] = time.monotonic()
+        logger.info("Started worker %d in slot %d", pid, slot)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    previous_handlers = {
+        signal.SIGTERM: signal.signal(signal.SIGTERM, stop),
+        signal.SIGINT: signal.signal(signal.SIGINT, stop),
+    }
+
+    for slot in range(workers):
+        spawn(slot)
+
+    try:
+        while not stopping:
+            time.sleep(SUPERVISE_INTERVAL)
+
+            # Reap workers that exited
+            while children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                slot, started = children.pop(pid)
+                if stopping:
+                    continue
+                lifetime = time.monotonic() - started
+                if lifetime < MIN_WORKER_LIFETIME:
+                    restart_delay[slot] = min(max(restart_delay[slot] * 2, 0.5), MAX_RESTART_DELAY)
+                else:
+                    restart_delay[slot] = 0.0
+                logger.warning("Worker %d exited with status %d; restarting in %.1fs",
+                               pid, os.waitstatus_to_exitcode(status), restart_delay[slot])
+                restart_at[slot] = time.monotonic() + restart_delay[slot]
+
+            # Restart exited workers whose back-off has passed; the others wait for a later tick
+            now = time.monotonic()
+            for slot, due in list(restart_at.items()):
+                if now >= due:
+                    del restart_at[slot]
+                    spawn(slot)
+
+            # Replace workers whose serve loop has stopped checking in
+            now = time.monotonic()
+            for pid, (slot, started) in list(children.items()):
+                if now - heartbeats[slot] > HEARTBEAT_TIMEOUT:
+                    logger.warning("Worker %d missed its heartbeat; killing it", pid)
+                    try:
+                        os.kill(pid, signal.SIGKILL)
+                    except ProcessLookupError:
+                        pass
+    finally:
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
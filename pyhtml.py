@@ -2,124 +2,316 @@
 #File version: 2025.03.28
 #Author: Gayan Wijesinghe, for questions, contact via Ms Teams.
 
-import sqlite3
 import os
 
 import http.server
+import json
 import socketserver
+import threading
 from urllib.parse import parse_qs, urlparse
 
+import config
+import instrumentation
+import prefork
+import static_assets
+from singleflight import SingleFlight, normalize_form
+from db_utils import connect
+from log_utils import get_logger
+
+# Debug output is routed through the "climate.pyhtml" logger; set its level with log_utils.configure()
 need_debugging_help=True
+logger = get_logger("pyhtml")
+
+# When set, every page/endpoint request is appended to this JSON-lines file (replayed by load_test.py)
+request_log_path=None
+_request_log_lock = threading.Lock()
+
+class EndpointError(Exception):
+    """Raised by an endpoint to answer with an HTTP error status instead of a body"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
 
 class MyRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # HTTP/1.1 for chunked (streamed) pages and keep-alive; every other response sends Content-Length
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections are closed after this many seconds
+    timeout = 30
     pages={}
+    # Non-HTML routes: path -> function(form_data) returning (content_type, body[, extra_headers])
+    endpoints={"/metrics": lambda form_data: ("text/plain; version=0.0.4", instrumentation.render_metrics())}
+    # Expensive pages: identical concurrent submissions share one computation
+    coalesced_routes=set()
+    in_flight=SingleFlight()
+
     def do_GET(self):
         parsed_url = urlparse(self.path)
-        debugging_helper(f"A web browser wants to GET the following: {parsed_url.path}")
-        if parsed_url.path in MyRequestHandler.pages:
-            self.send_response(200)
-            self.send_header("Content-type", "text/html")
-            self.end_headers()
+        debugging_helper("A web browser wants to GET the following: %s", parsed_url.path)
+        if parsed_url.path in MyRequestHandler.endpoints or parsed_url.path in MyRequestHandler.pages:
+            instrumentation.start_request(parsed_url.path)
+            try:
+                query = parsed_url.query
+                form_data = parse_qs(query)
+                debugging_helper("\tReceived following data with GET request: %s", form_data)
+                record_request("GET", parsed_url.path, form_data)
 
-            query = parsed_url.query
-            form_data = parse_qs(query)
-            debugging_helper(f"\tReceived following data with GET request: {form_data}")
-            
-            html_content = MyRequestHandler.pages[parsed_url.path].get_page_html(form_data)
-            
-            self.wfile.write(html_content.encode('utf-8'))            
-        else:
+                if parsed_url.path in MyRequestHandler.endpoints:
+                    self.send_endpoint(parsed_url.path, form_data)
+                elif self.can_stream(parsed_url.path):
+                    self.send_stream("text/html", MyRequestHandler.pages[parsed_url.path].iter_page_html(form_data))
+                else:
+                    with instrumentation.phase("page"):
+                        html_content = self.render_page("GET", parsed_url.path, form_data)
+                    self.send_content("text/html", html_content)
+            finally:
+                instrumentation.finish_request()
+        elif not self.send_static(parsed_url.path):
             # Let the server handle static files (like images, .html files)
             super().do_GET()
     #Author: ChatGPT for this, added because of error 501
     def do_POST(self):
-        content_length = int(self.headers.get('Content-Length', 0))
-        post_data = self.rfile.read(content_length).decode('utf-8')
-        form_data = parse_qs(post_data)
+        parsed_url = urlparse(self.path)
+        path = parsed_url.path
 
-        # Keep single values as string, multiple as list
-        for k, v in form_data.items():
-            if len(v) == 1:
-                form_data[k] = v[0]
-            else:
-                form_data[k] = v
+        if path not in MyRequestHandler.endpoints and path not in MyRequestHandler.pages:
+            # As in do_GET, unknown paths get no request profile, so they can't add /metrics series;
+            # the body is still read so the connection can be kept alive
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.send_error(404, "Page Not Found")
+            return
 
+        instrumentation.start_request(path)
+        try:
+            self.handle_post(path)
+        finally:
+            instrumentation.finish_request()
 
-        parsed_url = urlparse(self.path)
-        path = parsed_url.path
+    def handle_post(self, path):
+        with instrumentation.phase("parse"):
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length).decode('utf-8')
+            form_data = parse_qs(post_data)
 
-        if path in MyRequestHandler.pages:
-            page_module = MyRequestHandler.pages[path]
-
-            # Handle optional export_csv flag (Deep Dive uses it)
-            export_flag = form_data.get("action") == "export"
-
-            # Call get_page_html with form_data and possibly export_csv
-            if "deep" in path:
-                response = page_module.get_page_html(form_data, export_flag)
-            else:
-                response = page_module.get_page_html(form_data)
-
-            # Handle special case: CSV dictionary return
-            if isinstance(response, dict) and "csv" in response:
-                csv_data = response["csv"]
-                filename = response.get("filename", "export.csv")
-                self.send_response(200)
-                self.send_header("Content-Type", "text/csv")
-                self.send_header("Content-Disposition", f'attachment; filename="{filename}"')
-                self.end_headers()
-                self.wfile.write(csv_data.encode("utf-8"))
+            # Keep single values as string, multiple as list
+            for k, v in form_data.items():
+                if len(v) == 1:
+                    form_data[k] = v[0]
+                else:
+                    form_data[k] = v
+        record_request("POST", path, form_data)
+
+        if path in MyRequestHandler.endpoints:
+            self.send_endpoint(path, form_data)
+        elif path in MyRequestHandler.pages:
+            args = page_args(path, form_data)
+            # Exports are attachments, not pages, so they are never streamed
+            if not any(args) and self.can_stream(path):
+                self.send_stream("text/html", MyRequestHandler.pages[path].iter_page_html(form_data))
                 return
+            with instrumentation.phase("page"):
+                response = self.render_page("POST", path, form_data, *args)
+            self.send_content(*page_response(response))
+        else:
+            self.send_error(404, "Page Not Found")
+
+    def send_endpoint(self, path, form_data):
+        try:
+            with instrumentation.phase("endpoint"):
+                response = MyRequestHandler.endpoints[path](form_data)
+        except EndpointError as e:
+            self.send_error(e.status, e.message)
+            return
+        self.send_content(*response)
 
-            # Handle plain string CSV return (Focused page CSV fallback)
-            if isinstance(response, str) and response.startswith("Content-Disposition:"):
-                self.send_response(200)
-                self.send_header("Content-Type", "text/csv")
-                self.send_header("Content-Disposition", "attachment; filename=climate_data_export.csv")
-                self.end_headers()
-                # Return CSV content (after header line)
-                csv_data = response.split("\n\n", 1)[1]
-                self.wfile.write(csv_data.encode("utf-8"))
+    def render_page(self, method, path, form_data, *args):
+        """Call the page's get_page_html, sharing the result with identical in-flight requests"""
+        page_module = MyRequestHandler.pages[path]
+        if path not in MyRequestHandler.coalesced_routes:
+            return page_module.get_page_html(form_data, *args)
+
+        key = (method, path, normalize_form(form_data), args)
+        response, shared = MyRequestHandler.in_flight.do(key, page_module.get_page_html, form_data, *args)
+        if shared:
+            instrumentation.mark_coalesced()
+        return response
+
+    def can_stream(self, path):
+        """Pages with an iter_page_html(form_data) generator are streamed to HTTP/1.1 clients"""
+        return (hasattr(MyRequestHandler.pages[path], "iter_page_html")
+                and self.request_version == "HTTP/1.1")
+
+    def send_stream(self, content_type, chunks):
+        """
+        Send a 200 response with chunked encoding, writing each chunk as soon as the
+        page yields it (e.g. the form before a slow analysis finishes)
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        # Only the work done before the first chunk is known when the headers go out
+        profile = instrumentation.current_profile()
+        if profile is not None:
+            self.send_header("Server-Timing", profile.server_timing_header())
+        self.end_headers()
+
+        chunks = iter(chunks)
+        while True:
+            try:
+                with instrumentation.phase("page"):
+                    chunk = next(chunks, None)
+            except Exception:
+                # Too late for an error status: drop the connection so the client sees a truncated body
+                logger.exception("Streaming %s failed", self.path)
+                self.close_connection = True
                 return
+            if chunk is None:
+                break
+            if not chunk:
+                continue
+            data = chunk.encode("utf-8")
+            with instrumentation.phase("write"):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            instrumentation.add_bytes_written(len(data))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def send_static(self, path):
+        """Serve a file from static/ (see static_assets); returns False if path isn't one"""
+        found = static_assets.lookup(path)
+        if found is None:
+            return False
+        static_file, immutable = found
+        cache_control = static_assets.IMMUTABLE_CACHE_CONTROL if immutable else static_assets.REVALIDATE_CACHE_CONTROL
 
-            # Else: Treat as standard HTML response
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html")
+        if self.headers.get("If-None-Match") == static_file.etag:
+            self.send_response(304)
+            self.send_header("ETag", static_file.etag)
+            self.send_header("Cache-Control", cache_control)
             self.end_headers()
-            self.wfile.write(response.encode("utf-8"))
+            return True
+
+        self.send_response(200)
+        self.send_header("Content-Type", static_file.content_type)
+        self.send_header("Content-Length", str(static_file.size))
+        self.send_header("ETag", static_file.etag)
+        self.send_header("Cache-Control", cache_control)
+        self.end_headers()
+        if static_file.body is not None:
+            self.wfile.write(static_file.body)
         else:
-            self.send_error(404, "Page Not Found")
+            # Large files go straight from the page cache to the socket
+            with open(static_file.path, "rb") as f:
+                self.connection.sendfile(f)
+        return True
+
+    def send_content(self, content_type, body, extra_headers=None):
+        """Send a complete 200 response, with a Server-Timing header for the work done so far"""
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (extra_headers or {}).items():
+            self.send_header(name, value)
+        profile = instrumentation.current_profile()
+        if profile is not None:
+            self.send_header("Server-Timing", profile.server_timing_header())
+        self.end_headers()
+        with instrumentation.phase("write"):
+            self.wfile.write(body)
+        instrumentation.add_bytes_written(len(body))
 
             
 
+class ClimateServer(prefork.HeartbeatMixin, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    # One thread per connection, so a slow analysis doesn't hold up quick pages
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+def form_value(form_data, name, default=""):
+    """A single form field, whether the form came from a GET (lists) or a POST (single values)"""
+    value = form_data.get(name, default)
+    if isinstance(value, list):
+        value = value[0] if value else default
+    return value
+
+def coalesced_call(key, func, *args):
+    """
+    Run func(*args), sharing the result with identical calls already in flight
+    (for streamed pages, which coalesce their analysis step rather than the whole page)
+    """
+    result, shared = MyRequestHandler.in_flight.do(key, func, *args)
+    if shared:
+        instrumentation.mark_coalesced()
+    return result
+
+def page_args(path, form_data):
+    """Extra positional arguments a page's get_page_html takes for a POST"""
+    # Handle optional export_csv flag (Deep Dive uses it)
+    if "deep" in path:
+        return (form_data.get("action") == "export",)
+    return ()
+
+def page_response(response):
+    """Turn a get_page_html return value into (content_type, body, extra_headers)"""
+    # Handle special case: CSV dictionary return
+    if isinstance(response, dict) and "csv" in response:
+        filename = response.get("filename", "export.csv")
+        return "text/csv", response["csv"], {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    # Handle plain string CSV return (Focused page CSV fallback)
+    if isinstance(response, str) and response.startswith("Content-Disposition:"):
+        # Return CSV content (after header line)
+        csv_data = response.split("\n\n", 1)[1]
+        return "text/csv", csv_data, {"Content-Disposition": "attachment; filename=climate_data_export.csv"}
+
+    # Else: Treat as standard HTML response
+    return "text/html", response, None
+
 def host_site():
-    # Set the port
-    PORT = 80
+    # Bind address and port come from config (CLIMATE_HOST / CLIMATE_PORT or the config file)
+    HOST = config.HOST
+    PORT = config.PORT
 
     # Create the HTTP server
-    with socketserver.TCPServer(("", PORT), MyRequestHandler) as httpd:
+    with ClimateServer((HOST, PORT), MyRequestHandler) as httpd:
         print("Using your favourite browser, go to:\n")
         if (PORT==80):
             print("http://localhost")
         print(f"or\nhttp://localhost:{PORT}\n")
-        httpd.serve_forever()
+        if config.WORKERS > 1 and hasattr(os, "fork"):
+            # Pre-fork mode: CLIMATE_WORKERS processes share the listening socket,
+            # so CPU-heavy analyses are not limited to one core by the GIL
+            print(f"Serving with {config.WORKERS} worker processes\n")
+            prefork.serve_prefork(httpd, config.WORKERS)
+        else:
+            httpd.serve_forever()
         
         
 def get_results_from_query(database,query):
     debugging_helper("\n------------------------")
-    debugging_helper("Opening database \""+database+"\"... ")
-    connection = sqlite3.connect(database)
+    debugging_helper("Opening database \"%s\"... ", database)
+    connection = connect(database)
     cursor=connection.cursor()
     debugging_helper("done\n")
-    debugging_helper("Executing query \""+query+"\"... ")
+    debugging_helper("Executing query \"%s\"... ", query)
     cursor.execute(query)
     debugging_helper("done\n")
     debugging_helper("Fetching results...\n")
     results = cursor.fetchall();
-    debugging_helper(results)
+    debugging_helper("%s", results)
     debugging_helper("\n------------------------")
     return results
 
-def debugging_helper(message):
+def record_request(method, path, form_data):
+    if request_log_path:
+        line = json.dumps({"method": method, "path": path, "form": form_data})
+        with _request_log_lock:
+            with open(request_log_path, "a", encoding="utf-8") as log_file:
+                log_file.write(line + "\n")
+
+def debugging_helper(message, *args):
+    # Lazy: message is only %-formatted with args when DEBUG logging is enabled
     if (need_debugging_help):
-        print(message,)
+        logger.debug(message, *args)
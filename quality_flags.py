@@ -0,0 +1,130 @@
+"""
+Quality flags of the weather_data metrics
+
+Every metric column (e.g. maxtemp) has a text flag column (maxtempQual): Y, N, S, W
+or I. `schema_migrations.py migrate` materializes two more columns per metric:
+
+    maxtemp_clean   the value, NULL when it is missing or flagged W (wrong)
+    maxtemp_qcode   the flag as a small integer (QUALITY_CODES; 0 = no value)
+
+Triggers keep them current as rows are inserted or updated, and
+`schema_migrations.py maintain` fills in any rows loaded without them.
+
+Aggregations choose which flags to leave out with the shared exclude_quality form
+field (or the quality_exclude setting) and filter with QualityFilter, which compares
+the integer codes when the columns exist and the text flags on an older database.
+"""
+import config
+
+METRICS = [
+    "precipitation", "evaporation", "maxtemp", "mintemp", "sunshine",
+    "humid00", "humid03", "humid06", "humid09", "humid12", "humid15", "humid18", "humid21",
+    "okta00", "okta03", "okta06", "okta09", "okta12", "okta15", "okta18", "okta21",
+    "raindaysnum"
+]
+
+QUALITY_CODES = {"Y": 1, "N": 2, "S": 3, "W": 4, "I": 5}
+MISSING_CODE = 0  # no value, whatever the flag says
+OTHER_CODE = 9    # a value with a blank or unrecognised flag
+
+# Flags an aggregation may leave out
+EXCLUDABLE_FLAGS = ("W", "S", "I")
+
+FORM_FIELD = "exclude_quality"
+
+
+def clean_column(metric):
+    return f"{metric}_clean"
+
+
+def code_column(metric):
+    return f"{metric}_qcode"
+
+
+def has_value_sql(metric, table=None):
+    """SQL predicate: the row has a value for metric (the importer stores empty cells as '', not NULL)"""
+    prefix = f"{table}." if table else ""
+    return f"{prefix}{metric} IS NOT NULL AND {prefix}{metric} != ''"
+
+
+def count_values_sql(metric, table=None):
+    """SQL aggregate counting the rows that has_value_sql() accepts"""
+    prefix = f"{table}." if table else ""
+    return f"COUNT(NULLIF({prefix}{metric}, ''))"
+
+
+def clean_value_sql(metric, table=None):
+    """SQL computing a row's {metric}_clean from the raw columns"""
+    prefix = f"{table}." if table else ""
+    return f"CASE WHEN {prefix}{metric}Qual = 'W' THEN NULL ELSE {prefix}{metric} END"
+
+
+def code_value_sql(metric, table=None):
+    """SQL computing a row's {metric}_qcode from the raw columns"""
+    prefix = f"{table}." if table else ""
+    whens = " ".join(f"WHEN '{flag}' THEN {code}" for flag, code in QUALITY_CODES.items())
+    return (f"CASE WHEN {prefix}{metric} IS NULL THEN {MISSING_CODE} "
+            f"ELSE CASE {prefix}{metric}Qual {whens} ELSE {OTHER_CODE} END END")
+
+
+def parse_exclude(value):
+    """
+    Flags to exclude from "W,S", ["W", "S"] (repeated GET fields) or "none"
+    Unknown flags are ignored
+    """
+    if isinstance(value, (list, tuple)):
+        value = ",".join(value)
+    flags = {flag.strip().upper() for flag in str(value).split(",")}
+    return tuple(flag for flag in EXCLUDABLE_FLAGS if flag in flags)
+
+
+def get_exclude(form_data):
+    """The flags a request excludes: its exclude_quality field, else the quality_exclude setting"""
+    if FORM_FIELD in form_data:
+        return parse_exclude(form_data[FORM_FIELD])
+    return parse_exclude(config.QUALITY_EXCLUDE)
+
+
+def has_materialized_columns(conn):
+    """True when weather_data has the _clean/_qcode columns (and they are kept current)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(weather_data)")}
+    triggers = {row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'weather_data'")}
+    return (all(code_column(metric) in columns and clean_column(metric) in columns for metric in METRICS)
+            and {"weather_data_quality_insert", "weather_data_quality_update"} <= triggers)
+
+
+class QualityFilter:
+    """
+    SQL for one request's quality exclusions
+    Built once per connection with for_connection(); plain data, so it can be sent to
+    the similarity worker processes
+    """
+    def __init__(self, exclude=(), materialized=False):
+        self.exclude = tuple(exclude)
+        self.materialized = materialized
+
+    @classmethod
+    def for_connection(cls, conn, exclude):
+        return cls(exclude, has_materialized_columns(conn))
+
+    def value_test(self, metric, table=None):
+        """SQL predicate: the row has a value for metric whose flag isn't excluded"""
+        prefix = f"{table}." if table else ""
+        if self.materialized:
+            codes = [MISSING_CODE] + [QUALITY_CODES[flag] for flag in self.exclude]
+            return f"{prefix}{code_column(metric)} NOT IN ({', '.join(map(str, codes))})"
+        test = f"{prefix}{metric} IS NOT NULL"
+        if self.exclude:
+            flags = ", ".join(f"'{flag}'" for flag in self.exclude)
+            test += f" AND COALESCE({prefix}{metric}Qual, '') NOT IN ({flags})"
+        return test
+
+    def value_sql(self, metric, table=None):
+        """SQL for the metric's value, NULL when it is missing or its flag is excluded"""
+        prefix = f"{table}." if table else ""
+        if self.materialized and self.exclude == ("W",):
+            return f"{prefix}{clean_column(metric)}"
+        if not self.exclude:
+            return f"{prefix}{metric}"
+        return f"CASE WHEN {self.value_test(metric, table)} THEN {prefix}{metric} END"
@@ -0,0 +1,326 @@
+"""
+Schema migrations and maintenance for the climate database
+
+Usage:
+    python schema_migrations.py migrate [--db climate.db]
+    python schema_migrations.py maintain [--db climate.db] [--no-vacuum]
+    python schema_migrations.py status [--db climate.db]
+    python schema_migrations.py check-plans [--db climate.db]
+
+`migrate` brings the schema up to the latest version. The version is kept in
+PRAGMA user_version: migration N in MIGRATIONS is applied once, in its own
+transaction, and sets user_version to N. Append new migrations; never edit or
+reorder ones that have shipped.
+
+`maintain` applies pending migrations, refreshes the tables derived from
+weather_data (the quality columns of quality_flags.py, the coverage table of
+coverage_utils.py, the availability bitmaps of availability.py, the catalog of
+station_catalog.py and the aggregate cube of aggregate_cube.py), sets the page
+size and WAL journal mode (VACUUM rebuilds the file so a new page size takes
+effect) and refreshes the planner statistics with ANALYZE and PRAGMA optimize.
+Run it after importing data: the derived tables are not updated as rows arrive.
+
+`check-plans` runs the hot queries (the benchmark cases for the utils modules
+and the focused station page), captures the SQL they actually execute, and
+reports any whose EXPLAIN QUERY PLAN falls back to a full SCAN of weather_data.
+"""
+import argparse
+import re
+import sys
+
+import aggregate_cube
+import availability
+import config
+import coverage_utils
+import db_utils
+import instrumentation
+import quality_flags
+import station_catalog
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+def materialize_quality_columns(conn):
+    """
+    Add (if missing) and fill the per-metric _clean/_qcode columns, and the triggers that
+    keep them current. Idempotent: only rows whose codes are still NULL are computed
+    """
+    metrics = quality_flags.METRICS
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(weather_data)")}
+    for metric in metrics:
+        if quality_flags.clean_column(metric) not in columns:
+            conn.execute(f"ALTER TABLE weather_data ADD COLUMN {quality_flags.clean_column(metric)} REAL")
+        if quality_flags.code_column(metric) not in columns:
+            conn.execute(f"ALTER TABLE weather_data ADD COLUMN {quality_flags.code_column(metric)} INTEGER")
+
+    assignments = ",\n            ".join(
+        f"{quality_flags.clean_column(metric)} = {quality_flags.clean_value_sql(metric)}, "
+        f"{quality_flags.code_column(metric)} = {quality_flags.code_value_sql(metric)}"
+        for metric in metrics
+    )
+    raw_columns = ", ".join(f"{metric}, {metric}Qual" for metric in metrics)
+    conn.execute("DROP TRIGGER IF EXISTS weather_data_quality_insert")
+    conn.execute("DROP TRIGGER IF EXISTS weather_data_quality_update")
+    conn.execute(f"""
+        CREATE TRIGGER weather_data_quality_insert AFTER INSERT ON weather_data BEGIN
+            UPDATE weather_data SET {assignments} WHERE rowid = NEW.rowid;
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER weather_data_quality_update AFTER UPDATE OF {raw_columns} ON weather_data BEGIN
+            UPDATE weather_data SET {assignments} WHERE rowid = NEW.rowid;
+        END
+    """)
+    conn.execute(f"""
+        UPDATE weather_data SET {assignments}
+        WHERE {" OR ".join(f"{quality_flags.code_column(metric)} IS NULL" for metric in metrics)}
+    """)
+
+
+# Migration N (1-based) is (name, steps); a step is SQL or a function taking the connection
+MIGRATIONS = [
+    ("weather_data_location_date", [
+        # Per-station date ranges: line graphs, similarity periods, station detail joins
+        "CREATE INDEX IF NOT EXISTS idx_weather_data_location_dmy ON weather_data (location, DMY)",
+        # All-station date ranges: state averages, metric comparisons
+        "CREATE INDEX IF NOT EXISTS idx_weather_data_dmy_location ON weather_data (DMY, location)",
+    ]),
+    ("weather_station_state", [
+        # State + latitude band filters on the focused pages; state/name ordering of the station lists
+        "CREATE INDEX IF NOT EXISTS idx_weather_station_state_latitude ON weather_station (state, latitude)",
+        "CREATE INDEX IF NOT EXISTS idx_weather_station_state_name ON weather_station (state, name)",
+    ]),
+    ("weather_data_quality_columns", [
+        # Cleaned values and integer quality codes per metric, so pages stop re-evaluating
+        # CASE expressions over the text flags on every row
+        materialize_quality_columns,
+    ]),
+    ("weather_coverage_monthly", [
+        # Valid days per station, metric and month, for the coverage heatmap
+        coverage_utils.build_coverage_table,
+    ]),
+    ("weather_availability", [
+        # Per station and metric bitsets of the days with a value, for coverage pruning
+        availability.build_availability_table,
+    ]),
+    ("weather_catalog", [
+        # First/last date, record count and quality breakdown per station and metric
+        station_catalog.build_catalog_table,
+    ]),
+    ("weather_cube", [
+        # Metric sums and counts by station, region, state and nation, per day and month
+        aggregate_cube.build_cube,
+    ]),
+]
+
+# The migrations that build something from weather_data's rows, and how maintain rebuilds it
+DERIVED_TABLES = [
+    # Rows imported while the triggers were missing (e.g. a reloaded table)
+    ("weather_data_quality_columns", materialize_quality_columns),
+    ("weather_coverage_monthly", coverage_utils.build_coverage_table),
+    ("weather_availability", availability.build_availability_table),
+    ("weather_catalog", station_catalog.build_catalog_table),
+    ("weather_cube", aggregate_cube.build_cube),
+]
+
+# Benchmark cases whose SQL has to stay on an index
+HOT_CASES = (
+    "utils.get_filtered_climate_data",
+    "utils.get_focused_climate_data",
+    "utils.get_similar_climate_metrics",
+    "utils.get_station_similarity_data",
+    "page./focused",
+)
+
+
+def get_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def refresh_derived_tables(conn, skip=()):
+    """
+    Bring the tables and columns derived from weather_data up to date after an import,
+    in one transaction; skip names the migrations whose tables are already current
+    """
+    builds = [build for name, build in DERIVED_TABLES if name not in skip]
+    if not builds:
+        return
+    try:
+        conn.execute("BEGIN")
+        for build in builds:
+            build(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def migrate(conn):
+    """Apply the migrations newer than the database's user_version; returns their names"""
+    applied = []
+    version = get_version(conn)
+    for number, (name, steps) in enumerate(MIGRATIONS, start=1):
+        if number <= version:
+            continue
+        try:
+            conn.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            # PRAGMA arguments can't be bound parameters
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Applied migration %d (%s)", number, name)
+        applied.append(name)
+    return applied
+
+
+def maintain(conn, vacuum=True):
+    """Apply migrations, set the durable PRAGMAs and refresh planner statistics"""
+    applied = migrate(conn)
+
+    # Tables the migrations just built are already current
+    refresh_derived_tables(conn, skip=applied)
+
+    # mmap_size only lasts for this connection (db_utils sets it on every connection),
+    # but it speeds up the VACUUM and ANALYZE below
+    conn.execute(f"PRAGMA mmap_size = {config.SQLITE_MMAP_MB * 1024 * 1024}")
+
+    if vacuum:
+        # The page size can only change on a VACUUM outside WAL mode
+        conn.execute("PRAGMA journal_mode = DELETE")
+        conn.execute(f"PRAGMA page_size = {config.SQLITE_PAGE_SIZE}")
+        conn.execute("VACUUM")
+    conn.execute("PRAGMA journal_mode = WAL")
+
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return applied
+
+
+def get_status(conn):
+    return {
+        "version": get_version(conn),
+        "latest_version": len(MIGRATIONS),
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "journal_mode": conn.execute("PRAGMA journal_mode").fetchone()[0],
+        "quality_columns": quality_flags.has_materialized_columns(conn),
+        "analyzed": conn.execute(
+            "SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()[0] > 0,
+    }
+
+
+def capture_hot_queries(database=None):
+    """Run the HOT_CASES and return the distinct SELECT statements they executed"""
+    import benchmark
+
+    database = database or config.DATABASE_PATH
+    previous_database = config.DATABASE_PATH
+    config.DATABASE_PATH = database
+    statements = []
+    try:
+        cases = dict(benchmark.build_cases(benchmark.get_dataset_profile(database)))
+        for name in HOT_CASES:
+            profile = instrumentation.start_request("plan-check:" + name)
+            profile.sql_log = []
+            try:
+                cases[name]()
+            finally:
+                instrumentation.finish_request()
+            statements.extend((name, sql) for sql in profile.sql_log)
+    finally:
+        config.DATABASE_PATH = previous_database
+
+    seen = set()
+    hot = []
+    for name, sql in statements:
+        if sql.lstrip().upper().startswith("SELECT") and sql not in seen:
+            seen.add(sql)
+            hot.append((name, sql))
+    return hot
+
+
+def weather_data_names(sql):
+    """weather_data and any alias it is given in the statement, as EXPLAIN QUERY PLAN reports them"""
+    names = {"weather_data"}
+    for match in re.finditer(r"\bweather_data\s+(?:AS\s+)?(\w+)", sql, re.IGNORECASE):
+        if match.group(1).upper() not in ("WHERE", "JOIN", "GROUP", "ORDER", "LIMIT", "ON", "INNER", "LEFT"):
+            names.add(match.group(1))
+    return names
+
+
+def full_scans(conn, sql):
+    """Plan lines of sql that scan the whole of weather_data"""
+    names = weather_data_names(sql)
+    scans = []
+    for row in conn.execute("EXPLAIN QUERY PLAN " + sql):
+        detail = row[-1]
+        words = detail.split()
+        if len(words) >= 2 and words[0] == "SCAN" and words[1] in names:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans(database=None):
+    """(case, sql, scan details) for every hot query that does a full SCAN of weather_data"""
+    database = database or config.DATABASE_PATH
+    conn = db_utils.connect(database)
+    try:
+        problems = []
+        for name, sql in capture_hot_queries(database):
+            scans = full_scans(conn, sql)
+            if scans:
+                problems.append((name, sql, scans))
+        return problems
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Climate database schema migrations")
+    sub = parser.add_subparsers(dest="command", required=True)
+    commands = {}
+    for command in ("migrate", "maintain", "status", "check-plans"):
+        commands[command] = sub.add_parser(command)
+        commands[command].add_argument("--db", default=None,
+                                       help="Database file (default: config.DATABASE_PATH)")
+    commands["maintain"].add_argument("--no-vacuum", action="store_true",
+                                      help="Skip VACUUM (the page size then stays as it is)")
+    args = parser.parse_args(argv)
+    database = args.db or config.DATABASE_PATH
+
+    if args.command != "check-plans":
+        # Autocommit mode: migrate() manages its own transactions, VACUUM can't run inside one
+        conn = db_utils.connect(database, writable=True)
+        conn.isolation_level = None
+        try:
+            if args.command == "migrate":
+                applied = migrate(conn)
+            elif args.command == "maintain":
+                applied = maintain(conn, vacuum=not args.no_vacuum)
+            else:
+                applied = []
+            for name in applied:
+                print(f"Applied {name}")
+            for key, value in get_status(conn).items():
+                print(f"{key}: {value}")
+        finally:
+            conn.close()
+        return 0
+
+    problems = check_query_plans(database)
+    for name, sql, scans in problems:
+        print(f"{name}: full scan of weather_data ({'; '.join(scans)})")
+        print("    " + " ".join(sql.split()))
+    print(f"{len(problems)} hot queries scan weather_data")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
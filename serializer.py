@@ -0,0 +1,59 @@
+import json
+
+# Optional faster backend, the standard library is always available as a fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_stdlib_encoder = json.JSONEncoder(separators=(",", ":"))
+
+_backend = "orjson" if orjson is not None else "json"
+
+def get_backend():
+    """Name of the JSON backend currently in use"""
+    return _backend
+
+def set_backend(name):
+    """Select the JSON backend ("orjson" or "json"); unavailable backends fall back to json"""
+    global _backend
+    if name == "orjson" and orjson is not None:
+        _backend = "orjson"
+    else:
+        _backend = "json"
+    return _backend
+
+def dumps(obj):
+    """Encode obj as a compact JSON string"""
+    if _backend == "orjson":
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            # orjson is stricter (e.g. non-str keys); let the stdlib handle those
+            pass
+    return _stdlib_encoder.encode(obj)
+
+def loads(text):
+    """Decode a JSON string or bytes produced by dumps"""
+    if _backend == "orjson":
+        return orjson.loads(text)
+    return json.loads(text)
+
+def dumps_bytes(obj):
+    """Encode obj as UTF-8 JSON bytes, ready to write to a socket"""
+    if _backend == "orjson":
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return _stdlib_encoder.encode(obj).encode("utf-8")
+
+def iterencode(obj):
+    """Yield the JSON encoding of obj in chunks so large responses can be streamed"""
+    if _backend == "orjson":
+        try:
+            yield orjson.dumps(obj).decode("utf-8")
+            return
+        except TypeError:
+            pass
+    yield from _stdlib_encoder.iterencode(obj)
@@ -1,14 +1,19 @@
-import sqlite3
-import json
+import db_utils
+import quality_flags
+import serializer
 from datetime import datetime
 from collections import defaultdict
+from log_utils import get_logger
 
-def debug(msg):
-    print(f"DEBUG: {msg}")
+logger = get_logger(__name__)
+
+def debug(msg, *args):
+    """Lazy debug logging: msg is only %-formatted with args when DEBUG is enabled"""
+    logger.debug(msg, *args)
 
 def determine_granularity(start_date, end_date):
     delta = (end_date - start_date).days
-    debug(f"Determining granularity for delta days: {delta}")
+    debug("Determining granularity for delta days: %s", delta)
     if delta <= 90:
         return 'daily'
     elif delta <= 730:
@@ -25,7 +30,7 @@ def parse_dmy_to_date(dmy_str):
 
 def aggregate_by_granularity(data, granularity):
     grouped = defaultdict(list)
-    debug(f"Aggregating {len(data)} rows by granularity '{granularity}'")
+    debug("Aggregating %d rows by granularity '%s'", len(data), granularity)
     for dmy, value in data:
         date_obj = parse_dmy_to_date(dmy)
         if not date_obj or value is None:
@@ -43,17 +48,17 @@ def aggregate_by_granularity(data, granularity):
             key = date_obj.strftime("%Y")
         grouped[key].append(numeric_value)
     aggregated = {str(k): sum(v) / len(v) for k, v in grouped.items() if v}
-    debug(f"Aggregated into {len(aggregated)} groups")
+    debug("Aggregated into %d groups", len(aggregated))
     return aggregated
 
 def get_similar_climate_metrics(form_data):
-    debug(f"Received form_data with keys: {list(form_data.keys())}")
+    debug("Received form_data with keys: %s", form_data.keys())
 
     try:
         start_date = datetime.strptime(form_data["start_date"], "%Y-%m-%d")
         end_date = datetime.strptime(form_data["end_date"], "%Y-%m-%d")
     except Exception as e:
-        return json.dumps({"error": f"Invalid date format: {e}"})
+        return serializer.dumps({"error": f"Invalid date format: {e}"})
 
     reference_metric = form_data.get("reference_metric", "")
     selected_metrics = form_data.get("other_metrics", [])
@@ -64,23 +69,24 @@ def get_similar_climate_metrics(form_data):
     elif not isinstance(selected_metrics, list):
         selected_metrics = list(selected_metrics)
 
-    debug(f"Reference metric: '{reference_metric}'")
-    debug(f"Selected other metrics: {selected_metrics}")
+    debug("Reference metric: '%s'", reference_metric)
+    debug("Selected other metrics: %s", selected_metrics)
 
     if not reference_metric:
-        return json.dumps({"error": "Reference metric not specified."})
+        return serializer.dumps({"error": "Reference metric not specified."})
 
     # Make sure no duplicate of reference_metric in other_metrics
     selected_metrics = [m for m in selected_metrics if m != reference_metric]
 
     all_metrics = [reference_metric] + selected_metrics
-    debug(f"All metrics to process: {all_metrics}")
+    debug("All metrics to process: %s", all_metrics)
 
     granularity = determine_granularity(start_date, end_date)
-    debug(f"Using granularity: {granularity}")
+    debug("Using granularity: %s", granularity)
 
-    conn = sqlite3.connect("climate.db")
+    conn = db_utils.connect()
     cur = conn.cursor()
+    quality = quality_flags.QualityFilter.for_connection(conn, quality_flags.get_exclude(form_data))
 
     metric_series = {}
 
@@ -88,29 +94,29 @@ def get_similar_climate_metrics(form_data):
         query = f"""
             SELECT DMY, {metric}
             FROM weather_data
-            WHERE {metric} IS NOT NULL
+            WHERE {quality.value_test(metric)}
               AND DMY != ''
               AND DMY BETWEEN ? AND ?
         """
         cur.execute(query, (form_data["start_date"], form_data["end_date"]))
         rows = cur.fetchall()
-        debug(f"Metric '{metric}' fetched {len(rows)} rows")
+        debug("Metric '%s' fetched %d rows", metric, len(rows))
 
         aggregated = aggregate_by_granularity(rows, granularity)
-        debug(f"Metric '{metric}' aggregated into {len(aggregated)} groups")
+        debug("Metric '%s' aggregated into %d groups", metric, len(aggregated))
 
         if not aggregated:
-            debug(f"No data found for metric '{metric}', skipping")
+            debug("No data found for metric '%s', skipping", metric)
             continue
 
         sorted_dates = sorted(aggregated.keys())
         start_val = aggregated[sorted_dates[0]]
-        debug(f"Start value for metric '{metric}' on '{sorted_dates[0]}': {start_val}")
+        debug("Start value for metric '%s' on '%s': %s", metric, sorted_dates[0], start_val)
 
         # **NEW STRONGER CHECK**:
         # Skip metric if start_val is zero or close to zero to avoid wild percent changes
         if start_val is None or abs(start_val) < 1e-6:
-            debug(f"Start value for metric '{metric}' is zero or near zero; skipping metric.")
+            debug("Start value for metric '%s' is zero or near zero; skipping metric.", metric)
             continue
 
         series = []
@@ -119,7 +125,8 @@ def get_similar_climate_metrics(form_data):
             try:
                 date_str = d if granularity != 'monthly' else d + "-01"
                 percent_change = ((v - start_val) / start_val) * 100
-                series.append({"date": date_str, "value": percent_change})
+                # Pre-rounded so the chart payload encodes to short literals
+                series.append({"date": date_str, "value": round(percent_change, 4)})
             except Exception:
                 continue
 
@@ -127,21 +134,21 @@ def get_similar_climate_metrics(form_data):
 
     conn.close()
 
-    debug(f"Compiled metric_series keys: {list(metric_series.keys())}")
+    debug("Compiled metric_series keys: %s", metric_series.keys())
 
     if reference_metric not in metric_series:
-        return json.dumps({"error": "Reference metric not found or lacks data."})
+        return serializer.dumps({"error": "Reference metric not found or lacks data."})
 
     others = {k: v for k, v in metric_series.items() if k != reference_metric}
-    debug(f"Other metrics series keys: {list(others.keys())}")
+    debug("Other metrics series keys: %s", others.keys())
 
     result = {
         "reference": reference_metric,
         "reference_series": metric_series[reference_metric],
         "other_series": others
     }
-    debug(f"Result prepared for JSON response")
-    print("DEBUG: Final JSON response:")
-    print(json.dumps(result))
+    debug("Result prepared for JSON response")
+    response = serializer.dumps(result)
+    debug("Final JSON response: %s", response)
 
-    return json.dumps(result)
+    return response
@@ -1,8 +1,88 @@
 from level3_similarity_utils import get_station_similarity_data, get_available_stations, get_station_metrics_data
-import json
+import db_utils
+import serializer
+from template_engine import Template
+import instrumentation
+import pyhtml
+import static_assets
+from singleflight import normalize_form
+from log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Page CSS and JS live in static/ and are linked by fingerprinted URL (see static_assets)
+STYLESHEET_LINK = f'<link rel="stylesheet" href="{static_assets.url("css/similarity.css")}">'
+SCRIPT_TAG = f'<script src="{static_assets.url("js/similarity.js")}"></script>'
+
+# (database generation, pre-rendered station <optgroup>/<option> list with nothing selected)
+_station_options = (None, "")
+
+def build_station_options_html(stations):
+    """Station options grouped by state, with a blank where the selected attribute goes"""
+    stations_by_state = {}
+    for station_id, name, state in stations:
+        if state not in stations_by_state:
+            stations_by_state[state] = []
+        stations_by_state[state].append((station_id, name))
+
+    parts = []
+    for state in sorted(stations_by_state.keys()):
+        parts.append(f'<optgroup label="{state}">')
+        for station_id, name in sorted(stations_by_state[state], key=lambda x: x[1]):
+            parts.append(f'<option value="{station_id}" >{name} ({station_id})</option>')
+        parts.append('</optgroup>')
+    return "".join(parts)
+
+def get_station_options_html(reference_station):
+    """
+    Cached station options, rebuilt only when the database changes
+    Only the reference station's option is patched per request
+    """
+    global _station_options
+    generation = db_utils.database_generation()
+    cached_generation, options_html = _station_options
+    if cached_generation != generation:
+        stations = get_available_stations()
+        options_html = build_station_options_html(stations)
+        # An empty list may come from a failed query; cached, it would stick until the file changed
+        if stations:
+            _station_options = (generation, options_html)
+    if not reference_station:
+        return options_html
+    return options_html.replace(f'<option value="{reference_station}" >',
+                                f'<option value="{reference_station}" selected>', 1)
+
+def get_similarity_class(score):
+    if score < 5:
+        return "very-similar"
+    elif score < 15:
+        return "similar"
+    elif score < 30:
+        return "somewhat-similar"
+    else:
+        return "not-similar"
+
+def get_pattern_description(primary_change, secondary_change, ref_primary, ref_secondary):
+    primary_direction = "↑" if primary_change > 0 else "↓"
+    secondary_direction = "↑" if secondary_change > 0 else "↓"
+    ref_primary_direction = "↑" if ref_primary > 0 else "↓"
+    ref_secondary_direction = "↑" if ref_secondary > 0 else "↓"
+    
+    if (primary_direction == ref_primary_direction and 
+        secondary_direction == ref_secondary_direction):
+        return f"Same trend {primary_direction}{secondary_direction}"
+    else:
+        return f"Different trend {primary_direction}{secondary_direction}"
 
 def get_page_html(form_data):
-    print("Generating Weather Station Similarity Analysis Page...")
+    return "".join(iter_page_html(form_data))
+
+def iter_page_html(form_data):
+    """
+    Yield the page in two chunks: the head and form straight away, then the
+    results once the analysis has run (pyhtml streams them with chunked encoding)
+    """
+    logger.info("Generating Weather Station Similarity Analysis Page...")
 
     analysis_results = None
     error_message = None
@@ -16,11 +96,37 @@ def get_page_html(form_data):
     period2_start = form_data.get("period2_start", "") if form_data else ""
     period2_end = form_data.get("period2_end", "") if form_data else ""
     num_stations = form_data.get("num_stations", "5") if form_data else "5"
+    min_coverage = form_data.get("min_coverage", "0") if form_data else "0"
+
+    # Get available metrics
+    valid_metrics = [
+        "precipitation", "evaporation", "maxTemp", "minTemp", "sunshine",
+        "humid00", "humid03", "humid06", "humid09", "humid12", "humid15", "humid18", "humid21"
+    ]
+
+    context = {
+        "stylesheet_link": STYLESHEET_LINK,
+        "script_tag": SCRIPT_TAG,
+        "station_options": get_station_options_html(reference_station),
+        "valid_metrics": valid_metrics,
+        "primary_metric": primary_metric,
+        "secondary_metric": secondary_metric,
+        "period1_start": period1_start,
+        "period1_end": period1_end,
+        "period2_start": period2_start,
+        "period2_end": period2_end,
+        "num_stations": num_stations,
+        "min_coverage": min_coverage,
+    }
+    yield FORM_TEMPLATE.render(context)
 
     if form_data and form_data.get("action") == "find_similar":
         try:
-            result_json = get_station_similarity_data(form_data)
-            result_dict = json.loads(result_json)
+            with instrumentation.phase("analysis"):
+                # Identical submissions already running share their result
+                result_json = pyhtml.coalesced_call(("similarity", normalize_form(form_data)),
+                                                    get_station_similarity_data, form_data)
+            result_dict = serializer.loads(result_json)
             if "error" in result_dict:
                 error_message = result_dict["error"]
             else:
@@ -28,178 +134,32 @@ def get_page_html(form_data):
         except Exception as e:
             error_message = f"Analysis error: {str(e)}"
 
-    # Get available stations and metrics
-    available_stations = get_available_stations()
-    valid_metrics = [
-        "precipitation", "evaporation", "maxTemp", "minTemp", "sunshine",
-        "humid00", "humid03", "humid06", "humid09", "humid12", "humid15", "humid18", "humid21"
-    ]
+    context["error_message"] = error_message
+    context["analysis_results"] = analysis_results
+
+    if analysis_results:
+        ref_station = analysis_results["reference_station"]
+        similar_stations = analysis_results["similar_stations"]
+        context["ref_station"] = ref_station
+        context["similar_stations"] = similar_stations
+        context["params"] = analysis_results["parameters"]
+        context["rows"] = [
+            (idx, station, get_similarity_class(station["similarity_score"]),
+             get_pattern_description(station["primary_change"], station["secondary_change"],
+                                     ref_station["primary_change"], ref_station["secondary_change"]))
+            for idx, station in enumerate(similar_stations, 1)
+        ]
+
+    yield RESULTS_TEMPLATE.render(context)
 
-    page_html = """<!DOCTYPE html>
+
+# Page templates, compiled once at import: the form, then the error/results section
+FORM_TEMPLATE = Template("""<!DOCTYPE html>
 <html lang="en">
 <head>
     <title>Weather Station Similarity Analysis</title>
     <script src="https://cdn.jsdelivr.net/npm/chart.js"></script>
-    <style>
-        body { 
-            font-family: Arial, sans-serif; 
-            max-width: 1400px; 
-            margin: auto; 
-            padding: 20px; 
-            background: #f8f9fa;
-        }
-        h1, h2 { color: #2c3e50; }
-        .form-container {
-            background: white;
-            padding: 30px;
-            border-radius: 12px;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            margin-bottom: 25px;
-        }
-        .form-section {
-            margin-bottom: 25px;
-            padding: 20px;
-            border: 1px solid #e9ecef;
-            border-radius: 8px;
-            background: #f8f9fa;
-        }
-        .form-section h3 {
-            margin-top: 0;
-            color: #495057;
-            border-bottom: 2px solid #007bff;
-            padding-bottom: 8px;
-        }
-        .form-row {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(200px, 1fr));
-            gap: 15px;
-            margin-bottom: 15px;
-        }
-        .form-group {
-            display: flex;
-            flex-direction: column;
-        }
-        label {
-            font-weight: bold;
-            color: #495057;
-            margin-bottom: 5px;
-        }
-        select, input {
-            padding: 10px;
-            border: 1px solid #ced4da;
-            border-radius: 6px;
-            font-size: 14px;
-        }
-        select:focus, input:focus {
-            outline: none;
-            border-color: #007bff;
-            box-shadow: 0 0 5px rgba(0,123,255,0.25);
-        }
-        button {
-            background: linear-gradient(45deg, #007bff, #0056b3);
-            color: white;
-            border: none;
-            padding: 12px 25px;
-            border-radius: 6px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: bold;
-            transition: all 0.3s ease;
-        }
-        button:hover { transform: translateY(-2px); box-shadow: 0 4px 15px rgba(0,123,255,0.3); }
-        .results-container {
-            background: white;
-            padding: 30px;
-            border-radius: 12px;
-            box-shadow: 0 4px 15px rgba(0,0,0,0.1);
-            margin-bottom: 25px;
-        }
-        .analysis-summary {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 25px;
-        }
-        .reference-info {
-            background: #e3f2fd;
-            padding: 20px;
-            border-radius: 8px;
-            border-left: 5px solid #2196f3;
-            margin-bottom: 25px;
-        }
-        .metrics-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(150px, 1fr));
-            gap: 15px;
-            margin: 15px 0;
-        }
-        .metric-card {
-            text-align: center;
-            padding: 15px;
-            background: white;
-            border-radius: 8px;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }
-        .metric-card h4 { margin: 0 0 10px 0; color: #2c3e50; }
-        .metric-value { font-size: 1.4em; font-weight: bold; color: #007bff; }
-        .change-indicator {
-            display: inline-block;
-            padding: 2px 8px;
-            border-radius: 12px;
-            font-size: 0.85em;
-            font-weight: bold;
-        }
-        .increase { background: #ffebee; color: #c62828; }
-        .decrease { background: #e8f5e8; color: #2e7d32; }
-        table {
-            width: 100%;
-            border-collapse: collapse;
-            margin-top: 20px;
-            background: white;
-            border-radius: 8px;
-            overflow: hidden;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }
-        th, td {
-            padding: 12px;
-            text-align: left;
-            border-bottom: 1px solid #e9ecef;
-        }
-        th {
-            background: #495057;
-            color: white;
-            font-weight: bold;
-        }
-        tr:hover { background: #f8f9fa; }
-        .similarity-score {
-            font-weight: bold;
-            padding: 6px 12px;
-            border-radius: 20px;
-            color: white;
-            text-align: center;
-        }
-        .very-similar { background: #28a745; }
-        .similar { background: #17a2b8; }
-        .somewhat-similar { background: #ffc107; color: #212529; }
-        .not-similar { background: #dc3545; }
-        .error {
-            color: #721c24;
-            background: #f8d7da;
-            padding: 15px;
-            border-radius: 6px;
-            border: 1px solid #f5c6cb;
-            margin: 15px 0;
-        }
-        canvas { max-width: 100%; margin: 20px 0; }
-        .chart-container {
-            background: white;
-            padding: 20px;
-            border-radius: 8px;
-            margin: 15px 0;
-            box-shadow: 0 2px 8px rgba(0,0,0,0.1);
-        }
-    </style>
+    {{ stylesheet_link }}
 </head>
 <body>
     <h1>🔍 Weather Station Similarity Analysis</h1>
@@ -213,48 +173,19 @@ def get_page_html(form_data):
                     <div class="form-group">
                         <label>Reference Weather Station:</label>
                         <select name="reference_station" required>
-                            <option value="">Choose reference station...</option>"""
-
-    # Group stations by state
-    stations_by_state = {}
-    for station_id, name, state in available_stations:
-        if state not in stations_by_state:
-            stations_by_state[state] = []
-        stations_by_state[state].append((station_id, name))
-
-    # Add station options grouped by state
-    for state in sorted(stations_by_state.keys()):
-        page_html += f'<optgroup label="{state}">'
-        for station_id, name in sorted(stations_by_state[state], key=lambda x: x[1]):
-            selected = "selected" if str(station_id) == reference_station else ""
-            page_html += f'<option value="{station_id}" {selected}>{name} ({station_id})</option>'
-        page_html += '</optgroup>'
-
-    page_html += f"""
+                            <option value="">Choose reference station...</option>{{ station_options }}
                         </select>
                     </div>
                     <div class="form-group">
                         <label>Primary Climate Metric:</label>
                         <select name="primary_metric" required>
-                            <option value="">Choose primary metric...</option>"""
-
-    for metric in valid_metrics:
-        selected = "selected" if metric == primary_metric else ""
-        page_html += f'<option value="{metric}" {selected}>{metric}</option>'
-
-    page_html += f"""
+                            <option value="">Choose primary metric...</option>{% for metric in valid_metrics %}<option value="{{ metric }}" {{ "selected" if metric == primary_metric else "" }}>{{ metric }}</option>{% endfor %}
                         </select>
                     </div>
                     <div class="form-group">
                         <label>Secondary Climate Metric:</label>
                         <select name="secondary_metric" required>
-                            <option value="">Choose secondary metric...</option>"""
-
-    for metric in valid_metrics:
-        selected = "selected" if metric == secondary_metric else ""
-        page_html += f'<option value="{metric}" {selected}>{metric}</option>'
-
-    page_html += f"""
+                            <option value="">Choose secondary metric...</option>{% for metric in valid_metrics %}<option value="{{ metric }}" {{ "selected" if metric == secondary_metric else "" }}>{{ metric }}</option>{% endfor %}
                         </select>
                     </div>
                 </div>
@@ -265,19 +196,19 @@ def get_page_html(form_data):
                 <div class="form-row">
                     <div class="form-group">
                         <label>Period 1 Start:</label>
-                        <input type="date" name="period1_start" value="{period1_start}" min="1970-01-01" max="2020-12-31" required>
+                        <input type="date" name="period1_start" value="{{ period1_start }}" min="1970-01-01" max="2020-12-31" required>
                     </div>
                     <div class="form-group">
                         <label>Period 1 End:</label>
-                        <input type="date" name="period1_end" value="{period1_end}" min="1970-01-01" max="2020-12-31" required>
+                        <input type="date" name="period1_end" value="{{ period1_end }}" min="1970-01-01" max="2020-12-31" required>
                     </div>
                     <div class="form-group">
                         <label>Period 2 Start:</label>
-                        <input type="date" name="period2_start" value="{period2_start}" min="1970-01-01" max="2020-12-31" required>
+                        <input type="date" name="period2_start" value="{{ period2_start }}" min="1970-01-01" max="2020-12-31" required>
                     </div>
                     <div class="form-group">
                         <label>Period 2 End:</label>
-                        <input type="date" name="period2_end" value="{period2_end}" min="1970-01-01" max="2020-12-31" required>
+                        <input type="date" name="period2_end" value="{{ period2_end }}" min="1970-01-01" max="2020-12-31" required>
                     </div>
                 </div>
             </div>
@@ -288,10 +219,19 @@ def get_page_html(form_data):
                     <div class="form-group">
                         <label>Number of Similar Stations to Find:</label>
                         <select name="num_stations">
-                            <option value="3" {"selected" if num_stations == "3" else ""}>3 stations</option>
-                            <option value="5" {"selected" if num_stations == "5" else ""}>5 stations</option>
-                            <option value="10" {"selected" if num_stations == "10" else ""}>10 stations</option>
-                            <option value="15" {"selected" if num_stations == "15" else ""}>15 stations</option>
+                            <option value="3" {{ "selected" if num_stations == "3" else "" }}>3 stations</option>
+                            <option value="5" {{ "selected" if num_stations == "5" else "" }}>5 stations</option>
+                            <option value="10" {{ "selected" if num_stations == "10" else "" }}>10 stations</option>
+                            <option value="15" {{ "selected" if num_stations == "15" else "" }}>15 stations</option>
+                        </select>
+                    </div>
+                    <div class="form-group">
+                        <label>Minimum Data Coverage of Compared Stations:</label>
+                        <select name="min_coverage">
+                            <option value="0" {{ "selected" if min_coverage == "0" else "" }}>Any</option>
+                            <option value="50" {{ "selected" if min_coverage == "50" else "" }}>50% of days</option>
+                            <option value="75" {{ "selected" if min_coverage == "75" else "" }}>75% of days</option>
+                            <option value="90" {{ "selected" if min_coverage == "90" else "" }}>90% of days</option>
                         </select>
                     </div>
                 </div>
@@ -299,50 +239,42 @@ def get_page_html(form_data):
 
             <button type="submit" name="action" value="find_similar">🔍 Find Similar Stations</button>
         </form>
-    </div>"""
-
-    if error_message:
-        page_html += f'<div class="error">❌ Error: {error_message}</div>'
-
-    if analysis_results:
-        ref_station = analysis_results["reference_station"]
-        similar_stations = analysis_results["similar_stations"]
-        params = analysis_results["parameters"]
+    </div>""", "similarity form")
 
-        page_html += f"""
+RESULTS_TEMPLATE = Template("""{% if error_message %}<div class="error">❌ Error: {{ error_message }}</div>{% endif %}{% if analysis_results %}
     <div class="results-container">
         <div class="analysis-summary">
             <h2>📊 Analysis Results</h2>
-            <p><strong>Reference Station:</strong> {ref_station["name"]} (ID: {ref_station["id"]})</p>
-            <p><strong>Metrics:</strong> {params["primary_metric"]} vs {params["secondary_metric"]}</p>
-            <p><strong>Period 1:</strong> {params["period1"]} | <strong>Period 2:</strong> {params["period2"]}</p>
+            <p><strong>Reference Station:</strong> {{ ref_station["name"] }} (ID: {{ ref_station["id"] }})</p>
+            <p><strong>Metrics:</strong> {{ params["primary_metric"] }} vs {{ params["secondary_metric"] }}</p>
+            <p><strong>Period 1:</strong> {{ params["period1"] }} | <strong>Period 2:</strong> {{ params["period2"] }}</p>
         </div>
 
         <div class="reference-info">
             <h3>📍 Reference Station Rate of Change</h3>
             <div class="metrics-grid">
                 <div class="metric-card">
-                    <h4>{params["primary_metric"]}</h4>
-                    <div class="metric-value">{ref_station["primary_change"]:.2f}%</div>
-                    <div class="change-indicator {'increase' if ref_station['primary_change'] > 0 else 'decrease'}">
-                        {'↑' if ref_station['primary_change'] > 0 else '↓'} 
-                        {abs(ref_station["primary_change"]):.2f}%
+                    <h4>{{ params["primary_metric"] }}</h4>
+                    <div class="metric-value">{{ format(ref_station["primary_change"], ".2f") }}%</div>
+                    <div class="change-indicator {{ 'increase' if ref_station['primary_change'] > 0 else 'decrease' }}">
+                        {{ '↑' if ref_station['primary_change'] > 0 else '↓' }} 
+                        {{ format(abs(ref_station["primary_change"]), ".2f") }}%
                     </div>
                     <div style="font-size: 0.85em; margin-top: 8px; color: #666;">
-                        Period 1: {ref_station["primary_period1_avg"]:.2f}<br>
-                        Period 2: {ref_station["primary_period2_avg"]:.2f}
+                        Period 1: {{ format(ref_station["primary_period1_avg"], ".2f") }}<br>
+                        Period 2: {{ format(ref_station["primary_period2_avg"], ".2f") }}
                     </div>
                 </div>
                 <div class="metric-card">
-                    <h4>{params["secondary_metric"]}</h4>
-                    <div class="metric-value">{ref_station["secondary_change"]:.2f}%</div>
-                    <div class="change-indicator {'increase' if ref_station['secondary_change'] > 0 else 'decrease'}">
-                        {'↑' if ref_station['secondary_change'] > 0 else '↓'} 
-                        {abs(ref_station["secondary_change"]):.2f}%
+                    <h4>{{ params["secondary_metric"] }}</h4>
+                    <div class="metric-value">{{ format(ref_station["secondary_change"], ".2f") }}%</div>
+                    <div class="change-indicator {{ 'increase' if ref_station['secondary_change'] > 0 else 'decrease' }}">
+                        {{ '↑' if ref_station['secondary_change'] > 0 else '↓' }} 
+                        {{ format(abs(ref_station["secondary_change"]), ".2f") }}%
                     </div>
                     <div style="font-size: 0.85em; margin-top: 8px; color: #666;">
-                        Period 1: {ref_station["secondary_period1_avg"]:.2f}<br>
-                        Period 2: {ref_station["secondary_period2_avg"]:.2f}
+                        Period 1: {{ format(ref_station["secondary_period1_avg"], ".2f") }}<br>
+                        Period 2: {{ format(ref_station["secondary_period2_avg"], ".2f") }}
                     </div>
                 </div>
             </div>
@@ -358,63 +290,30 @@ def get_page_html(form_data):
                         <th>State</th>
                         <th>Location</th>
                         <th>Similarity Score</th>
-                        <th>{params["primary_metric"]} Change</th>
-                        <th>{params["secondary_metric"]} Change</th>
+                        <th>{{ params["primary_metric"] }} Change</th>
+                        <th>{{ params["secondary_metric"] }} Change</th>
                         <th>Pattern Match</th>
                     </tr>
                 </thead>
-                <tbody>"""
-
-        def get_similarity_class(score):
-            if score < 5:
-                return "very-similar"
-            elif score < 15:
-                return "similar"
-            elif score < 30:
-                return "somewhat-similar"
-            else:
-                return "not-similar"
-
-        def get_pattern_description(primary_change, secondary_change, ref_primary, ref_secondary):
-            primary_direction = "↑" if primary_change > 0 else "↓"
-            secondary_direction = "↑" if secondary_change > 0 else "↓"
-            ref_primary_direction = "↑" if ref_primary > 0 else "↓"
-            ref_secondary_direction = "↑" if ref_secondary > 0 else "↓"
-            
-            if (primary_direction == ref_primary_direction and 
-                secondary_direction == ref_secondary_direction):
-                return f"Same trend {primary_direction}{secondary_direction}"
-            else:
-                return f"Different trend {primary_direction}{secondary_direction}"
-
-        for idx, station in enumerate(similar_stations, 1):
-            similarity_class = get_similarity_class(station["similarity_score"])
-            pattern = get_pattern_description(
-                station["primary_change"], station["secondary_change"],
-                ref_station["primary_change"], ref_station["secondary_change"]
-            )
-            
-            page_html += f"""
+                <tbody>{% for idx, station, similarity_class, pattern in rows %}
                     <tr>
-                        <td><strong>#{idx}</strong></td>
-                        <td>{station["name"]}</td>
-                        <td>{station["state"]}</td>
-                        <td>{station["latitude"]:.3f}, {station["longitude"]:.3f}</td>
-                        <td><span class="similarity-score {similarity_class}">{station["similarity_score"]:.2f}</span></td>
+                        <td><strong>#{{ idx }}</strong></td>
+                        <td>{{ station["name"] }}</td>
+                        <td>{{ station["state"] }}</td>
+                        <td>{{ format(station["latitude"], ".3f") }}, {{ format(station["longitude"], ".3f") }}</td>
+                        <td><span class="similarity-score {{ similarity_class }}">{{ format(station["similarity_score"], ".2f") }}</span></td>
                         <td>
-                            <span class="change-indicator {'increase' if station['primary_change'] > 0 else 'decrease'}">
-                                {station["primary_change"]:.2f}%
+                            <span class="change-indicator {{ 'increase' if station['primary_change'] > 0 else 'decrease' }}">
+                                {{ format(station["primary_change"], ".2f") }}%
                             </span>
                         </td>
                         <td>
-                            <span class="change-indicator {'increase' if station['secondary_change'] > 0 else 'decrease'}">
-                                {station["secondary_change"]:.2f}%
+                            <span class="change-indicator {{ 'increase' if station['secondary_change'] > 0 else 'decrease' }}">
+                                {{ format(station["secondary_change"], ".2f") }}%
                             </span>
                         </td>
-                        <td>{pattern}</td>
-                    </tr>"""
-
-        page_html += """
+                        <td>{{ pattern }}</td>
+                    </tr>{% endfor %}
                 </tbody>
             </table>
         </div>
@@ -435,15 +334,12 @@ def get_page_html(form_data):
         const changeCtx = document.getElementById('changeChart').getContext('2d');
         
         const referenceData = [{
-            x: """ + str(ref_station["primary_change"]) + """,
-            y: """ + str(ref_station["secondary_change"]) + """,
-            label: '""" + ref_station["name"] + """ (Reference)'
+            x: {{ ref_station["primary_change"] }},
+            y: {{ ref_station["secondary_change"] }},
+            label: '{{ ref_station["name"] }} (Reference)'
         }];
         
-        const similarStationsData = [""" + ",".join([
-            f'{{x: {station["primary_change"]}, y: {station["secondary_change"]}, label: "{station["name"]}", similarity: {station["similarity_score"]}}}'
-            for station in similar_stations
-        ]) + """];
+        const similarStationsData = [{% for i, station in enumerate(similar_stations) %}{{ "," if i else "" }}{x: {{ station["primary_change"] }}, y: {{ station["secondary_change"] }}, label: "{{ station["name"] }}", similarity: {{ station["similarity_score"] }}}{% endfor %}];
 
         new Chart(changeCtx, {
             type: 'scatter',
@@ -469,7 +365,7 @@ def get_page_html(form_data):
                 plugins: {
                     title: {
                         display: true,
-                        text: 'Rate of Change Comparison: """ + params["primary_metric"] + """ vs """ + params["secondary_metric"] + """'
+                        text: 'Rate of Change Comparison: {{ params["primary_metric"] }} vs {{ params["secondary_metric"] }}'
                     },
                     tooltip: {
                         callbacks: {
@@ -489,14 +385,14 @@ def get_page_html(form_data):
                     x: {
                         title: {
                             display: true,
-                            text: '""" + params["primary_metric"] + """ Change (%)'
+                            text: '{{ params["primary_metric"] }} Change (%)'
                         },
                         grid: { color: 'rgba(0,0,0,0.1)' }
                     },
                     y: {
                         title: {
                             display: true,
-                            text: '""" + params["secondary_metric"] + """ Change (%)'
+                            text: '{{ params["secondary_metric"] }} Change (%)'
                         },
                         grid: { color: 'rgba(0,0,0,0.1)' }
                     }
@@ -507,8 +403,8 @@ def get_page_html(form_data):
         // Similarity Score Bar Chart
         const similarityCtx = document.getElementById('similarityChart').getContext('2d');
         
-        const stationNames = [""" + ",".join([f'"{station["name"]}"' for station in similar_stations]) + """];
-        const similarityScores = [""" + ",".join([str(station["similarity_score"]) for station in similar_stations]) + """];
+        const stationNames = [{% for i, station in enumerate(similar_stations) %}{{ "," if i else "" }}"{{ station["name"] }}"{% endfor %}];
+        const similarityScores = [{% for i, station in enumerate(similar_stations) %}{{ "," if i else "" }}{{ station["similarity_score"] }}{% endfor %}];
         
         // Color bars based on similarity score
         const barColors = similarityScores.map(score => {
@@ -556,83 +452,9 @@ def get_page_html(form_data):
                 }
             }
         });
-    </script>"""
-
-    page_html += """
-    <script>
-        function validateForm() {
-            const period1Start = document.querySelector('input[name="period1_start"]').value;
-            const period1End = document.querySelector('input[name="period1_end"]').value;
-            const period2Start = document.querySelector('input[name="period2_start"]').value;
-            const period2End = document.querySelector('input[name="period2_end"]').value;
-            const primaryMetric = document.querySelector('select[name="primary_metric"]').value;
-            const secondaryMetric = document.querySelector('select[name="secondary_metric"]').value;
-            
-            if (period1Start && period1End && period1Start >= period1End) {
-                alert('Period 1 end date must be later than start date.');
-                return false;
-            }
-            
-            if (period2Start && period2End && period2Start >= period2End) {
-                alert('Period 2 end date must be later than start date.');
-                return false;
-            }
-            
-            if (primaryMetric && secondaryMetric && primaryMetric === secondaryMetric) {
-                alert('Primary and secondary metrics must be different.');
-                return false;
-            }
-            
-            return true;
-        }
-        
-        // Add dynamic validation for metric selection
-        document.addEventListener('DOMContentLoaded', function() {
-            const primarySelect = document.querySelector('select[name="primary_metric"]');
-            const secondarySelect = document.querySelector('select[name="secondary_metric"]');
-            
-            function updateMetricOptions() {
-                const primaryValue = primarySelect.value;
-                const secondaryValue = secondarySelect.value;
-                
-                // Reset all options
-                Array.from(primarySelect.options).forEach(option => {
-                    option.disabled = false;
-                    option.style.color = '';
-                });
-                Array.from(secondarySelect.options).forEach(option => {
-                    option.disabled = false;
-                    option.style.color = '';
-                });
-                
-                // Disable selected option in the other select
-                if (primaryValue) {
-                    Array.from(secondarySelect.options).forEach(option => {
-                        if (option.value === primaryValue) {
-                            option.disabled = true;
-                            option.style.color = '#ccc';
-                        }
-                    });
-                }
-                
-                if (secondaryValue) {
-                    Array.from(primarySelect.options).forEach(option => {
-                        if (option.value === secondaryValue) {
-                            option.disabled = true;
-                            option.style.color = '#ccc';
-                        }
-                    });
-                }
-            }
-            
-            primarySelect.addEventListener('change', updateMetricOptions);
-            secondarySelect.addEventListener('change', updateMetricOptions);
-            updateMetricOptions(); // Initial call
-        });
-    </script>
+    </script>{% endif %}
+    {{ script_tag }}
 
     <p><a href="/">← Back to Landing Page</a> | <a href="/focused">🔍 Focused Analysis</a> | <a href="/deep-dive">🌊 Deep Dive</a></p>
 </body>
-</html>"""
-    
-    return page_html
\ No newline at end of file
+</html>""", "similarity results")
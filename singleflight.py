@@ -0,0 +1,64 @@
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent calls: while a call for a key is in flight, other
+    callers with the same key wait for it and share its result (or exception)
+    instead of starting their own computation
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """Run func(*args, **kwargs) once per in-flight key; returns (result, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # Later requests start a fresh computation, so results never go stale
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def normalize_form(form_data):
+    """Hashable, field-order independent key for a submitted form"""
+    items = []
+    for key, value in (form_data or {}).items():
+        if isinstance(value, list):
+            value = tuple(value)
+        items.append((key, value))
+    return tuple(sorted(items))
@@ -0,0 +1,65 @@
+// Form validation and interactivity
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('analysisForm');
+    const primarySelect = document.getElementById('primary_metric');
+    const secondarySelect = document.getElementById('secondary_metric');
+    
+    // Prevent selecting same metric for both primary and secondary
+    function updateMetricOptions() {
+        const primaryValue = primarySelect.value;
+        const secondaryValue = secondarySelect.value;
+        
+        Array.from(primarySelect.options).forEach(option => {
+            option.disabled = option.value === secondaryValue && option.value !== '';
+        });
+        
+        Array.from(secondarySelect.options).forEach(option => {
+            option.disabled = option.value === primaryValue && option.value !== '';
+        });
+    }
+    
+    primarySelect.addEventListener('change', updateMetricOptions);
+    secondarySelect.addEventListener('change', updateMetricOptions);
+    updateMetricOptions();
+    
+    // Date validation
+    form.addEventListener('submit', function(e) {
+        const period1Start = new Date(document.getElementById('period1_start').value);
+        const period1End = new Date(document.getElementById('period1_end').value);
+        const period2Start = new Date(document.getElementById('period2_start').value);
+        const period2End = new Date(document.getElementById('period2_end').value);
+        
+        if (period1Start >= period1End) {
+            alert('Period 1 end date must be after start date');
+            e.preventDefault();
+            return;
+        }
+        
+        if (period2Start >= period2End) {
+            alert('Period 2 end date must be after start date');
+            e.preventDefault();
+            return;
+        }
+        
+        if (primarySelect.value === secondarySelect.value) {
+            alert('Primary and secondary metrics must be different');
+            e.preventDefault();
+            return;
+        }
+    });
+});
+
+// Auto-populate example dates based on reference station
+document.getElementById('reference_station').addEventListener('change', function() {
+    const period1Start = document.getElementById('period1_start');
+    const period1End = document.getElementById('period1_end');
+    const period2Start = document.getElementById('period2_start');
+    const period2End = document.getElementById('period2_end');
+    
+    if (this.value && !period1Start.value) {
+        period1Start.value = '2000-01-01';
+        period1End.value = '2009-12-31';
+        period2Start.value = '2010-01-01';
+        period2End.value = '2019-12-31';
+    }
+});
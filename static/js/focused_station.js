@@ -0,0 +1,127 @@
+function sortTable(column) {
+    const form = document.querySelector('form');
+    const sortInput = document.querySelector('input[name="sort"]');
+    const orderInput = document.querySelector('input[name="order"]');
+    
+    // Toggle order if same column, otherwise default to ascending
+    if (sortInput.value === column) {
+        orderInput.value = orderInput.value === 'asc' ? 'desc' : 'asc';
+    } else {
+        orderInput.value = 'asc';
+    }
+    
+    sortInput.value = column;
+    form.submit();
+}
+
+// Form validation
+document.querySelector('form').addEventListener('submit', function(e) {
+    const startLat = parseFloat(document.getElementById('start_latitude').value);
+    const endLat = parseFloat(document.getElementById('end_latitude').value);
+    
+    if (startLat >= endLat) {
+        alert('Start latitude must be less than end latitude');
+        e.preventDefault();
+        return false;
+    }
+    
+    if (startLat < -50 || startLat > 0 || endLat < -50 || endLat > 0) {
+        alert('Latitude values must be between -50 and 0 (Australian coordinates)');
+        e.preventDefault();
+        return false;
+    }
+});
+
+// Auto-populate example values based on state selection
+document.getElementById('state').addEventListener('change', function() {
+    const state = this.value;
+    const startLat = document.getElementById('start_latitude');
+    const endLat = document.getElementById('end_latitude');
+    
+    // Provide example latitude ranges for different states
+    const stateLatRanges = {
+        'W.A.': {start: -35.0, end: -13.0},
+        'N.T.': {start: -26.0, end: -11.0},
+        'QLD': {start: -29.0, end: -9.0},
+        'N.S.W.': {start: -37.5, end: -28.0},
+        'VIC': {start: -39.2, end: -34.0},
+        'S.A.': {start: -38.0, end: -26.0},
+        'TAS': {start: -43.7, end: -40.0}
+    };
+    
+    if (state && stateLatRanges[state] && !startLat.value && !endLat.value) {
+        startLat.value = stateLatRanges[state].start;
+        endLat.value = stateLatRanges[state].end;
+    }
+});
+
+// Climate data table: "Load more" appends the next page from the JSON endpoint
+function climateRow(record) {
+    // Mirrors format_climate_record() in focused_view_page_via_weather_stations.py
+    let value = record.value === null ? 'N/A' : record.value;
+    let valueClass = '';
+    if (typeof value === 'number') {
+        valueClass = value > 0 ? 'climate-positive' : 'climate-negative';
+        value = value.toFixed(2);
+    }
+    const cells = [
+        [record.location, 'station-id'],
+        [record.name, ''],
+        [record.date, ''],
+        [value, 'climate-value ' + valueClass],
+        [record.quality === null ? 'Unknown' : record.quality, '']
+    ];
+    const row = document.createElement('tr');
+    cells.forEach(function([text, className]) {
+        const cell = document.createElement('td');
+        cell.textContent = text;
+        if (className) {
+            cell.className = className.trim();
+        }
+        row.appendChild(cell);
+    });
+    return row;
+}
+
+const loadMoreButton = document.getElementById('load-more-climate');
+if (loadMoreButton) {
+    loadMoreButton.addEventListener('click', function() {
+        const button = this;
+        const params = new URLSearchParams({
+            state: button.dataset.state,
+            metric: button.dataset.metric,
+            start_lat: button.dataset.startLat,
+            end_lat: button.dataset.endLat,
+            cursor: button.dataset.cursor
+        });
+        if (button.dataset.excludeQuality !== undefined) {
+            params.set('exclude_quality', button.dataset.excludeQuality || 'none');
+        }
+        button.disabled = true;
+        fetch('/focused-station/climate-data?' + params)
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then(function(page) {
+                const rows = document.getElementById('climate-rows');
+                page.rows.forEach(function(record) {
+                    rows.appendChild(climateRow(record));
+                });
+                const count = document.getElementById('climate-record-count');
+                count.textContent = parseInt(count.textContent, 10) + page.rows.length;
+                if (page.next_cursor) {
+                    button.dataset.cursor = page.next_cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(function(error) {
+                button.disabled = false;
+                alert('Could not load more records: ' + error.message);
+            });
+    });
+}
@@ -0,0 +1,69 @@
+function validateForm() {
+    const period1Start = document.querySelector('input[name="period1_start"]').value;
+    const period1End = document.querySelector('input[name="period1_end"]').value;
+    const period2Start = document.querySelector('input[name="period2_start"]').value;
+    const period2End = document.querySelector('input[name="period2_end"]').value;
+    const primaryMetric = document.querySelector('select[name="primary_metric"]').value;
+    const secondaryMetric = document.querySelector('select[name="secondary_metric"]').value;
+    
+    if (period1Start && period1End && period1Start >= period1End) {
+        alert('Period 1 end date must be later than start date.');
+        return false;
+    }
+    
+    if (period2Start && period2End && period2Start >= period2End) {
+        alert('Period 2 end date must be later than start date.');
+        return false;
+    }
+    
+    if (primaryMetric && secondaryMetric && primaryMetric === secondaryMetric) {
+        alert('Primary and secondary metrics must be different.');
+        return false;
+    }
+    
+    return true;
+}
+
+// Add dynamic validation for metric selection
+document.addEventListener('DOMContentLoaded', function() {
+    const primarySelect = document.querySelector('select[name="primary_metric"]');
+    const secondarySelect = document.querySelector('select[name="secondary_metric"]');
+    
+    function updateMetricOptions() {
+        const primaryValue = primarySelect.value;
+        const secondaryValue = secondarySelect.value;
+        
+        // Reset all options
+        Array.from(primarySelect.options).forEach(option => {
+            option.disabled = false;
+            option.style.color = '';
+        });
+        Array.from(secondarySelect.options).forEach(option => {
+            option.disabled = false;
+            option.style.color = '';
+        });
+        
+        // Disable selected option in the other select
+        if (primaryValue) {
+            Array.from(secondarySelect.options).forEach(option => {
+                if (option.value === primaryValue) {
+                    option.disabled = true;
+                    option.style.color = '#ccc';
+                }
+            });
+        }
+        
+        if (secondaryValue) {
+            Array.from(primarySelect.options).forEach(option => {
+                if (option.value === secondaryValue) {
+                    option.disabled = true;
+                    option.style.color = '#ccc';
+                }
+            });
+        }
+    }
+    
+    primarySelect.addEventListener('change', updateMetricOptions);
+    secondarySelect.addEventListener('change', updateMetricOptions);
+    updateMetricOptions(); // Initial call
+});
@@ -0,0 +1,76 @@
+"""
+Fingerprinted static files (the pages' CSS and JS)
+
+Every file under static/ is read once at import and published at two URLs:
+
+    /static/css/similarity.css               revalidated on every use (Cache-Control: no-cache)
+    /static/css/similarity.1a2b3c4d5e6f.css  content hash in the name, cached for a year as immutable
+
+Pages link to the fingerprinted URL with url("css/similarity.css"), so browsers
+fetch a changed file under its new name and never re-download an unchanged one.
+"""
+import hashlib
+import mimetypes
+import os
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+URL_PREFIX = "/static/"
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Files at least this big are streamed from disk with socket.sendfile() instead of held in memory
+SENDFILE_MIN_BYTES = 256 * 1024
+
+CONTENT_TYPES = {
+    ".css": "text/css; charset=utf-8",
+    ".js": "text/javascript; charset=utf-8",
+}
+
+
+class StaticFile:
+    def __init__(self, name, path, data):
+        self.name = name
+        self.path = path
+        self.size = len(data)
+        digest = hashlib.sha256(data).hexdigest()
+        self.etag = f'"{digest[:16]}"'
+        root, ext = os.path.splitext(name)
+        self.fingerprinted_name = f"{root}.{digest[:12]}{ext}"
+        self.content_type = CONTENT_TYPES.get(ext) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        self.body = data if self.size < SENDFILE_MIN_BYTES else None
+
+
+_files = {}  # URL path -> (StaticFile, immutable)
+_urls = {}   # name relative to static/ -> fingerprinted URL
+
+
+def load(directory=STATIC_DIR):
+    """(Re)read every file under the static directory"""
+    files, urls = {}, {}
+    for root, dirs, names in os.walk(directory):
+        for filename in names:
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, directory).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                static_file = StaticFile(name, path, f.read())
+            files[URL_PREFIX + name] = (static_file, False)
+            files[URL_PREFIX + static_file.fingerprinted_name] = (static_file, True)
+            urls[name] = URL_PREFIX + static_file.fingerprinted_name
+    _files.clear()
+    _files.update(files)
+    _urls.clear()
+    _urls.update(urls)
+
+
+def url(name):
+    """Fingerprinted URL of a file under static/, e.g. url("css/similarity.css")"""
+    return _urls[name]
+
+
+def lookup(path):
+    """(StaticFile, immutable) for a request path, or None"""
+    return _files.get(path)
+
+
+load()
@@ -0,0 +1,132 @@
+"""
+Catalog of what each station has recorded, per metric
+
+weather_catalog holds one row per (station, metric) with a value: the first and last
+date with a value, how many days have one, and the breakdown of their quality flags
+(a JSON list of [flag, count] pairs, most common first). It is built by
+`schema_migrations.py migrate` and rebuilt by `maintain`, so date-picker bounds and
+the station summary panels are primary-key lookups instead of scans of weather_data.
+"""
+import json
+
+import db_utils
+import pyhtml
+import quality_flags
+import serializer
+
+CATALOG_TABLE = "weather_catalog"
+
+
+def build_catalog_table(conn):
+    """(Re)create and fill weather_catalog, one grouped query per metric"""
+    conn.execute(f"DROP TABLE IF EXISTS {CATALOG_TABLE}")
+    conn.execute(f"""
+        CREATE TABLE {CATALOG_TABLE} (
+            location INTEGER,
+            metric TEXT,
+            first_date TEXT,
+            last_date TEXT,
+            valid_records INTEGER,
+            quality_counts TEXT,
+            PRIMARY KEY (location, metric)
+        ) WITHOUT ROWID
+    """)
+    for metric in quality_flags.METRICS:
+        entries = {}
+        for location, flag, first, last, count in conn.execute(f"""
+            SELECT location, {metric}Qual, MIN(DMY), MAX(DMY), COUNT(*)
+            FROM weather_data
+            WHERE {quality_flags.has_value_sql(metric)}
+              AND DMY IS NOT NULL AND DMY != ''
+            GROUP BY location, {metric}Qual
+        """):
+            entry = entries.setdefault(location, {"first": first, "last": last, "counts": []})
+            entry["first"] = min(entry["first"], first)
+            entry["last"] = max(entry["last"], last)
+            entry["counts"].append([flag, count])
+        conn.executemany(f"INSERT INTO {CATALOG_TABLE} VALUES (?, ?, ?, ?, ?, ?)", [
+            (location, metric, entry["first"], entry["last"], sum(count for flag, count in entry["counts"]),
+             json.dumps(sorted(entry["counts"], key=lambda pair: -pair[1])))
+            for location, entry in entries.items()
+        ])
+
+
+def has_catalog(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (CATALOG_TABLE,)).fetchone() is not None
+
+
+def get_entry(conn, station_id, metric):
+    """
+    The catalog row for a station and metric as a dict, {} when the station never
+    recorded the metric, or None when the database has no catalog
+    """
+    if not has_catalog(conn):
+        return None
+    row = conn.execute(f"""
+        SELECT first_date, last_date, valid_records, quality_counts
+        FROM {CATALOG_TABLE}
+        WHERE location = ? AND metric = ?
+    """, (station_id, metric.lower())).fetchone()
+    if row is None:
+        return {}
+    return {
+        "first_date": row[0],
+        "last_date": row[1],
+        "valid_records": row[2],
+        "quality_counts": [tuple(pair) for pair in json.loads(row[3])],
+    }
+
+
+def get_station_ranges(conn, station_id):
+    """(metric, first date, last date, valid records) rows computed from weather_data, for a database without the catalog"""
+    columns = ", ".join(
+        f"MIN(CASE WHEN {quality_flags.has_value_sql(metric)} THEN DMY END), "
+        f"MAX(CASE WHEN {quality_flags.has_value_sql(metric)} THEN DMY END), "
+        f"{quality_flags.count_values_sql(metric)}"
+        for metric in quality_flags.METRICS
+    )
+    row = conn.execute(f"""
+        SELECT {columns}
+        FROM weather_data
+        WHERE location = ?
+          AND DMY IS NOT NULL AND DMY != ''
+    """, (station_id,)).fetchone()
+    return [
+        (metric, *row[i * 3:i * 3 + 3])
+        for i, metric in enumerate(quality_flags.METRICS)
+        if row[i * 3 + 2]
+    ]
+
+
+def get_station_catalog(form_data):
+    """
+    JSON endpoint: per metric date range and record count of one station, for
+    date-picker bounds and form validation
+    """
+    try:
+        station_id = int(pyhtml.form_value(form_data, "station"))
+    except ValueError:
+        raise pyhtml.EndpointError(400, "A numeric station is required")
+
+    conn = db_utils.connect()
+    try:
+        if has_catalog(conn):
+            rows = conn.execute(f"""
+                SELECT metric, first_date, last_date, valid_records
+                FROM {CATALOG_TABLE}
+                WHERE location = ?
+            """, (station_id,)).fetchall()
+        else:
+            rows = get_station_ranges(conn, station_id)
+    finally:
+        conn.close()
+    rows.sort(key=lambda row: quality_flags.METRICS.index(row[0]))
+
+    return "application/json", serializer.dumps({
+        "station": station_id,
+        "metrics": {
+            metric: {"first_date": first, "last_date": last, "valid_records": count}
+            for metric, first, last, count in rows
+        },
+    })
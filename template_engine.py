@@ -0,0 +1,188 @@
+"""
+Small compiled HTML template engine
+
+Templates are parsed and compiled to a Python generator function once (at import,
+where the page module defines them), then rendered by appending to a list:
+
+    ROWS = Template('''<tbody>{% for row in rows %}
+        <tr><td>{{ row["name"] }}</td><td>{{ format(row["value"], ".2f") }}</td></tr>{% endfor %}
+    </tbody>''')
+    html = ROWS.render(rows=rows)
+
+Syntax:
+    {{ expr }}                       any Python expression, inserted with str()
+    {% if expr %} {% elif expr %} {% else %} {% endif %}
+    {% for target in expr %} {% endfor %}
+    {% flush %}                      chunk boundary for Template.stream()
+    {# comment #}
+
+Text outside tags is copied exactly, so a template can reproduce an f-string
+byte for byte. Values are not HTML-escaped automatically (the pages never did);
+`escape` is available to templates for untrusted text.
+"""
+import ast
+import builtins
+import html
+import re
+
+_TOKEN_RE = re.compile(r"({{.*?}}|{%.*?%}|{#.*?#})", re.DOTALL)
+
+# Names every template can use without passing them in
+DEFAULT_NAMESPACE = {"escape": html.escape}
+
+
+class TemplateSyntaxError(ValueError):
+    pass
+
+
+class Undefined:
+    """Stands in for a variable the caller didn't pass: falsy, but an error to output or use"""
+    def __init__(self, template, name):
+        self._template = template
+        self._name = name
+
+    def _fail(self, *args):
+        raise NameError(f"{self._template}: template variable {self._name!r} was not passed in")
+
+    def __bool__(self):
+        return False
+
+    __str__ = __format__ = __iter__ = __len__ = __getitem__ = __getattr__ = __call__ = _fail
+
+
+def _names(node):
+    """(names read, names bound) anywhere in an AST node"""
+    loads, stores = set(), set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Name):
+            (loads if isinstance(child.ctx, ast.Load) else stores).add(child.id)
+        elif isinstance(child, ast.arg):
+            stores.add(child.arg)
+    return loads, stores
+
+
+class Template:
+    """A template compiled to a generator function; render() joins its output"""
+    def __init__(self, source, name="<template>"):
+        self.name = name
+        self.source = source
+        self._render = self._compile(source)
+
+    def render(self, context=None, **kwargs):
+        return "".join(self._render(self._context(context, kwargs)))
+
+    def stream(self, context=None, **kwargs):
+        """Yield the output in chunks, one per {% flush %} section"""
+        return self._render(self._context(context, kwargs))
+
+    @staticmethod
+    def _context(context, kwargs):
+        if context is None:
+            return kwargs
+        if kwargs:
+            return {**context, **kwargs}
+        return context
+
+    def _error(self, message, position):
+        line = self.source.count("\n", 0, position) + 1
+        return TemplateSyntaxError(f"{self.name}, line {line}: {message}")
+
+    def _parse_expression(self, text, position):
+        try:
+            return ast.parse(text.strip(), mode="eval")
+        except SyntaxError as e:
+            raise self._error(f"invalid expression {text.strip()!r} ({e.msg})", position)
+
+    def _compile(self, source):
+        lines = []
+        depth = 1
+        stack = []  # (tag, position) of the open blocks
+        loads, stores = set(), set()
+
+        def emit(code):
+            lines.append("    " * depth + code)
+
+        def expression(text, position):
+            tree = self._parse_expression(text, position)
+            names = _names(tree)
+            loads.update(names[0])
+            stores.update(names[1])
+            return text.strip()
+
+        position = 0
+        for token in _TOKEN_RE.split(source):
+            start = position
+            position += len(token)
+            if not token:
+                continue
+            if token.startswith("{#"):
+                continue
+            if token.startswith("{{"):
+                emit(f"_t_append(_t_str({expression(token[2:-2], start)}))")
+                continue
+            if not token.startswith("{%"):
+                emit(f"_t_append({token!r})")
+                continue
+
+            statement = token[2:-2].strip()
+            keyword = statement.split(None, 1)[0] if statement else ""
+            if keyword == "if":
+                emit(f"if {expression(statement[2:], start)}:")
+                stack.append(("if", start))
+                depth += 1
+                emit("pass")
+            elif keyword in ("elif", "else"):
+                if not stack or stack[-1][0] != "if":
+                    raise self._error(f"{{% {keyword} %}} outside {{% if %}}", start)
+                depth -= 1
+                if keyword == "elif":
+                    emit(f"elif {expression(statement[4:], start)}:")
+                else:
+                    emit("else:")
+                depth += 1
+                emit("pass")
+            elif keyword == "for":
+                try:
+                    loop = ast.parse(f"{statement}: pass").body[0]
+                except SyntaxError as e:
+                    raise self._error(f"invalid loop {statement!r} ({e.msg})", start)
+                if not isinstance(loop, ast.For):
+                    raise self._error(f"invalid loop {statement!r}", start)
+                target_loads, target_stores = _names(loop.target)
+                stores.update(target_stores)
+                emit(f"for {ast.unparse(loop.target)} in {expression(ast.unparse(loop.iter), start)}:")
+                stack.append(("for", start))
+                depth += 1
+                emit("pass")
+            elif keyword in ("endif", "endfor"):
+                if not stack or stack[-1][0] != keyword[3:]:
+                    raise self._error(f"unexpected {{% {keyword} %}}", start)
+                stack.pop()
+                depth -= 1
+            elif keyword == "flush":
+                emit("if _t_out:")
+                emit("    yield ''.join(_t_out)")
+                emit("    _t_out.clear()")
+            else:
+                raise self._error(f"unknown tag {statement!r}", start)
+
+        if stack:
+            tag, start = stack[-1]
+            raise self._error(f"{{% {tag} %}} is never closed", start)
+
+        # Free names come from the context (or DEFAULT_NAMESPACE, or builtins)
+        prologue = ["    _t_out = []", "    _t_append = _t_out.append"]
+        for name in sorted(loads - stores):
+            if name in DEFAULT_NAMESPACE or hasattr(builtins, name):
+                prologue.append(f"    {name} = _t_ctx.get({name!r}, _t_defaults[{name!r}])")
+            else:
+                prologue.append(f"    {name} = _t_ctx[{name!r}] if {name!r} in _t_ctx else _t_undefined({name!r})")
+        code = "\n".join(
+            ["def _t_render(_t_ctx):"] + prologue + lines + ["    if _t_out:", "        yield ''.join(_t_out)"]
+        )
+
+        defaults = {name: getattr(builtins, name) for name in dir(builtins)}
+        defaults.update(DEFAULT_NAMESPACE)
+        namespace = {"_t_str": str, "_t_defaults": defaults, "_t_undefined": lambda name: Undefined(self.name, name)}
+        exec(compile(code, self.name, "exec"), namespace)
+        return namespace["_t_render"]
@@ -0,0 +1,188 @@
+import base64
+import sys
+from array import array
+from datetime import datetime
+
+DEFAULT_MAX_POINTS = 1000
+MIN_POINTS = 3
+
+def get_max_points(form_data, default=DEFAULT_MAX_POINTS):
+    """Read the requested chart point budget from form data (0 disables downsampling)"""
+    value = form_data.get("max_points", default) if form_data else default
+    if isinstance(value, list):
+        value = value[0] if value else default
+    try:
+        max_points = int(value)
+    except (TypeError, ValueError):
+        return default
+    if max_points <= 0:
+        return 0
+    return max(max_points, MIN_POINTS)
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling of a date ordered series
+    Points are {"date", "value"} dicts; the point position is used as the x axis
+    """
+    n = len(points)
+    if threshold <= 0 or n <= threshold or threshold < MIN_POINTS:
+        return list(points)
+
+    sampled = [points[0]]
+    bucket_size = (n - 2) / (threshold - 2)
+    a = 0
+
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        next_count = next_end - next_start
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(points[j]["value"] for j in range(next_start, next_end)) / next_count
+
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        a_x = a
+        a_y = points[a]["value"]
+
+        max_area = -1
+        max_index = start
+        for j in range(start, end):
+            area = abs((a_x - avg_x) * (points[j]["value"] - a_y) -
+                       (a_x - j) * (avg_y - a_y))
+            if area > max_area:
+                max_area = area
+                max_index = j
+
+        sampled.append(points[max_index])
+        a = max_index
+
+    sampled.append(points[-1])
+    return sampled
+
+def minmax_downsample(points, threshold):
+    """Keep the minimum and maximum point of each bucket, preserving peaks and troughs"""
+    n = len(points)
+    if threshold <= 0 or n <= threshold or threshold < MIN_POINTS:
+        return list(points)
+
+    num_buckets = max(threshold // 2, 1)
+    bucket_size = n / num_buckets
+    sampled = []
+
+    for i in range(num_buckets):
+        start = int(i * bucket_size)
+        end = min(int((i + 1) * bucket_size), n)
+        if start >= end:
+            continue
+        min_index = max_index = start
+        for j in range(start + 1, end):
+            value = points[j]["value"]
+            if value < points[min_index]["value"]:
+                min_index = j
+            if value > points[max_index]["value"]:
+                max_index = j
+        for j in sorted({min_index, max_index}):
+            sampled.append(points[j])
+
+    return sampled
+
+DOWNSAMPLE_METHODS = {
+    "lttb": lttb,
+    "minmax": minmax_downsample,
+}
+
+def downsample(points, max_points=DEFAULT_MAX_POINTS, method="lttb"):
+    """Reduce a timeseries to at most max_points points before it is JSON encoded"""
+    if not max_points or len(points) <= max_points:
+        return points
+    # Blank or text readings cannot be plotted, so they are not worth a slot in the budget
+    points = [p for p in points if isinstance(p["value"], (int, float))]
+    downsampler = DOWNSAMPLE_METHODS.get(method, lttb)
+    return downsampler(points, max_points)
+
+def downsample_for_form(points, form_data):
+    """Downsample using the max_points / downsample options submitted with the form"""
+    method = form_data.get("downsample", "lttb") if form_data else "lttb"
+    if isinstance(method, list):
+        method = method[0] if method else "lttb"
+    return downsample(points, get_max_points(form_data), method)
+
+TIMESERIES_FORMATS = ("points", "columns", "float32")
+
+def get_timeseries_format(form_data):
+    """Read the requested timeseries encoding from form data, defaulting to per-point dicts"""
+    fmt = form_data.get("format", "points") if form_data else "points"
+    if isinstance(fmt, list):
+        fmt = fmt[0] if fmt else "points"
+    return fmt if fmt in TIMESERIES_FORMATS else "points"
+
+def get_regular_step(dates):
+    """Return the constant day step between ISO dates, or None if the series is irregular"""
+    if len(dates) < 2:
+        return 1
+    try:
+        ordinals = [datetime.strptime(d, "%Y-%m-%d").toordinal() for d in dates]
+    except (TypeError, ValueError):
+        return None
+    step = ordinals[1] - ordinals[0]
+    if step <= 0:
+        return None
+    for i in range(2, len(ordinals)):
+        if ordinals[i] - ordinals[i - 1] != step:
+            return None
+    return step
+
+def _float_or_nan(value):
+    # None and non-numeric cells (importer-loaded rows store missing values as '') become NaN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+def pack_float32(values):
+    """Pack values as little-endian Float32 and base64 them (readable with a JS Float32Array)"""
+    packed = array("f", (_float_or_nan(v) for v in values))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+def unpack_float32(encoded):
+    """Inverse of pack_float32"""
+    packed = array("f")
+    packed.frombytes(base64.b64decode(encoded))
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tolist()
+
+def encode_timeseries(points, fmt="points"):
+    """
+    Encode a list of {"date", "value"} points for the JSON response
+    - points: the original list of dicts
+    - columns: parallel "dates" and "values" arrays
+    - float32: start date and day step (or "dates" if irregular) plus base64 packed values
+    """
+    if fmt == "columns":
+        return {
+            "dates": [p["date"] for p in points],
+            "values": [p["value"] for p in points]
+        }
+    if fmt == "float32":
+        dates = [p["date"] for p in points]
+        encoded = {
+            "encoding": "float32-le-base64",
+            "count": len(points),
+            "values": pack_float32(p["value"] for p in points)
+        }
+        step = get_regular_step(dates)
+        if step is not None and dates:
+            encoded["start"] = dates[0]
+            encoded["step_days"] = step
+        else:
+            encoded["dates"] = dates
+        return encoded
+    return points
+
+def encode_timeseries_for_form(points, form_data):
+    """Encode a timeseries using the format option submitted with the form"""
+    return encode_timeseries(points, get_timeseries_format(form_data))